@@ -0,0 +1,520 @@
+"""
+Многопроцессный режим: процесс приема обновлений и процессы-воркеры
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import zlib
+from collections import deque
+from functools import partial
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+import aiohttp
+
+from .config import setup_logging
+from .webhook import WebhookServer
+
+# Поля обновления, в которых нет чата, но есть пользователь
+_USER_FIELDS = ('from', 'user', 'voter_chat')
+
+# Освобождение очереди чата текущим обновлением (устанавливает ClusterWorker)
+_chat_release_var: contextvars.ContextVar[Optional[Callable[[], None]]] = contextvars.ContextVar(
+    'chat_release', default=None
+)
+
+
+def release_chat():
+    """
+    Обработчик дальше только ждет (например, ответа ИИ) и не зависит от
+    порядка обновлений: следующие обновления этого чата воркер может
+    обрабатывать, не дожидаясь его завершения. Вне кластера ничего не делает.
+    """
+    release = _chat_release_var.get()
+    if release:
+        release()
+
+
+def update_chat_id(update: Dict[str, Any]) -> int:
+    """
+    Ключ маршрутизации обновления: ID чата.
+
+    Для обновлений без чата (inline-запросы, ответы в опросах) - ID
+    пользователя; в личных чатах он совпадает с ID чата, поэтому все
+    обновления пользователя попадают в один воркер.
+    """
+    for body in update.values():
+        if not isinstance(body, dict):
+            continue
+        chat = body.get('chat') or (body.get('message') or {}).get('chat')
+        if chat:
+            return chat['id']
+        for field in _USER_FIELDS:
+            if body.get(field):
+                return body[field]['id']
+    return 0
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    """Номер воркера для чата (не зависит от PYTHONHASHSEED и перезапусков)"""
+    return zlib.crc32(str(chat_id).encode()) % workers
+
+
+def run_worker(config_path: str, index: int, inbox, events, log_queue, concurrency: int,
+               setup: Optional[Callable[[Any], None]] = None):
+    """Точка входа процесса-воркера"""
+    # Сигналы остановки получает вся группа процессов (Ctrl+C, systemd);
+    # воркеры останавливает процесс приема, дождавшись обработки очередей
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    from .main import RepairBot
+    app = RepairBot(config_path, worker_index=index, log_queue=log_queue)
+    if setup:
+        setup(app)
+    asyncio.run(ClusterWorker(app, index, inbox, events, concurrency).run())
+
+
+class ClusterWorker:
+    """
+    Воркер кластера: обработка обновлений своих чатов роутерами RepairBot.
+
+    Обновления одного чата обрабатываются строго по очереди, разных чатов -
+    параллельно (не больше concurrency одновременно). Обработчик, который
+    только ждет долгую операцию, вызывает release_chat(): тогда следующее
+    обновление чата (например, выход в меню, отменяющий консультацию ИИ)
+    не ждет его завершения. Изменения, после которых
+    кэши других воркеров устаревают, публикуются через процесс приема.
+    """
+
+    def __init__(self, app, index: int, inbox, events, concurrency: int = 16):
+        self.app = app
+        self.index = index
+        self.inbox = inbox
+        self.events = events
+        self.processed = 0
+
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._chats: Dict[int, Deque[Dict[str, Any]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._stopping = asyncio.Event()
+
+        # События других воркеров
+        self._handlers: Dict[str, Callable[..., None]] = {
+            'order_reserved': partial(app.scheduler.reserve, broadcast=False),
+            'order_status': app.scheduler.on_order_status_changed,
+            'user_changed': app.db_queries.user_cache.pop,
+            'notifications': app.notifications.wake,
+        }
+
+    # === СОБЫТИЯ ===
+
+    def publish(self, name: str, *args):
+        """Событие для остальных воркеров"""
+        self.events.put((self.index, 'event', (name, args)))
+
+    def _order_status_changed(self, order_ids: List[int], status: str):
+        self.app.scheduler.on_order_status_changed(order_ids, status)
+        self.publish('order_status', order_ids, status)
+
+    def _notifications_enqueued(self):
+        # Уведомления доставляет воркер с фоновыми задачами
+        if self.app.runs_background_jobs:
+            self.app.notifications.wake()
+        else:
+            self.publish('notifications')
+
+    def _install_hooks(self):
+        db_queries = self.app.db_queries
+        db_queries.on_order_status_changed = self._order_status_changed
+        db_queries.on_notifications_enqueued = self._notifications_enqueued
+        db_queries.on_user_changed = partial(self.publish, 'user_changed')
+        self.app.scheduler.on_reserved = partial(self.publish, 'order_reserved')
+
+    # === ОБРАБОТКА ===
+
+    def _read_inbox(self, loop: asyncio.AbstractEventLoop):
+        """Поток чтения очереди воркера (get блокирующий)"""
+        parent = multiprocessing.parent_process()
+        while True:
+            try:
+                item = self.inbox.get(timeout=1.0)
+            except queue.Empty:
+                # Процесс приема аварийно завершился - останавливаемся сами
+                if parent is None or parent.is_alive():
+                    continue
+                logging.error(f"Воркер {self.index}: процесс приема завершился")
+                item = None
+            loop.call_soon_threadsafe(self._on_item, item)
+            if item is None:
+                return
+
+    def _on_item(self, item):
+        if item is None:
+            self._stopping.set()
+            return
+
+        kind, payload = item
+        if kind == 'updates':
+            for update in payload:
+                self._submit(update)
+        elif kind == 'event':
+            name, args = payload
+            try:
+                self._handlers[name](*args)
+            except Exception as e:
+                logging.error(f"Ошибка применения события {name}: {e}")
+
+    def _submit(self, update: Dict[str, Any]):
+        chat_id = update_chat_id(update)
+        pending = self._chats.get(chat_id)
+        if pending is not None:
+            # Чат уже обрабатывается - обновление встанет за предыдущими
+            pending.append(update)
+            return
+
+        self._chats[chat_id] = deque([update])
+        task = asyncio.create_task(self._drain_chat(chat_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain_chat(self, chat_id: int):
+        pending = self._chats[chat_id]
+        loop = asyncio.get_running_loop()
+        try:
+            while pending:
+                update = pending.popleft()
+                released = loop.create_future()
+                async with self._semaphore:
+                    task = asyncio.create_task(self._process_update(update, released))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+                    # Обработка завершилась или обработчик освободил очередь чата
+                    await released
+        finally:
+            del self._chats[chat_id]
+
+    async def _process_update(self, update: Dict[str, Any], released: asyncio.Future):
+        def release():
+            if not released.done():
+                released.set_result(None)
+
+        _chat_release_var.set(release)
+        try:
+            await self.app.dp.feed_raw_update(self.app.bot, update)
+        except Exception as e:
+            logging.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+        finally:
+            self.processed += 1
+            release()
+
+    async def run(self):
+        """Запуск бота, обработка очереди до сигнала остановки и остановка"""
+        await self.app.on_startup()
+        self._install_hooks()
+
+        reader = threading.Thread(
+            target=self._read_inbox, args=(asyncio.get_running_loop(),),
+            name=f"cluster-inbox-{self.index}", daemon=True
+        )
+        reader.start()
+        self.events.put((self.index, 'ready', None))
+        logging.info(f"Воркер {self.index} запущен")
+
+        try:
+            await self._stopping.wait()
+            # Дообрабатываем все принятые обновления
+            while self._tasks:
+                await asyncio.wait(set(self._tasks))
+            self.events.put((self.index, 'drained', self.processed))
+        finally:
+            await self.app.on_shutdown()
+
+
+class ClusterWebhookServer(WebhookServer):
+    """Webhook процесса приема: обновление сразу уходит в очередь воркера"""
+
+    def __init__(self, ingress: "ClusterIngress", **kwargs):
+        super().__init__(ingress.app.bot, ingress.app.dp, **kwargs)
+        self.ingress = ingress
+
+    def submit(self, update: Dict[str, Any]) -> bool:
+        return self.ingress.try_dispatch([update])
+
+
+class ClusterIngress:
+    """
+    Процесс приема обновлений (CLUSTER_WORKERS > 0).
+
+    Получает обновления через long polling или webhook и раскладывает их по
+    CLUSTER_WORKERS процессам-воркерам по хэшу chat_id. Все обновления чата
+    попадают в один воркер в порядке получения, поэтому состояние диалога
+    (FSM) и кэш пользователя чата живут в одном процессе. Изменения общих
+    данных (занятость мастеров, профили, очередь уведомлений) воркеры
+    публикуют, а процесс приема пересылает их остальным воркерам.
+
+    Сам процесс не разбирает обновления в модели aiogram и не выполняет
+    обработчики: разбор JSON, построение моделей и клавиатур - в воркерах.
+    """
+
+    def __init__(self, app, worker_setup: Optional[Callable[[Any], None]] = None):
+        self.app = app
+        self.config = app.config
+        self.workers = self.config.cluster_workers
+        self.worker_setup = worker_setup
+        self.processed: Dict[int, int] = {}
+
+        self._ctx = multiprocessing.get_context('spawn')
+        self.inboxes = [self._ctx.Queue(self.config.cluster_queue_size) for _ in range(self.workers)]
+        self.events = self._ctx.Queue()
+        self.log_queue = self._ctx.Queue()
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * self.workers
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._router: Optional[threading.Thread] = None
+        self._supervisor: Optional[asyncio.Task] = None
+        self._ready: Set[int] = set()
+        self._all_ready = asyncio.Event()
+        self._stopping = False
+
+    # === ВОРКЕРЫ ===
+
+    def _spawn(self, index: int):
+        process = self._ctx.Process(
+            target=run_worker,
+            args=(self.app.config_path, index, self.inboxes[index], self.events, self.log_queue,
+                  self.config.cluster_worker_concurrency, self.worker_setup),
+            name=f"worker-{index}",
+            daemon=True
+        )
+        process.start()
+        self._processes[index] = process
+
+    def _route_events(self):
+        """Поток пересылки событий воркеров (get блокирующий)"""
+        while True:
+            item = self.events.get()
+            if item is None:
+                return
+
+            index, kind, payload = item
+            if kind == 'event':
+                for other, inbox in enumerate(self.inboxes):
+                    if other != index:
+                        inbox.put(('event', payload))
+            else:
+                self._loop.call_soon_threadsafe(self._on_worker_state, index, kind, payload)
+
+    def _on_worker_state(self, index: int, kind: str, payload: Any):
+        if kind == 'ready':
+            self._ready.add(index)
+            if len(self._ready) == self.workers:
+                self._all_ready.set()
+        elif kind == 'drained':
+            self.processed[index] = payload
+
+    async def _supervise(self, interval: float = 1.0):
+        """Перезапуск упавших воркеров (их очередь сохраняется)"""
+        while not self._stopping:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self._processes):
+                if self._stopping or process.is_alive():
+                    continue
+                logging.error(f"Воркер {index} завершился с кодом {process.exitcode}, перезапуск")
+                self._spawn(index)
+
+    async def start(self, ready_timeout: float = 60.0):
+        """Подготовка БД, запуск воркеров и ожидание их готовности"""
+        self._loop = asyncio.get_running_loop()
+
+        # Дальше записи всех процессов пишет этот процесс
+        self.app.logger = setup_logging(self.config, log_queue=self.log_queue)
+
+        # Миграции и тестовые данные - один раз, до запуска воркеров
+        await self.app.db_manager.init_database()
+        if self.config.db_seed_data:
+            await self.app.db_manager.populate_test_data()
+
+        self._router = threading.Thread(target=self._route_events, name="cluster-events", daemon=True)
+        self._router.start()
+        for index in range(self.workers):
+            self._spawn(index)
+
+        deadline = self._loop.time() + ready_timeout
+        while not self._all_ready.is_set():
+            failed = [index for index, process in enumerate(self._processes)
+                      if index not in self._ready and not process.is_alive()]
+            if failed or self._loop.time() > deadline:
+                raise RuntimeError(f"Воркеры не запустились: {failed or 'таймаут'}")
+            try:
+                await asyncio.wait_for(self._all_ready.wait(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+
+        self._supervisor = asyncio.create_task(self._supervise())
+        logging.info(f"🧩 Кластер запущен: воркеров {self.workers}")
+
+    async def drain(self, timeout: float = 30.0) -> Dict[int, int]:
+        """Остановка приема: воркеры дообрабатывают очереди; число обработанных по воркерам"""
+        self._stopping = True
+        for index, inbox in enumerate(self.inboxes):
+            if self._processes[index] is not None:
+                await asyncio.to_thread(inbox.put, None)
+
+        deadline = self._loop.time() + timeout
+        while any(index not in self.processed and process is not None and process.is_alive()
+                  for index, process in enumerate(self._processes)):
+            if self._loop.time() > deadline:
+                logging.warning("Не все воркеры дообработали очереди")
+                break
+            await asyncio.sleep(0.05)
+        return dict(self.processed)
+
+    async def stop(self, timeout: float = 15.0):
+        """Остановка воркеров и пересылки событий"""
+        if not self._stopping:
+            await self.drain()
+
+        if self._supervisor:
+            self._supervisor.cancel()
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                logging.warning(f"Воркер {index} не остановился, завершаем принудительно")
+                process.terminate()
+
+        if self._router:
+            self.events.put(None)
+            await asyncio.to_thread(self._router.join, 5.0)
+        await self.app.bot.session.close()
+        logging.info("🧩 Кластер остановлен")
+
+    # === РАСПРЕДЕЛЕНИЕ ===
+
+    def _batches(self, updates: List[Dict[str, Any]]) -> Dict[int, List[Dict[str, Any]]]:
+        batches: Dict[int, List[Dict[str, Any]]] = {}
+        for update in updates:
+            batches.setdefault(shard_for(update_chat_id(update), self.workers), []).append(update)
+        return batches
+
+    async def dispatch(self, updates: List[Dict[str, Any]], pause: float = 0.01):
+        """Раскладка по воркерам; при заполненной очереди ждет (прием приостанавливается)"""
+        for index, batch in self._batches(updates).items():
+            while True:
+                try:
+                    self.inboxes[index].put_nowait(('updates', batch))
+                    break
+                except queue.Full:
+                    await asyncio.sleep(pause)
+
+    def try_dispatch(self, updates: List[Dict[str, Any]]) -> bool:
+        """Раскладка без ожидания; False - очередь воркера заполнена"""
+        batches = self._batches(updates)
+        if any(self.inboxes[index].full() for index in batches):
+            return False
+        for index, batch in batches.items():
+            self.inboxes[index].put_nowait(('updates', batch))
+        return True
+
+    # === ПРИЕМ ОБНОВЛЕНИЙ ===
+
+    async def _get_updates(self, session: aiohttp.ClientSession, url: str,
+                           params: Dict[str, Any], timeout: int) -> List[Dict[str, Any]]:
+        async with session.post(url, json=params, timeout=aiohttp.ClientTimeout(total=timeout + 10)) as response:
+            data = await response.json(loads=json.loads)
+        if not data.get("ok"):
+            raise RuntimeError(data.get("description"))
+        return data["result"]
+
+    async def _poll(self, stop_event: asyncio.Event, timeout: int = 30):
+        """
+        Long polling без разбора обновлений: JSON из getUpdates целиком
+        передается воркерам. Остановка прерывает только ожидание ответа,
+        полученная пачка всегда раскладывается целиком.
+        """
+        bot = self.app.bot
+        await bot.delete_webhook(drop_pending_updates=False)
+        url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+        session = await bot.session.create_session()
+        allowed_updates = self.app.dp.resolve_used_update_types()
+        offset: Optional[int] = None
+        backoff = 1.0
+        stopped = asyncio.ensure_future(stop_event.wait())
+
+        try:
+            while not stop_event.is_set():
+                params: Dict[str, Any] = {"timeout": timeout, "allowed_updates": allowed_updates}
+                if offset is not None:
+                    params["offset"] = offset
+                request = asyncio.ensure_future(self._get_updates(session, url, params, timeout))
+                await asyncio.wait({request, stopped}, return_when=asyncio.FIRST_COMPLETED)
+                if not request.done():
+                    request.cancel()
+                    break
+
+                try:
+                    updates = request.result()
+                    backoff = 1.0
+                except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError, ValueError) as e:
+                    logging.error(f"Ошибка получения обновлений: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+                    continue
+
+                if updates:
+                    await self.dispatch(updates)
+                    offset = updates[-1]["update_id"] + 1
+        finally:
+            stopped.cancel()
+            # Подтверждаем переданные воркерам обновления, чтобы не получить их повторно
+            if offset is not None:
+                try:
+                    await self._get_updates(session, url, {"offset": offset, "limit": 1, "timeout": 0}, 0)
+                except Exception as e:
+                    logging.error(f"Ошибка подтверждения обновлений: {e}")
+
+    async def run(self):
+        """Запуск кластера и прием обновлений до сигнала остановки"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                # Windows: остановка через KeyboardInterrupt
+                pass
+
+        # Роутеры нужны процессу приема только для списка типов обновлений
+        self.app.setup_routers()
+        await self.start()
+        server = None
+        try:
+            if self.config.run_mode == "webhook":
+                server = ClusterWebhookServer(
+                    self,
+                    path=self.config.webhook_path,
+                    host=self.config.webhook_host,
+                    port=self.config.webhook_port,
+                    secret_token=self.config.webhook_secret or None
+                )
+                await server.start()
+                if self.config.webhook_url:
+                    await self.app.bot.set_webhook(
+                        url=self.config.webhook_url,
+                        secret_token=self.config.webhook_secret or None,
+                        allowed_updates=self.app.dp.resolve_used_update_types()
+                    )
+                    logging.info(f"🌐 Webhook зарегистрирован: {self.config.webhook_url}")
+                await stop_event.wait()
+            else:
+                await self._poll(stop_event)
+        finally:
+            if server:
+                await server.stop()
+            await self.stop()
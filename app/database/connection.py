@@ -1,36 +1,158 @@
 """
 Обновленный модуль для работы с базой данных (исправлена миграция)
 """
+import asyncio
 import aiosqlite
 import logging
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Awaitable, Callable, Tuple
 from contextlib import asynccontextmanager
 from functools import wraps
 
+from ..utils.metrics import metrics
+from .profiler import ProfilingConnection, profiler
+
 
 def handle_db_errors(func):
-    """Декоратор для обработки ошибок БД"""
+    """Декоратор для обработки ошибок БД (и учета запросов в метриках и профилировщике)"""
+    query_name = func.__qualname__
+    
     @wraps(func)
     async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        error = False
         try:
             return await func(*args, **kwargs)
         except aiosqlite.Error as e:
+            error = True
             logging.error(f"Ошибка базы данных в {func.__name__}: {e}")
             return None
         except Exception as e:
+            error = True
             logging.error(f"Неожиданная ошибка в {func.__name__}: {e}")
             return None
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.observe_db(query_name, elapsed, error=error)
+            profiler.record_call(query_name, elapsed)
     return wrapper
 
 
+# Настройки, применяемые один раз к каждому соединению пула
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # ~16 МБ кэша страниц
+    "PRAGMA mmap_size=268435456",    # 256 МБ отображения файла в память
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Зарегистрированные пулы соединений по пути к БД
+_connection_pools: Dict[str, "ConnectionPool"] = {}
+
+
+def _normalize_yo_sql(column: str) -> str:
+    """SQL-выражение: текст столбца с «ё» -> «е», как в normalize_text"""
+    return f"REPLACE(REPLACE({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+class ConnectionPool:
+    """Пул долгоживущих соединений с настроенной SQLite"""
+    
+    def __init__(self, db_path: str, size: int = 4):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self._connections: List[aiosqlite.Connection] = []
+        self._queue: Optional[asyncio.Queue] = None
+    
+    @property
+    def is_open(self) -> bool:
+        return self._queue is not None
+    
+    async def open(self):
+        """Открытие соединений и применение настроек"""
+        if self.is_open:
+            return
+        
+        queue = asyncio.Queue(maxsize=self.size)
+        try:
+            for _ in range(self.size):
+                conn = await aiosqlite.connect(self.db_path)
+                conn.row_factory = aiosqlite.Row
+                self._connections.append(conn)
+                for pragma in CONNECTION_PRAGMAS:
+                    await conn.execute(pragma)
+                queue.put_nowait(conn)
+        except Exception:
+            await self._close_connections()
+            raise
+        
+        self._queue = queue
+        logging.info(f"Пул соединений открыт: {self.db_path} ({self.size} соединений)")
+    
+    @asynccontextmanager
+    async def acquire(self):
+        """Получение соединения из пула"""
+        if not self.is_open:
+            raise RuntimeError("Пул соединений закрыт")
+        
+        queue = self._queue
+        conn = await queue.get()
+        try:
+            yield conn
+        finally:
+            # Незавершенная транзакция не должна достаться следующему вызову
+            if conn.in_transaction:
+                try:
+                    await conn.rollback()
+                except Exception as e:
+                    logging.error(f"Ошибка отката транзакции в пуле: {e}")
+            queue.put_nowait(conn)
+    
+    async def close(self, timeout: float = 5.0):
+        """Закрытие пула с ожиданием возврата соединений"""
+        if not self.is_open:
+            return
+        
+        queue = self._queue
+        self._queue = None
+        try:
+            for _ in range(len(self._connections)):
+                await asyncio.wait_for(queue.get(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Не все соединения вернулись в пул до закрытия")
+        
+        await self._close_connections()
+        logging.info(f"Пул соединений закрыт: {self.db_path}")
+    
+    async def _close_connections(self):
+        for conn in self._connections:
+            try:
+                await conn.close()
+            except Exception as e:
+                logging.error(f"Ошибка закрытия соединения: {e}")
+        self._connections = []
+
+
 @asynccontextmanager
 async def get_db_connection(db_path: str = "repair_bot.db"):
     """Контекстный менеджер для безопасной работы с БД"""
+    pool = _connection_pools.get(db_path)
+    if pool and pool.is_open:
+        try:
+            async with pool.acquire() as conn:
+                yield ProfilingConnection(conn) if profiler.explain else conn
+        except Exception as e:
+            logging.error(f"Ошибка соединения с БД: {e}")
+            raise
+        return
+    
     conn = None
     try:
         conn = await aiosqlite.connect(db_path)
         conn.row_factory = aiosqlite.Row  # Для удобного доступа к колонкам
-        yield conn
+        yield ProfilingConnection(conn) if profiler.explain else conn
     except Exception as e:
         logging.error(f"Ошибка соединения с БД: {e}")
         raise
@@ -44,21 +166,131 @@ class DatabaseManager:
     
     def __init__(self, db_path: str = "repair_bot.db"):
         self.db_path = db_path
+        self.pool: Optional[ConnectionPool] = None
+    
+    async def open_pool(self, size: int = 4):
+        """Создание пула соединений для всех запросов к этой БД"""
+        if self.pool and self.pool.is_open:
+            return
+        
+        self.pool = ConnectionPool(self.db_path, size)
+        await self.pool.open()
+        _connection_pools[self.db_path] = self.pool
+    
+    async def close_pool(self):
+        """Закрытие пула соединений"""
+        if not self.pool:
+            return
+        
+        if _connection_pools.get(self.db_path) is self.pool:
+            del _connection_pools[self.db_path]
+        await self.pool.close()
+        self.pool = None
+    
+    def _migrations(self) -> List[Tuple[str, Callable[[aiosqlite.Connection], Awaitable[None]]]]:
+        """
+        Шаги миграции схемы по порядку.
+        
+        Номер шага (с 1) - значение PRAGMA user_version после его выполнения.
+        Новые шаги добавляются только в конец. Первые шаги идемпотентны:
+        БД, созданные до появления версий (user_version = 0), проходят их
+        один раз без изменений данных.
+        """
+        return [
+            ("Базовые таблицы", self._create_base_tables),
+            ("Ответы поддержки", self._migrate_support_table),
+            ("Цена услуги в заказе", self._migrate_order_services_table),
+            ("Длительность заказа", self._migrate_orders_table),
+            ("Индексы", self._create_indexes),
+            ("Один отзыв на заказ", self._create_reviews_unique_index),
+            ("Кэш ответов ИИ", self._create_ai_cache_table),
+            ("Версия каталога", self._create_catalog_version),
+            ("Полнотекстовый поиск услуг", self._create_services_fts),
+            ("Статистика", self._create_stats_tables),
+            ("Очередь уведомлений", self._create_notification_outbox),
+            ("Поиск услуг без учета «ё»", self._migrate_services_fts_yo),
+            ("Состояния диалогов", self._create_fsm_storage_table),
+        ]
+    
+    @property
+    def schema_version(self) -> int:
+        """Версия схемы, которую ожидает код"""
+        return len(self._migrations())
+    
+    @staticmethod
+    async def _read_schema_version(db: aiosqlite.Connection) -> int:
+        cursor = await db.execute("PRAGMA user_version")
+        row = await cursor.fetchone()
+        return row[0] if row else 0
     
     async def init_database(self):
-        """Инициализация базы данных"""
+        """Инициализация базы данных: применение недостающих миграций"""
+        started = time.perf_counter()
         async with get_db_connection(self.db_path) as db:
-            # Сначала создаем таблицы с базовой структурой
-            await self._create_base_tables(db)
+            migrations = self._migrations()
+            version = await self._read_schema_version(db)
             
-            # Затем выполняем миграции для добавления новых полей
-            await self._migrate_support_table(db)
+            # Схема актуальна - одно чтение PRAGMA, без DDL
+            if version < len(migrations):
+                version = await self._apply_migrations(db, migrations)
+            else:
+                if version > len(migrations):
+                    logging.warning(
+                        f"Версия схемы БД ({version}) новее ожидаемой ({len(migrations)}): "
+                        "БД обновлена более новой версией бота"
+                    )
+                
+                # Индекс FTS5 не создался при миграции - пробуем при каждом запуске
+                if not await self._table_exists(db, 'services_fts'):
+                    await db.execute("BEGIN IMMEDIATE")
+                    await self._create_services_fts(db)
+                    await db.commit()
             
-            # Создаем индексы
-            await self._create_indexes(db)
+            # Старые записи активности для статистики не нужны. Сначала чтение по
+            # первичному ключу: удаление с блокировкой записи нужно не чаще раза
+            # в сутки, когда день выходит за 30-дневное окно
+            cursor = await db.execute(
+                "SELECT 1 FROM stats_daily_users WHERE day < DATE('now', '-30 days') LIMIT 1"
+            )
+            if await cursor.fetchone() is not None:
+                await db.execute("DELETE FROM stats_daily_users WHERE day < DATE('now', '-30 days')")
+                await db.commit()
+        
+        logging.info(
+            f"База данных инициализирована: схема версии {version} "
+            f"({(time.perf_counter() - started) * 1000:.1f} мс)"
+        )
+    
+    @staticmethod
+    async def _table_exists(db: aiosqlite.Connection, name: str) -> bool:
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        )
+        return await cursor.fetchone() is not None
+    
+    async def _apply_migrations(self, db: aiosqlite.Connection, migrations) -> int:
+        """Выполнение шагов после текущей версии, каждый шаг - отдельная транзакция"""
+        version = 0
+        for number, (description, step) in enumerate(migrations, 1):
+            # IMMEDIATE - сразу блокировка записи: другой процесс не начнет ту же миграцию
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                version = await self._read_schema_version(db)
+                if version >= number:
+                    await db.rollback()
+                    continue
+                
+                await step(db)
+                await db.execute(f"PRAGMA user_version = {number}")
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                logging.error(f"❌ Ошибка миграции {number} ({description}): {e}")
+                raise
             
-            await db.commit()
-            logging.info("База данных инициализирована")
+            version = number
+            logging.info(f"✅ Миграция {number}: {description}")
+        return version
     
     async def _create_base_tables(self, db: aiosqlite.Connection):
         """Создание базовых таблиц"""
@@ -105,6 +337,7 @@ class DatabaseManager:
                 order_date DATE NOT NULL,
                 order_time TIME NOT NULL,
                 total_cost INTEGER NOT NULL,
+                duration_minutes INTEGER,
                 status TEXT DEFAULT 'pending',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (user_id) REFERENCES users (user_id),
@@ -118,6 +351,7 @@ class DatabaseManager:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 order_id INTEGER NOT NULL,
                 service_id INTEGER NOT NULL,
+                price INTEGER,
                 FOREIGN KEY (order_id) REFERENCES orders (id),
                 FOREIGN KEY (service_id) REFERENCES services (id)
             )
@@ -184,13 +418,49 @@ class DatabaseManager:
             logging.error(f"❌ Ошибка миграции таблицы support_requests: {e}")
             raise
     
+    async def _migrate_order_services_table(self, db: aiosqlite.Connection):
+        """Миграция order_services: цена услуги на момент заказа"""
+        cursor = await db.execute("PRAGMA table_info(order_services)")
+        column_names = [col[1] for col in await cursor.fetchall()]
+        
+        if 'price' not in column_names:
+            # Для старых заказов цена неизвестна и остается NULL
+            await db.execute('ALTER TABLE order_services ADD COLUMN price INTEGER')
+            logging.info("✅ Добавлено поле order_services.price")
+    
+    async def _migrate_orders_table(self, db: aiosqlite.Connection):
+        """Миграция orders: длительность заказа для проверки занятости мастеров"""
+        cursor = await db.execute("PRAGMA table_info(orders)")
+        column_names = [col[1] for col in await cursor.fetchall()]
+        
+        if 'duration_minutes' not in column_names:
+            await db.execute('ALTER TABLE orders ADD COLUMN duration_minutes INTEGER')
+            # Старые заказы: сумма длительностей услуг (без услуг - остается NULL)
+            await db.execute('''
+                UPDATE orders SET duration_minutes = (
+                    SELECT SUM(s.duration_minutes)
+                    FROM order_services os
+                    JOIN services s ON s.id = os.service_id
+                    WHERE os.order_id = orders.id
+                )
+            ''')
+            logging.info("✅ Добавлено поле orders.duration_minutes")
+    
     async def _create_indexes(self, db: aiosqlite.Connection):
         """Создание индексов для производительности"""
         indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id)",
+            # Составные индексы для курсорной пагинации по (created_at, id)
+            "CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders(user_id, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON orders(status, created_at, id)",
+            "CREATE INDEX IF NOT EXISTS idx_orders_created ON orders(created_at, id)",
+            # Покрываются составными индексами выше
+            "DROP INDEX IF EXISTS idx_orders_user_id",
+            "DROP INDEX IF EXISTS idx_orders_status",
             "CREATE INDEX IF NOT EXISTS idx_orders_date ON orders(order_date)",
-            "CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status)",
-            "CREATE INDEX IF NOT EXISTS idx_reviews_user_id ON reviews(user_id)",
+            # Проверка занятости мастера на дату при записи
+            "CREATE INDEX IF NOT EXISTS idx_orders_master_date ON orders(master_id, order_date)",
+            # Завершенные заказы пользователя - кандидаты на отзыв
+            "CREATE INDEX IF NOT EXISTS idx_orders_user_completed ON orders(user_id, created_at, id) WHERE status = 'completed'",
             "CREATE INDEX IF NOT EXISTS idx_reviews_order_id ON reviews(order_id)",
             "CREATE INDEX IF NOT EXISTS idx_order_services_order_id ON order_services(order_id)",
             "CREATE INDEX IF NOT EXISTS idx_order_services_service_id ON order_services(service_id)",
@@ -205,14 +475,327 @@ class DatabaseManager:
             except Exception as e:
                 logging.warning(f"Не удалось создать индекс: {index_sql}, ошибка: {e}")
     
+    async def _create_reviews_unique_index(self, db: aiosqlite.Connection):
+        """Уникальный индекс (user_id, order_id) на отзывах с удалением дублей"""
+        cursor = await db.execute('''
+            DELETE FROM reviews WHERE id NOT IN (
+                SELECT MIN(id) FROM reviews GROUP BY user_id, order_id
+            )
+        ''')
+        if cursor.rowcount:
+            logging.warning(f"Удалено дублирующихся отзывов: {cursor.rowcount}")
+        
+        await db.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_reviews_user_order ON reviews(user_id, order_id)"
+        )
+        # Покрывается уникальным индексом
+        await db.execute("DROP INDEX IF EXISTS idx_reviews_user_id")
+    
+    async def _create_ai_cache_table(self, db: aiosqlite.Connection):
+        """Создание таблицы кэша ответов ИИ"""
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS ai_response_cache (
+                cache_key TEXT PRIMARY KEY,
+                catalog_hash TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        ''')
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ai_cache_last_used ON ai_response_cache(last_used_at)"
+        )
+        
+        # Любое изменение каталога услуг делает сохраненные ответы неактуальными
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_services_{event.lower()}_ai_cache
+                AFTER {event} ON services
+                BEGIN
+                    DELETE FROM ai_response_cache;
+                END
+            ''')
+    
+    async def _create_notification_outbox(self, db: aiosqlite.Connection):
+        """Очередь уведомлений: пишется вместе с изменением данных, доставляется фоновым воркером"""
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS notification_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                order_id INTEGER,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                sent_at REAL
+            )
+        ''')
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON notification_outbox(next_attempt_at, id) "
+            "WHERE status = 'pending'"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_outbox_sent ON notification_outbox(sent_at) WHERE status = 'sent'"
+        )
+    
+    async def _create_fsm_storage_table(self, db: aiosqlite.Connection):
+        """Состояния FSM для SQLiteStorage (раньше создавалась при открытии хранилища)"""
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_storage (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            )
+        ''')
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated ON fsm_storage(updated_at)"
+        )
+    
+    async def _create_catalog_version(self, db: aiosqlite.Connection):
+        """Счетчик изменений каталога услуг и мастеров"""
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL
+            )
+        ''')
+        await db.execute("INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1)")
+        
+        for table in ('services', 'masters'):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                await db.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_catalog_version
+                    AFTER {event} ON {table}
+                    BEGIN
+                        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                    END
+                ''')
+    
+    async def _create_services_fts(self, db: aiosqlite.Connection) -> bool:
+        """
+        Создание FTS5 индекса по названию и описанию услуг.
+        
+        Без FTS5 бот работает (поиск через LIKE), поэтому ошибка не прерывает
+        миграцию: изменения шага откатываются до точки сохранения, а init_database
+        повторяет создание индекса при следующих запусках.
+        """
+        await db.execute("SAVEPOINT services_fts")
+        try:
+            exists = await self._table_exists(db, 'services_fts')
+            
+            # Индексируется нормализованный текст, как у запроса в stem_text:
+            # «ё» заменяется на «е» здесь, регистр приводит токенизатор trigram
+            # (SQL-функция lower() не понимает кириллицу)
+            await db.execute(f'''
+                CREATE VIEW IF NOT EXISTS services_fts_source AS
+                SELECT id, {_normalize_yo_sql('name')} AS name,
+                       {_normalize_yo_sql('description')} AS description
+                FROM services
+            ''')
+            
+            # Триграммы подходят для русского языка: совпадают части слов в любых формах
+            await db.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS services_fts USING fts5(
+                    name, description,
+                    content='services_fts_source', content_rowid='id',
+                    tokenize='trigram'
+                )
+            ''')
+            
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_services_insert_fts AFTER INSERT ON services
+                BEGIN
+                    INSERT INTO services_fts (rowid, name, description)
+                    VALUES (new.id, {_normalize_yo_sql('new.name')}, {_normalize_yo_sql('new.description')});
+                END
+            ''')
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_services_delete_fts AFTER DELETE ON services
+                BEGIN
+                    INSERT INTO services_fts (services_fts, rowid, name, description)
+                    VALUES ('delete', old.id, {_normalize_yo_sql('old.name')}, {_normalize_yo_sql('old.description')});
+                END
+            ''')
+            await db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_services_update_fts AFTER UPDATE ON services
+                BEGIN
+                    INSERT INTO services_fts (services_fts, rowid, name, description)
+                    VALUES ('delete', old.id, {_normalize_yo_sql('old.name')}, {_normalize_yo_sql('old.description')});
+                    INSERT INTO services_fts (rowid, name, description)
+                    VALUES (new.id, {_normalize_yo_sql('new.name')}, {_normalize_yo_sql('new.description')});
+                END
+            ''')
+            
+            if not exists:
+                # Индексируем уже существующие услуги
+                await db.execute("INSERT INTO services_fts (services_fts) VALUES ('rebuild')")
+                logging.info("✅ Создан полнотекстовый индекс услуг")
+        
+        except Exception as e:
+            await db.execute("ROLLBACK TO services_fts")
+            await db.execute("RELEASE services_fts")
+            logging.warning(f"FTS5 недоступен, поиск услуг будет работать через LIKE: {e}")
+            return False
+        
+        await db.execute("RELEASE services_fts")
+        return True
+    
+    async def _migrate_services_fts_yo(self, db: aiosqlite.Connection):
+        """Пересоздание индекса FTS5, построенного по исходному тексту с «ё»"""
+        cursor = await db.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'services_fts'"
+        )
+        row = await cursor.fetchone()
+        if row is None or 'services_fts_source' in row[0]:
+            # Индекса нет (повторит init_database) или он уже нормализованный
+            return
+        
+        for trigger in ("insert", "delete", "update"):
+            await db.execute(f"DROP TRIGGER IF EXISTS trg_services_{trigger}_fts")
+        await db.execute("DROP TABLE services_fts")
+        await self._create_services_fts(db)
+    
+    async def _create_stats_tables(self, db: aiosqlite.Connection):
+        """Таблицы статистики, поддерживаемые триггерами"""
+        cursor = await db.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'stats_counters'"
+        )
+        exists = await cursor.fetchone() is not None
+        
+        # Общие счетчики: users, orders, orders:<статус>, reviews, rating_sum, support_requests
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            ) WITHOUT ROWID
+        ''')
+        # Дневные сводки: new_users, orders, support_requests, active_users
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS stats_daily (
+                day TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, name)
+            ) WITHOUT ROWID
+        ''')
+        # Пользователи, создававшие заказы в этот день
+        await db.execute('''
+            CREATE TABLE IF NOT EXISTS stats_daily_users (
+                day TEXT NOT NULL,
+                user_id INTEGER NOT NULL,
+                PRIMARY KEY (day, user_id)
+            ) WITHOUT ROWID
+        ''')
+        
+        if not exists:
+            await self._backfill_stats(db)
+        
+        def counter(name: str, delta: str) -> str:
+            return (f"INSERT INTO stats_counters (name, value) VALUES ({name}, {delta}) "
+                    f"ON CONFLICT(name) DO UPDATE SET value = value + excluded.value;")
+        
+        def daily(day: str, name: str, delta: str) -> str:
+            return (f"INSERT INTO stats_daily (day, name, value) "
+                    f"VALUES (COALESCE(DATE({day}), DATE('now')), {name}, {delta}) "
+                    f"ON CONFLICT(day, name) DO UPDATE SET value = value + excluded.value;")
+        
+        triggers = {
+            'trg_users_insert_stats': f"""
+                AFTER INSERT ON users BEGIN
+                    {counter("'users'", '1')}
+                    {daily('NEW.created_at', "'new_users'", '1')}
+                END""",
+            'trg_users_delete_stats': f"""
+                AFTER DELETE ON users BEGIN
+                    {counter("'users'", '-1')}
+                END""",
+            'trg_orders_insert_stats': f"""
+                AFTER INSERT ON orders BEGIN
+                    {counter("'orders'", '1')}
+                    {counter("'orders:' || NEW.status", '1')}
+                    {daily('NEW.created_at', "'orders'", '1')}
+                    INSERT OR IGNORE INTO stats_daily_users (day, user_id)
+                    VALUES (COALESCE(DATE(NEW.created_at), DATE('now')), NEW.user_id);
+                END""",
+            'trg_orders_status_stats': f"""
+                AFTER UPDATE OF status ON orders
+                WHEN OLD.status IS NOT NEW.status BEGIN
+                    {counter("'orders:' || OLD.status", '-1')}
+                    {counter("'orders:' || NEW.status", '1')}
+                END""",
+            'trg_orders_delete_stats': f"""
+                AFTER DELETE ON orders BEGIN
+                    {counter("'orders'", '-1')}
+                    {counter("'orders:' || OLD.status", '-1')}
+                    {daily('OLD.created_at', "'orders'", '-1')}
+                END""",
+            'trg_daily_users_insert_stats': f"""
+                AFTER INSERT ON stats_daily_users BEGIN
+                    {daily('NEW.day', "'active_users'", '1')}
+                END""",
+            'trg_reviews_insert_stats': f"""
+                AFTER INSERT ON reviews BEGIN
+                    {counter("'reviews'", '1')}
+                    {counter("'rating_sum'", 'NEW.rating')}
+                END""",
+            'trg_reviews_rating_stats': f"""
+                AFTER UPDATE OF rating ON reviews BEGIN
+                    {counter("'rating_sum'", 'NEW.rating - OLD.rating')}
+                END""",
+            'trg_reviews_delete_stats': f"""
+                AFTER DELETE ON reviews BEGIN
+                    {counter("'reviews'", '-1')}
+                    {counter("'rating_sum'", '-OLD.rating')}
+                END""",
+            'trg_support_insert_stats': f"""
+                AFTER INSERT ON support_requests BEGIN
+                    {counter("'support_requests'", '1')}
+                    {daily('NEW.created_at', "'support_requests'", '1')}
+                END""",
+            'trg_support_delete_stats': f"""
+                AFTER DELETE ON support_requests BEGIN
+                    {counter("'support_requests'", '-1')}
+                    {daily('OLD.created_at', "'support_requests'", '-1')}
+                END""",
+        }
+        for name, body in triggers.items():
+            await db.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    
+    async def _backfill_stats(self, db: aiosqlite.Connection):
+        """Первичный расчет статистики по уже накопленным данным"""
+        await db.execute('''
+            INSERT INTO stats_counters (name, value)
+            SELECT 'users', COUNT(*) FROM users
+            UNION ALL SELECT 'orders', COUNT(*) FROM orders
+            UNION ALL SELECT 'orders:' || status, COUNT(*) FROM orders GROUP BY status
+            UNION ALL SELECT 'reviews', COUNT(*) FROM reviews
+            UNION ALL SELECT 'rating_sum', COALESCE(SUM(rating), 0) FROM reviews
+            UNION ALL SELECT 'support_requests', COUNT(*) FROM support_requests
+        ''')
+        await db.execute('''
+            INSERT INTO stats_daily (day, name, value)
+            SELECT DATE(created_at), 'new_users', COUNT(*) FROM users WHERE created_at IS NOT NULL GROUP BY 1
+            UNION ALL SELECT DATE(created_at), 'orders', COUNT(*) FROM orders WHERE created_at IS NOT NULL GROUP BY 1
+            UNION ALL SELECT DATE(created_at), 'support_requests', COUNT(*) FROM support_requests WHERE created_at IS NOT NULL GROUP BY 1
+            UNION ALL SELECT DATE(created_at), 'active_users', COUNT(DISTINCT user_id) FROM orders WHERE created_at IS NOT NULL GROUP BY 1
+        ''')
+        await db.execute('''
+            INSERT INTO stats_daily_users (day, user_id)
+            SELECT DISTINCT DATE(created_at), user_id FROM orders
+            WHERE DATE(created_at) >= DATE('now', '-30 days')
+        ''')
+        logging.info("✅ Статистика рассчитана по существующим данным")
+    
     async def populate_test_data(self):
         """Заполнение базы данных тестовыми данными"""
         async with get_db_connection(self.db_path) as db:
-            # Проверяем, есть ли уже данные
-            cursor = await db.execute("SELECT COUNT(*) FROM services")
-            count = await cursor.fetchone()
+            # Заполняем только пустую БД
+            cursor = await db.execute("SELECT 1 FROM services LIMIT 1")
             
-            if count[0] == 0:
+            if await cursor.fetchone() is None:
                 await self._populate_services(db)
                 await self._populate_masters(db)
                 await self._populate_test_reviews(db)
@@ -310,21 +893,35 @@ class DatabaseManager:
         )
     
     @handle_db_errors
-    async def check_db_health(self) -> bool:
-        """Проверка состояния базы данных"""
+    async def check_db_health(self, deep: bool = False) -> bool:
+        """
+        Проверка состояния базы данных.
+        
+        Быстрая проверка: БД отвечает и схема не старше ожидаемой. Полная
+        (deep) добавляет PRAGMA quick_check и число записей в таблицах -
+        на больших БД это секунды, поэтому она включается отдельно.
+        """
         async with get_db_connection(self.db_path) as db:
+            version = await self._read_schema_version(db)
+            if version < self.schema_version:
+                logging.error(f"Схема БД версии {version}, ожидается {self.schema_version}")
+                return False
+            
+            if not deep:
+                return True
+            
+            cursor = await db.execute("PRAGMA quick_check")
+            result = (await cursor.fetchone())[0]
+            if result != "ok":
+                logging.error(f"БД не прошла проверку целостности: {result}")
+                return False
+            
             tables = ['users', 'services', 'masters', 'orders', 'reviews', 'support_requests']
             for table in tables:
                 cursor = await db.execute(f"SELECT COUNT(*) FROM {table}")
                 count = await cursor.fetchone()
                 logging.info(f"Таблица {table}: {count[0] if count else 0} записей")
             
-            # Проверяем структуру таблицы support_requests
-            cursor = await db.execute("PRAGMA table_info(support_requests)")
-            columns = await cursor.fetchall()
-            column_names = [col[1] for col in columns]
-            logging.info(f"Колонки в support_requests: {column_names}")
-            
             return True
     
     async def backup_database(self, backup_path: str):
@@ -343,6 +940,7 @@ class DatabaseManager:
         """Сброс базы данных (для отладки)"""
         try:
             import os
+            await self.close_pool()
             if os.path.exists(self.db_path):
                 os.remove(self.db_path)
                 logging.info(f"База данных {self.db_path} удалена")
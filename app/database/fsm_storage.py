@@ -0,0 +1,234 @@
+"""
+Хранилище состояний FSM в SQLite
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional, Set
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from .connection import get_db_connection, handle_db_errors
+
+
+def _json_default(value: Any):
+    """Сериализация типов, которые хендлеры кладут в данные состояния"""
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Тип {type(value).__name__} не сериализуется в JSON")
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    Персистентное хранилище FSM с кэшем записи в памяти.
+
+    Чтения и записи обслуживаются из памяти; измененные ключи накапливаются
+    и сбрасываются в таблицу fsm_storage одной транзакцией раз в flush_interval
+    секунд и при закрытии. Серия update_data/get_data внутри одного обработчика
+    превращается в одну запись на диск. Состояния, не менявшиеся дольше ttl,
+    считаются устаревшими и удаляются.
+
+    Кэш предполагает, что чат обслуживается одним процессом: другой процесс
+    увидит изменения не позже чем через flush_interval.
+    """
+
+    def __init__(self, db_path: str = "repair_bot.db", flush_interval: float = 1.0,
+                 ttl: float = 72 * 3600, idle_timeout: float = 600.0,
+                 cleanup_interval: float = 300.0):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.cleanup_interval = cleanup_interval
+
+        # key -> {'state': str|None, 'data': dict, 'updated_at': float, 'used_at': float}
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._dirty: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+        self.disk_reads = 0
+        self.disk_writes = 0
+
+    @staticmethod
+    def build_key(key: StorageKey) -> str:
+        """Строковый ключ записи"""
+        thread_id = key.thread_id if key.thread_id is not None else ""
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{thread_id}:{key.destiny}"
+
+    # === ЖИЗНЕННЫЙ ЦИКЛ ===
+
+    async def open(self):
+        """Удаление устаревших состояний и запуск фонового сброса"""
+        # Таблицу fsm_storage создают миграции DatabaseManager.init_database
+        await self.cleanup_expired()
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def close(self) -> None:
+        """Остановка фонового сброса и запись оставшихся изменений"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        await self.flush()
+
+    async def _flush_loop(self):
+        last_cleanup = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                if time.monotonic() - last_cleanup >= self.cleanup_interval:
+                    await self.cleanup_expired()
+                    last_cleanup = time.monotonic()
+            except Exception as e:
+                logging.error(f"Ошибка фонового сброса FSM: {e}")
+
+    # === ИНТЕРФЕЙС BaseStorage ===
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get_record(key)
+        record['state'] = state.state if isinstance(state, State) else state
+        self._touch(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._get_record(key)
+        return record['state']
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get_record(key)
+        record['data'] = data.copy()
+        self._touch(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._get_record(key)
+        return record['data'].copy()
+
+    # === КЭШ И ДИСК ===
+
+    async def _get_record(self, key: StorageKey) -> Dict[str, Any]:
+        str_key = self.build_key(key)
+        now = time.time()
+
+        record = self._records.get(str_key)
+        if record is None:
+            record = await self._load(str_key)
+            if record is None:
+                # Ошибка чтения (например, БД заблокирована): пустая запись в кэше
+                # при следующем сбросе затерла бы сессию на диске
+                raise RuntimeError(f"Не удалось прочитать состояние FSM {str_key}")
+            self._records[str_key] = record
+
+        if now - record['updated_at'] > self.ttl and (record['state'] or record['data']):
+            # Сессия устарела: начинаем с чистого состояния
+            record['state'] = None
+            record['data'] = {}
+            record['updated_at'] = now
+            self._dirty.add(str_key)
+
+        record['used_at'] = now
+        return record
+
+    def _touch(self, key: StorageKey, record: Dict[str, Any]):
+        record['updated_at'] = time.time()
+        self._dirty.add(self.build_key(key))
+
+    @handle_db_errors
+    async def _load(self, str_key: str) -> Optional[Dict[str, Any]]:
+        """Чтение записи, отсутствующей в памяти (нет на диске - пустая запись, None - ошибка)"""
+        self.disk_reads += 1
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT state, data, updated_at FROM fsm_storage WHERE key = ?",
+                (str_key,)
+            )
+            row = await cursor.fetchone()
+            if not row:
+                return {'state': None, 'data': {}, 'updated_at': time.time()}
+            return {'state': row[0], 'data': json.loads(row[1]), 'updated_at': row[2]}
+
+    async def flush(self) -> bool:
+        """Сброс накопленных изменений на диск"""
+        async with self._flush_lock:
+            if not self._dirty:
+                return True
+
+            keys = self._dirty
+            self._dirty = set()
+
+            upserts = []
+            deletes = []
+            for str_key in keys:
+                record = self._records.get(str_key)
+                if record is None:
+                    continue
+                if record['state'] is None and not record['data']:
+                    deletes.append((str_key,))
+                else:
+                    upserts.append((
+                        str_key,
+                        record['state'],
+                        json.dumps(record['data'], ensure_ascii=False, default=_json_default),
+                        record['updated_at']
+                    ))
+
+            if await self._write(upserts, deletes):
+                self.disk_writes += 1
+                return True
+
+            # Не удалось записать - повторим при следующем сбросе
+            self._dirty |= keys
+            return False
+
+    @handle_db_errors
+    async def _write(self, upserts: list, deletes: list) -> bool:
+        async with get_db_connection(self.db_path) as db:
+            if upserts:
+                await db.executemany('''
+                    INSERT INTO fsm_storage (key, state, data, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        state = excluded.state,
+                        data = excluded.data,
+                        updated_at = excluded.updated_at
+                ''', upserts)
+            if deletes:
+                await db.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+            await db.commit()
+            return True
+
+    async def cleanup_expired(self) -> int:
+        """Удаление устаревших сессий с диска и давно неиспользуемых записей из памяти"""
+        now = time.time()
+        for str_key in [k for k, record in self._records.items()
+                        if k not in self._dirty and now - record.get('used_at', 0) > self.idle_timeout]:
+            del self._records[str_key]
+
+        deleted = await self._delete_expired(now - self.ttl)
+        if deleted:
+            logging.info(f"Удалено устаревших FSM сессий: {deleted}")
+        return deleted or 0
+
+    @handle_db_errors
+    async def _delete_expired(self, threshold: float) -> int:
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (threshold,))
+            await db.commit()
+            return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Состояние кэша хранилища"""
+        return {
+            'cached_keys': len(self._records),
+            'dirty_keys': len(self._dirty),
+            'disk_reads': self.disk_reads,
+            'disk_writes': self.disk_writes
+        }
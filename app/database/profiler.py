@@ -0,0 +1,239 @@
+"""
+Профилировщик запросов к БД: счетчики на обновление, журнал медленных
+запросов, планы выполнения и бюджеты запросов для обработчиков
+"""
+import contextvars
+import logging
+import re
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import aiosqlite
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+# Операторы, для которых имеет смысл EXPLAIN QUERY PLAN
+_EXPLAINABLE = re.compile(r'^\s*(SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b', re.IGNORECASE)
+# Полный просмотр таблицы: "SCAN orders" без индекса
+_FULL_SCAN = re.compile(r'^SCAN (?!sqlite_master$|sqlite_schema$)(\S+)$')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Обработчик выполнил больше запросов к БД, чем заявлено"""
+
+
+class UpdateQueryStats:
+    """Запросы к БД в рамках одного обновления"""
+    
+    def __init__(self, handler: str):
+        self.handler = handler
+        self.calls: Counter = Counter()
+        self.statements = 0
+        self.seconds = 0.0
+    
+    @property
+    def count(self) -> int:
+        return sum(self.calls.values())
+
+
+# Статистика текущего обновления (None - вне обработки обновления)
+_current_stats: contextvars.ContextVar[Optional[UpdateQueryStats]] = contextvars.ContextVar(
+    "db_query_stats", default=None
+)
+
+
+def query_budget(max_queries: int):
+    """
+    Декоратор обработчика: максимум запросов к БД на одно обновление.
+    
+    Ставится под декоратором роутера:
+        @router.callback_query(...)
+        @query_budget(2)
+        async def handler(...): ...
+    """
+    def decorator(func):
+        func.__query_budget__ = max_queries
+        return func
+    return decorator
+
+
+class QueryProfiler:
+    """Сбор статистики запросов (настраивается из конфигурации при запуске)"""
+    
+    def __init__(self):
+        self.slow_query_ms = 100.0
+        self.explain = False
+        self.default_budget = 0
+        self.strict = False
+        self.reset()
+    
+    def configure(self, slow_query_ms: float = 100.0, explain: bool = False,
+                  default_budget: int = 0, strict: bool = False):
+        self.slow_query_ms = slow_query_ms
+        self.explain = explain
+        self.default_budget = default_budget
+        self.strict = strict
+    
+    def reset(self):
+        """Сброс накопленной статистики"""
+        self.slow_queries = 0
+        self.plans: Dict[str, Dict[str, Any]] = {}
+        self.handler_stats: Dict[str, Dict[str, float]] = {}
+        self.violations: List[str] = []
+    
+    # === ЗАПИСЬ ===
+    
+    def record_call(self, name: str, seconds: float):
+        """Вызов метода с @handle_db_errors"""
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.calls[name] += 1
+            stats.seconds += seconds
+        
+        if seconds * 1000 >= self.slow_query_ms:
+            self.slow_queries += 1
+            handler = f" (обработчик {stats.handler})" if stats is not None else ""
+            logging.warning(f"Медленный запрос к БД: {name} - {seconds * 1000:.1f} мс{handler}")
+    
+    def record_statement(self):
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.statements += 1
+    
+    def needs_plan(self, sql: str) -> bool:
+        return self.explain and sql not in self.plans and bool(_EXPLAINABLE.match(sql))
+    
+    def record_plan(self, sql: str, details: Iterable[str]):
+        """Сохранение плана выполнения и поиск полных просмотров таблиц"""
+        details = list(details)
+        full_scans = [match.group(1) for match in map(_FULL_SCAN.match, details) if match]
+        self.plans[sql] = {'plan': details, 'full_scans': full_scans}
+        
+        if full_scans:
+            logging.warning(
+                f"Полный просмотр таблиц {', '.join(full_scans)} в запросе: {' '.join(sql.split())[:200]}"
+            )
+    
+    # === ОБНОВЛЕНИЯ ===
+    
+    def start_update(self, handler: str) -> contextvars.Token:
+        return _current_stats.set(UpdateQueryStats(handler))
+    
+    def finish_update(self, token: contextvars.Token, budget: Optional[int] = None) -> UpdateQueryStats:
+        """Итоги обновления; при превышении бюджета - предупреждение или исключение"""
+        stats = _current_stats.get()
+        _current_stats.reset(token)
+        
+        handler_stats = self.handler_stats.setdefault(
+            stats.handler, {'updates': 0, 'queries': 0, 'max_queries': 0, 'seconds': 0.0}
+        )
+        handler_stats['updates'] += 1
+        handler_stats['queries'] += stats.count
+        handler_stats['max_queries'] = max(handler_stats['max_queries'], stats.count)
+        handler_stats['seconds'] += stats.seconds
+        
+        if budget is None:
+            budget = self.default_budget
+        if budget and stats.count > budget:
+            calls = ", ".join(f"{name} x{count}" for name, count in stats.calls.most_common())
+            message = f"{stats.handler}: {stats.count} запросов к БД при бюджете {budget} ({calls})"
+            self.violations.append(message)
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logging.warning(f"Превышен бюджет запросов: {message}")
+        
+        return stats
+    
+    def full_scan_statements(self) -> Dict[str, List[str]]:
+        """Запросы с полным просмотром таблиц"""
+        return {sql: info['full_scans'] for sql, info in self.plans.items() if info['full_scans']}
+
+
+# Профилировщик процесса (используется handle_db_errors и get_db_connection)
+profiler = QueryProfiler()
+
+
+class ProfilingConnection:
+    """
+    Обертка соединения, которая перед первым выполнением каждого
+    оператора сохраняет его EXPLAIN QUERY PLAN.
+    """
+    
+    def __init__(self, conn: aiosqlite.Connection, query_profiler: QueryProfiler = profiler):
+        self._conn = conn
+        self._profiler = query_profiler
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+    
+    async def _explain(self, sql: str, parameters: Any):
+        self._profiler.record_statement()
+        if not self._profiler.needs_plan(sql):
+            return
+        
+        try:
+            cursor = await self._conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters or ())
+            rows = await cursor.fetchall()
+            await cursor.close()
+            self._profiler.record_plan(sql, (row[3] for row in rows))
+        except aiosqlite.Error as e:
+            # План строится не для всех операторов (например, с несовпадающими параметрами)
+            logging.debug(f"Не удалось получить план запроса: {e}")
+            self._profiler.plans[sql] = {'plan': [], 'full_scans': []}
+    
+    def execute(self, sql: str, parameters: Any = None) -> "_ProfiledResult":
+        return _ProfiledResult(self, sql, parameters, lambda: self._conn.execute(sql, parameters))
+    
+    def executemany(self, sql: str, parameters: Any) -> "_ProfiledResult":
+        parameters = list(parameters)
+        first = parameters[0] if parameters else None
+        return _ProfiledResult(self, sql, first, lambda: self._conn.executemany(sql, parameters))
+
+
+class _ProfiledResult:
+    """Аналог aiosqlite Result: поддерживает await и async with"""
+    
+    def __init__(self, connection: ProfilingConnection, sql: str, parameters: Any,
+                 run: Callable[[], Awaitable[aiosqlite.Cursor]]):
+        self._connection = connection
+        self._sql = sql
+        self._parameters = parameters
+        self._run = run
+        self._cursor: Optional[aiosqlite.Cursor] = None
+    
+    async def _execute(self) -> aiosqlite.Cursor:
+        await self._connection._explain(self._sql, self._parameters)
+        self._cursor = await self._run()
+        return self._cursor
+    
+    def __await__(self):
+        return self._execute().__await__()
+    
+    async def __aenter__(self) -> aiosqlite.Cursor:
+        return await self._execute()
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self._cursor is not None:
+            await self._cursor.close()
+
+
+class QueryProfilerMiddleware(BaseMiddleware):
+    """
+    Inner middleware: считает запросы к БД за обновление (включая
+    внедрение зависимостей) и проверяет бюджет обработчика.
+    """
+    
+    def __init__(self, query_profiler: QueryProfiler = profiler):
+        self.profiler = query_profiler
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        callback = handler_object.callback if handler_object is not None else None
+        name = getattr(callback, '__name__', 'unknown')
+        
+        token = self.profiler.start_update(name)
+        try:
+            return await handler(event, data)
+        finally:
+            self.profiler.finish_update(token, getattr(callback, '__query_budget__', None))
@@ -2,28 +2,67 @@
 Обновленный модуль для выполнения запросов к базе данных
 """
 import logging
-from typing import Optional, List, Dict, Any, Tuple
+import time
+import aiosqlite
+from typing import Callable, Optional, List, Dict, Any, Tuple
 from .connection import get_db_connection, handle_db_errors
+from ..utils.cache import TTLCache
+from ..utils.text import normalize_text, stem_text
+from ..utils.constants import (
+    ACTIVE_ORDER_STATUSES, DEFAULT_ORDER_DURATION_MINUTES, ORDER_STATUS_NOTIFICATIONS
+)
+
+# Маркер отсутствия записи в кэше (None означает «пользователь не зарегистрирован»)
+_NOT_CACHED = object()
 
 
 class DatabaseQueries:
     """Класс для выполнения запросов к базе данных"""
     
-    def __init__(self, db_path: str = "repair_bot.db"):
+    def __init__(self, db_path: str = "repair_bot.db", user_cache_size: int = 10000,
+                 user_cache_ttl: float = 600.0, user_negative_ttl: float = 30.0):
         self.db_path = db_path
+        # Кэш пользователей: записи обновляются при create_user/update_user_field
+        self.user_cache = TTLCache(max_size=user_cache_size, ttl=user_cache_ttl)
+        self.user_negative_ttl = user_negative_ttl
+        # Вызывается после записи уведомлений в очередь (будит воркер доставки)
+        self.on_notifications_enqueued: Optional[Callable[[], None]] = None
+        # Вызывается после смены статуса заказов: (ID измененных заказов, новый статус)
+        self.on_order_status_changed: Optional[Callable[[List[int], str], None]] = None
+        # Вызывается после создания или изменения пользователя (ID пользователя)
+        self.on_user_changed: Optional[Callable[[int], None]] = None
     
     # === ПОЛЬЗОВАТЕЛИ ===
     
-    @handle_db_errors
     async def get_user(self, user_id: int) -> Optional[Dict[str, Any]]:
-        """Получение пользователя по ID"""
+        """Получение пользователя по ID (через кэш)"""
+        cached = self.user_cache.get(user_id, _NOT_CACHED)
+        if cached is not _NOT_CACHED:
+            return dict(cached) if cached else None
+        
+        result = await self._load_user(user_id)
+        if result is None:
+            # Ошибка БД - ничего не кэшируем
+            return None
+        
+        user = result[0]
+        if user:
+            self.user_cache.set(user_id, user)
+        else:
+            # Незарегистрированных кэшируем ненадолго: регистрация перезапишет запись
+            self.user_cache.set(user_id, None, ttl=self.user_negative_ttl)
+        return dict(user) if user else None
+    
+    @handle_db_errors
+    async def _load_user(self, user_id: int) -> Optional[Tuple[Optional[Dict[str, Any]]]]:
+        """Загрузка пользователя из БД (None только при ошибке)"""
         async with get_db_connection(self.db_path) as db:
             cursor = await db.execute(
                 "SELECT user_id, name, phone, address, created_at FROM users WHERE user_id = ?", 
                 (user_id,)
             )
             row = await cursor.fetchone()
-            return dict(row) if row else None
+            return (dict(row) if row else None,)
     
     @handle_db_errors
     async def create_user(self, user_id: int, name: str, phone: str, address: str) -> bool:
@@ -33,13 +72,21 @@ class DatabaseQueries:
             cursor = await db.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,))
             if await cursor.fetchone():
                 logging.warning(f"Попытка создать существующего пользователя {user_id}")
+                self.user_cache.pop(user_id)
                 return False
             
-            await db.execute(
-                "INSERT INTO users (user_id, name, phone, address) VALUES (?, ?, ?, ?)",
+            cursor = await db.execute(
+                "INSERT INTO users (user_id, name, phone, address) VALUES (?, ?, ?, ?) "
+                "RETURNING user_id, name, phone, address, created_at",
                 (user_id, name, phone, address)
             )
+            row = await cursor.fetchone()
             await db.commit()
+            
+            # Запись в кэш заменяет возможную отрицательную запись
+            self.user_cache.set(user_id, dict(row))
+            if self.on_user_changed:
+                self.on_user_changed(user_id)
             logging.info(f"Создан новый пользователь {user_id}")
             return True
     
@@ -57,6 +104,14 @@ class DatabaseQueries:
                 (value, user_id)
             )
             await db.commit()
+            
+            cached = self.user_cache.get(user_id)
+            if cached:
+                self.user_cache.set(user_id, dict(cached, **{field: value}))
+            else:
+                self.user_cache.pop(user_id)
+            if self.on_user_changed:
+                self.on_user_changed(user_id)
             logging.info(f"Обновлено поле {field} для пользователя {user_id}")
             return True
     
@@ -93,6 +148,53 @@ class DatabaseQueries:
             row = await cursor.fetchone()
             return dict(row) if row else None
     
+    @handle_db_errors
+    async def search_services(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Полнотекстовый поиск услуг с ранжированием bm25.
+        
+        В каждой записи есть поле total_found - общее число найденных услуг.
+        """
+        # Триграммный индекс ищет основы слов длиной от 3 символов
+        stems = [stem for stem in stem_text(query) if len(stem) >= 3]
+        if not stems:
+            return []
+        
+        async with get_db_connection(self.db_path) as db:
+            match_query = " AND ".join('"' + stem.replace('"', '""') + '"' for stem in stems)
+            try:
+                cursor = await db.execute('''
+                    WITH matches AS MATERIALIZED (
+                        SELECT rowid AS service_id, bm25(services_fts, 10.0, 1.0) AS score
+                        FROM services_fts
+                        WHERE services_fts MATCH ?
+                    )
+                    SELECT s.id, s.name, s.price, s.duration_minutes, s.description, s.image_url,
+                           (SELECT COUNT(*) FROM matches) AS total_found
+                    FROM matches
+                    JOIN services s ON s.id = matches.service_id
+                    ORDER BY matches.score
+                    LIMIT ?
+                ''', (match_query, limit))
+            except aiosqlite.OperationalError as e:
+                # Сборка SQLite без FTS5 - ищем подстроки. LIKE не учитывает регистр
+                # только для латиницы, поэтому сравниваем нормализованный текст
+                # (нижний регистр, «ё» -> «е») в Python: каталог услуг небольшой
+                logging.warning(f"Поиск по FTS5 недоступен: {e}")
+                cursor = await db.execute(
+                    "SELECT id, name, price, duration_minutes, description, image_url FROM services ORDER BY id"
+                )
+                found = [
+                    dict(row) for row in await cursor.fetchall()
+                    if all(stem in normalize_text(f"{row['name']} {row['description'] or ''}") for stem in stems)
+                ]
+                for service in found:
+                    service['total_found'] = len(found)
+                return found[:limit]
+            
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+    
     # === МАСТЕРА ===
     
     @handle_db_errors
@@ -130,72 +232,182 @@ class DatabaseQueries:
     
     @handle_db_errors
     async def create_order(self, user_id: int, master_id: int, address: str, 
-                          order_date: str, order_time: str, total_cost: int, 
+                          order_date: str, order_time: str, total_cost: Optional[int], 
                           service_ids: List[int]) -> Optional[int]:
-        """Создание заказа с транзакцией"""
+        """
+        Создание заказа с транзакцией
+        
+        Все услуги проверяются одним запросом IN (...), позиции заказа вставляются
+        через executemany вместе с ценами услуг на момент заказа. Если total_cost
+        не передан, он считается по зафиксированным ценам.
+        """
+        result = await self._insert_order(user_id, [master_id], address, order_date, order_time,
+                                          total_cost, service_ids, check_schedule=False)
+        return result['order_id']
+    
+    @handle_db_errors
+    async def create_order_in_slot(self, user_id: int, master_ids: List[int], address: str,
+                                   order_date: str, order_time: str, total_cost: Optional[int],
+                                   service_ids: List[int]) -> Optional[Dict[str, Any]]:
+        """
+        Создание заказа с проверкой занятости мастеров в той же транзакции
+        
+        master_ids - кандидаты в порядке предпочтения: заказ получает первый,
+        у которого нет активного заказа, пересекающегося с новым по времени.
+        Блокировка записи (BEGIN IMMEDIATE) не дает двум записям занять одно время.
+        
+        Returns:
+            {'order_id', 'master_id', 'duration_minutes'}; order_id = None, если все заняты
+        """
+        if not master_ids:
+            raise ValueError("Нет мастеров для записи")
+        return await self._insert_order(user_id, master_ids, address, order_date, order_time,
+                                        total_cost, service_ids, check_schedule=True)
+    
+    async def _insert_order(self, user_id: int, master_ids: List[int], address: str,
+                            order_date: str, order_time: str, total_cost: Optional[int],
+                            service_ids: List[int], check_schedule: bool) -> Dict[str, Any]:
+        unique_ids = list(dict.fromkeys(service_ids))
+        if not unique_ids:
+            raise ValueError("Не выбрано ни одной услуги")
+        
         async with get_db_connection(self.db_path) as db:
-            async with db.execute("BEGIN TRANSACTION"):
-                try:
-                    # Создаем заказ
-                    cursor = await db.execute("""
-                        INSERT INTO orders (user_id, master_id, address, order_date, order_time, total_cost)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    """, (user_id, master_id, address, order_date, order_time, total_cost))
-                    
-                    order_id = cursor.lastrowid
-                    
-                    # Добавляем услуги к заказу
-                    for service_id in service_ids:
-                        # Проверяем существование услуги
-                        service_check = await db.execute(
-                            "SELECT id FROM services WHERE id = ?", (service_id,)
-                        )
-                        if not await service_check.fetchone():
-                            raise ValueError(f"Услуга с ID {service_id} не существует")
-                        
-                        await db.execute(
-                            "INSERT INTO order_services (order_id, service_id) VALUES (?, ?)",
-                            (order_id, service_id)
-                        )
-                    
-                    await db.commit()
-                    logging.info(f"Создан заказ {order_id} для пользователя {user_id}")
-                    return order_id
-                    
-                except Exception as e:
-                    await db.rollback()
-                    logging.error(f"Ошибка создания заказа: {e}")
-                    raise
-    
-    @handle_db_errors
-    async def get_user_orders(self, user_id: int, limit: int = 20, offset: int = 0) -> List[Dict[str, Any]]:
+            # Сразу берем блокировку записи, чтобы цены и расписание не изменились до конца транзакции
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ", ".join("?" * len(unique_ids))
+                cursor = await db.execute(
+                    f"SELECT id, price, duration_minutes FROM services WHERE id IN ({placeholders})", unique_ids
+                )
+                services = {row[0]: (row[1], row[2]) for row in await cursor.fetchall()}
+                
+                missing = [service_id for service_id in unique_ids if service_id not in services]
+                if missing:
+                    raise ValueError(f"Услуги с ID {missing} не существуют")
+                
+                if total_cost is None:
+                    total_cost = sum(services[service_id][0] for service_id in service_ids)
+                duration = sum(services[service_id][1] or 0 for service_id in service_ids) or DEFAULT_ORDER_DURATION_MINUTES
+                
+                master_id = master_ids[0]
+                if check_schedule:
+                    master_id = await self._first_free_master(db, master_ids, order_date, order_time, duration)
+                    if master_id is None:
+                        await db.rollback()
+                        logging.info(f"Все мастера заняты {order_date} в {order_time}")
+                        return {'order_id': None, 'master_id': None, 'duration_minutes': duration}
+                
+                cursor = await db.execute("""
+                    INSERT INTO orders (user_id, master_id, address, order_date, order_time, total_cost, duration_minutes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (user_id, master_id, address, order_date, order_time, total_cost, duration))
+                order_id = cursor.lastrowid
+                
+                await db.executemany(
+                    "INSERT INTO order_services (order_id, service_id, price) VALUES (?, ?, ?)",
+                    [(order_id, service_id, services[service_id][0]) for service_id in service_ids]
+                )
+                
+                await db.commit()
+                logging.info(f"Создан заказ {order_id} для пользователя {user_id}")
+                return {'order_id': order_id, 'master_id': master_id, 'duration_minutes': duration}
+            
+            except Exception as e:
+                await db.rollback()
+                logging.error(f"Ошибка создания заказа: {e}")
+                raise
+    
+    @staticmethod
+    async def _first_free_master(db: aiosqlite.Connection, master_ids: List[int], order_date: str,
+                                 order_time: str, duration: int) -> Optional[int]:
+        """Первый кандидат без активных заказов, пересекающихся с [order_time, order_time + duration)"""
+        hours, minutes = order_time.split(':')
+        start = int(hours) * 60 + int(minutes)
+        
+        master_placeholders = ", ".join("?" * len(master_ids))
+        status_placeholders = ", ".join("?" * len(ACTIVE_ORDER_STATUSES))
+        cursor = await db.execute(f"""
+            SELECT DISTINCT master_id FROM (
+                SELECT master_id,
+                       CAST(substr(order_time, 1, 2) AS INTEGER) * 60
+                           + CAST(substr(order_time, 4, 2) AS INTEGER) AS start_minute,
+                       COALESCE(duration_minutes, ?) AS duration
+                FROM orders
+                WHERE master_id IN ({master_placeholders}) AND order_date = ?
+                  AND status IN ({status_placeholders})
+            )
+            WHERE start_minute < ? AND start_minute + duration > ?
+        """, (DEFAULT_ORDER_DURATION_MINUTES, *master_ids, order_date, *ACTIVE_ORDER_STATUSES,
+              start + duration, start))
+        busy = {row[0] for row in await cursor.fetchall()}
+        return next((master_id for master_id in master_ids if master_id not in busy), None)
+    
+    @staticmethod
+    def _keyset_clause(after_id: Optional[int], before_id: Optional[int]) -> Tuple[str, list, str]:
+        """
+        Условие курсорной пагинации по (created_at, id)
+        
+        Курсор - ID заказа, от которого отсчитывается страница. Возвращает
+        условие WHERE, его параметры и направление сортировки внутри страницы.
+        """
+        if after_id is not None:
+            return ("AND (o.created_at, o.id) < (SELECT created_at, id FROM orders WHERE id = ?)",
+                    [after_id], "DESC")
+        if before_id is not None:
+            return ("AND (o.created_at, o.id) > (SELECT created_at, id FROM orders WHERE id = ?)",
+                    [before_id], "ASC")
+        return "", [], "DESC"
+    
+    @handle_db_errors
+    async def get_user_orders(self, user_id: int, limit: int = 20,
+                              after_id: Optional[int] = None,
+                              before_id: Optional[int] = None) -> List[Dict[str, Any]]:
         """
-        Получение заказов пользователя с поддержкой пагинации
+        Получение заказов пользователя с курсорной пагинацией
         
         Args:
             user_id: ID пользователя
             limit: Количество заказов для получения
-            offset: Смещение для пагинации
+            after_id: Вернуть заказы старше заказа с этим ID (следующая страница)
+            before_id: Вернуть заказы новее заказа с этим ID (предыдущая страница)
+        
+        Заказы всегда возвращаются от новых к старым.
         """
+        cursor_clause, cursor_params, direction = self._keyset_clause(after_id, before_id)
+        
         async with get_db_connection(self.db_path) as db:
-            cursor = await db.execute("""
+            # Сначала выбираем ID страницы по индексу, затем собираем услуги только для нее
+            cursor = await db.execute(f"""
+                WITH page AS (
+                    SELECT o.id FROM orders o
+                    WHERE o.user_id = ? {cursor_clause}
+                    ORDER BY o.created_at {direction}, o.id {direction}
+                    LIMIT ?
+                )
                 SELECT 
                     o.id, o.order_date, o.order_time, o.total_cost, o.status,
                     m.name as master_name,
                     COALESCE(GROUP_CONCAT(s.name, ', '), 'Услуги не указаны') as services
-                FROM orders o
+                FROM page
+                JOIN orders o ON o.id = page.id
                 JOIN masters m ON o.master_id = m.id
                 LEFT JOIN order_services os ON o.id = os.order_id
                 LEFT JOIN services s ON os.service_id = s.id
-                WHERE o.user_id = ?
-                GROUP BY o.id, o.order_date, o.order_time, o.total_cost, o.status, m.name
-                ORDER BY o.created_at DESC
-                LIMIT ? OFFSET ?
-            """, (user_id, limit, offset))
+                GROUP BY o.id
+                ORDER BY o.created_at DESC, o.id DESC
+            """, (user_id, *cursor_params, limit))
             
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
     
+    @handle_db_errors
+    async def count_user_orders(self, user_id: int) -> int:
+        """Количество заказов пользователя (по индексу)"""
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM orders WHERE user_id = ?", (user_id,))
+            result = await cursor.fetchone()
+            return result[0] if result else 0
+    
     @handle_db_errors
     async def get_order_by_id(self, order_id: int) -> Optional[Dict[str, Any]]:
         """Получение заказа по ID"""
@@ -218,96 +430,143 @@ class DatabaseQueries:
             return dict(row) if row else None
     
     @handle_db_errors
-    async def update_order_status(self, order_id: int, status: str) -> bool:
-        """Обновление статуса заказа"""
+    async def update_order_status(self, order_id: int, status: str, notify: bool = False) -> bool:
+        """Обновление статуса заказа (notify - уведомить клиента через очередь)"""
         allowed_statuses = ['pending', 'confirmed', 'in_progress', 'completed', 'cancelled']
         if status not in allowed_statuses:
             logging.error(f"Недопустимый статус заказа: {status}")
             return False
         
         async with get_db_connection(self.db_path) as db:
-            await db.execute(
-                "UPDATE orders SET status = ? WHERE id = ?", 
-                (status, order_id)
+            cursor = await db.execute(
+                "UPDATE orders SET status = ? WHERE id = ? AND status != ? RETURNING id, user_id", 
+                (status, order_id, status)
             )
+            changed = await cursor.fetchall()
+            if notify:
+                await self._enqueue_status_notifications(db, changed, status)
             await db.commit()
             logging.info(f"Статус заказа {order_id} изменен на {status}")
-            return True
+        
+        self._notifications_enqueued(notify and changed, status)
+        self._order_status_changed(changed, status)
+        return True
     
     # === АДМИНСКИЕ МЕТОДЫ ДЛЯ ЗАКАЗОВ ===
     
     @handle_db_errors
-    async def get_all_orders(self, limit: int = 50, offset: int = 0, status_filter: str = None) -> List[Dict[str, Any]]:
-        """Получение всех заказов для админа"""
+    async def get_all_orders(self, limit: int = 50, status_filter: str = None,
+                             after_id: Optional[int] = None,
+                             before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Получение всех заказов для админа (курсорная пагинация как в get_user_orders)"""
+        cursor_clause, cursor_params, direction = self._keyset_clause(after_id, before_id)
+        
         async with get_db_connection(self.db_path) as db:
-            where_clause = ""
+            where_clause = "WHERE 1 = 1"
             params = []
             
             if status_filter:
-                where_clause = "WHERE o.status = ?"
+                where_clause += " AND o.status = ?"
                 params.append(status_filter)
             
             query = f"""
+                WITH page AS (
+                    SELECT o.id FROM orders o
+                    {where_clause} {cursor_clause}
+                    ORDER BY o.created_at {direction}, o.id {direction}
+                    LIMIT ?
+                )
                 SELECT 
                     o.id, o.user_id, o.order_date, o.order_time, o.total_cost, o.status, o.created_at,
                     u.name as user_name, u.phone as user_phone,
                     m.name as master_name,
                     COALESCE(GROUP_CONCAT(s.name, ', '), 'Услуги не указаны') as services
-                FROM orders o
+                FROM page
+                JOIN orders o ON o.id = page.id
                 JOIN users u ON o.user_id = u.user_id
                 JOIN masters m ON o.master_id = m.id
                 LEFT JOIN order_services os ON o.id = os.order_id
                 LEFT JOIN services s ON os.service_id = s.id
-                {where_clause}
-                GROUP BY o.id, o.user_id, o.order_date, o.order_time, o.total_cost, o.status, o.created_at, u.name, u.phone, m.name
-                ORDER BY o.created_at DESC
-                LIMIT ? OFFSET ?
+                GROUP BY o.id
+                ORDER BY o.created_at DESC, o.id DESC
             """
             
-            params.extend([limit, offset])
+            params.extend(cursor_params)
+            params.append(limit)
             cursor = await db.execute(query, params)
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
     @handle_db_errors
     async def get_orders_count(self, status_filter: str = None) -> int:
-        """Получение общего количества заказов"""
+        """Получение общего количества заказов (из счетчиков статистики)"""
         async with get_db_connection(self.db_path) as db:
-            where_clause = ""
-            params = []
-            
-            if status_filter:
-                where_clause = "WHERE status = ?"
-                params.append(status_filter)
-            
-            query = f"SELECT COUNT(*) FROM orders {where_clause}"
-            cursor = await db.execute(query, params)
+            name = f"orders:{status_filter}" if status_filter else "orders"
+            cursor = await db.execute("SELECT value FROM stats_counters WHERE name = ?", (name,))
             result = await cursor.fetchone()
             return result[0] if result else 0
 
     @handle_db_errors
-    async def bulk_update_orders_status(self, status: str) -> bool:
+    async def bulk_update_orders_status(self, status: str, notify: bool = False) -> bool:
         """Массовое обновление статуса всех заказов"""
         async with get_db_connection(self.db_path) as db:
-            await db.execute("UPDATE orders SET status = ? WHERE status != 'completed'", (status,))
+            cursor = await db.execute(
+                "UPDATE orders SET status = ? WHERE status != 'completed' AND status != ? RETURNING id, user_id",
+                (status, status)
+            )
+            changed = await cursor.fetchall()
+            if notify:
+                await self._enqueue_status_notifications(db, changed, status)
             await db.commit()
-            logging.info(f"Все активные заказы переведены в статус {status}")
-            return True
+            logging.info(f"Все активные заказы переведены в статус {status} ({len(changed)} шт.)")
+        
+        self._notifications_enqueued(notify and changed, status)
+        self._order_status_changed(changed, status)
+        return True
 
     @handle_db_errors
-    async def update_multiple_orders_status(self, order_ids: List[int], status: str) -> bool:
+    async def update_multiple_orders_status(self, order_ids: List[int], status: str,
+                                            notify: bool = False) -> bool:
         """Обновление статуса нескольких заказов"""
         if not order_ids:
             return False
         
         placeholders = ','.join('?' * len(order_ids))
-        query = f"UPDATE orders SET status = ? WHERE id IN ({placeholders})"
+        query = f"UPDATE orders SET status = ? WHERE id IN ({placeholders}) AND status != ? RETURNING id, user_id"
         
         async with get_db_connection(self.db_path) as db:
-            await db.execute(query, [status] + order_ids)
+            cursor = await db.execute(query, [status] + order_ids + [status])
+            changed = await cursor.fetchall()
+            if notify:
+                await self._enqueue_status_notifications(db, changed, status)
             await db.commit()
             logging.info(f"Обновлен статус {len(order_ids)} заказов на {status}")
-            return True
+        
+        self._notifications_enqueued(notify and changed, status)
+        self._order_status_changed(changed, status)
+        return True
+    
+    @staticmethod
+    async def _enqueue_status_notifications(db: aiosqlite.Connection, orders, status: str):
+        """Запись уведомлений о смене статуса в той же транзакции, что и само изменение"""
+        template = ORDER_STATUS_NOTIFICATIONS.get(status)
+        if not template or not orders:
+            return
+        
+        now = time.time()
+        await db.executemany(
+            "INSERT INTO notification_outbox (chat_id, order_id, text, next_attempt_at, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(user_id, order_id, template.format(order_id=order_id), now, now) for order_id, user_id in orders]
+        )
+    
+    def _notifications_enqueued(self, changed, status: str):
+        if changed and status in ORDER_STATUS_NOTIFICATIONS and self.on_notifications_enqueued:
+            self.on_notifications_enqueued()
+    
+    def _order_status_changed(self, changed, status: str):
+        if changed and self.on_order_status_changed:
+            self.on_order_status_changed([row[0] for row in changed], status)
     
     # === ОТЗЫВЫ ===
     
@@ -331,34 +590,66 @@ class DatabaseQueries:
     
     @handle_db_errors
     async def create_review(self, user_id: int, order_id: int, rating: int, comment: str) -> bool:
-        """Создание отзыва"""
+        """Создание отзыва (один запрос: проверка владельца и уникальности внутри INSERT)"""
         async with get_db_connection(self.db_path) as db:
-            # Проверяем, что заказ существует и принадлежит пользователю
-            cursor = await db.execute(
-                "SELECT id FROM orders WHERE id = ? AND user_id = ?", 
-                (order_id, user_id)
-            )
-            if not await cursor.fetchone():
-                logging.error(f"Заказ {order_id} не найден для пользователя {user_id}")
-                return False
+            cursor = await db.execute("""
+                INSERT INTO reviews (user_id, order_id, rating, comment)
+                SELECT user_id, id, ?, ? FROM orders WHERE id = ? AND user_id = ?
+                ON CONFLICT(user_id, order_id) DO NOTHING
+            """, (rating, comment, order_id, user_id))
+            await db.commit()
             
-            # Проверяем, что отзыв еще не создан
-            cursor = await db.execute(
-                "SELECT id FROM reviews WHERE user_id = ? AND order_id = ?",
-                (user_id, order_id)
-            )
-            if await cursor.fetchone():
-                logging.warning(f"Отзыв уже существует для заказа {order_id}")
+            if cursor.rowcount == 0:
+                logging.warning(
+                    f"Отзыв не создан: заказ {order_id} не найден для пользователя {user_id} "
+                    f"или отзыв уже существует"
+                )
                 return False
             
-            await db.execute(
-                "INSERT INTO reviews (user_id, order_id, rating, comment) VALUES (?, ?, ?, ?)",
-                (user_id, order_id, rating, comment)
-            )
-            await db.commit()
             logging.info(f"Создан отзыв для заказа {order_id}")
             return True
     
+    @handle_db_errors
+    async def get_reviewable_orders(self, user_id: int, limit: int = 10,
+                                    after_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Выполненные заказы пользователя без отзыва, от новых к старым
+        
+        Args:
+            user_id: ID пользователя
+            limit: Количество заказов
+            after_id: Курсор - вернуть заказы старше заказа с этим ID
+        """
+        cursor_clause, cursor_params, direction = self._keyset_clause(after_id, None)
+        
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute(f"""
+                SELECT o.id, o.order_date, o.order_time, o.total_cost, o.status,
+                       m.name as master_name
+                FROM orders o
+                JOIN masters m ON o.master_id = m.id
+                WHERE o.user_id = ? AND o.status = 'completed' {cursor_clause}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM reviews r WHERE r.user_id = o.user_id AND r.order_id = o.id
+                  )
+                ORDER BY o.created_at {direction}, o.id {direction}
+                LIMIT ?
+            """, (user_id, *cursor_params, limit))
+            
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+    
+    @handle_db_errors
+    async def get_user_order_counts(self, user_id: int) -> Dict[str, int]:
+        """Общее количество заказов пользователя и количество выполненных"""
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute("""
+                SELECT COUNT(*), COALESCE(SUM(status = 'completed'), 0)
+                FROM orders WHERE user_id = ?
+            """, (user_id,))
+            row = await cursor.fetchone()
+            return {'total': row[0], 'completed': row[1]}
+    
     @handle_db_errors
     async def check_review_exists(self, user_id: int, order_id: int) -> bool:
         """Проверка существования отзыва"""
@@ -481,39 +772,36 @@ class DatabaseQueries:
     
     @handle_db_errors
     async def get_statistics(self) -> Dict[str, Any]:
-        """Получение статистики бота"""
+        """Получение статистики бота из счетчиков и дневных сводок"""
         async with get_db_connection(self.db_path) as db:
-            stats = {}
+            cursor = await db.execute("SELECT name, value FROM stats_counters")
+            counters = {row[0]: row[1] for row in await cursor.fetchall()}
             
-            # Общее количество пользователей
-            cursor = await db.execute("SELECT COUNT(*) FROM users")
-            stats['total_users'] = (await cursor.fetchone())[0]
-            
-            # Количество заказов
-            cursor = await db.execute("SELECT COUNT(*) FROM orders")
-            stats['total_orders'] = (await cursor.fetchone())[0]
-            
-            # Заказы сегодня
-            cursor = await db.execute("""
-                SELECT COUNT(*) FROM orders 
-                WHERE DATE(created_at) = DATE('now')
-            """)
-            stats['orders_today'] = (await cursor.fetchone())[0]
-            
-            # Средний рейтинг
-            cursor = await db.execute("SELECT AVG(rating) FROM reviews")
-            avg_rating = await cursor.fetchone()
-            stats['average_rating'] = round(avg_rating[0], 2) if avg_rating[0] else 0
-            
-            # Количество отзывов
-            cursor = await db.execute("SELECT COUNT(*) FROM reviews")
-            stats['total_reviews'] = (await cursor.fetchone())[0]
+            cursor = await db.execute(
+                "SELECT name, value FROM stats_daily WHERE day = DATE('now')"
+            )
+            today = {row[0]: row[1] for row in await cursor.fetchall()}
             
-            # Обращения в поддержку сегодня
             cursor = await db.execute("""
-                SELECT COUNT(*) FROM support_requests 
-                WHERE DATE(created_at) = DATE('now')
+                SELECT COALESCE(SUM(value), 0) FROM stats_daily
+                WHERE day >= DATE('now', '-6 days') AND name = 'new_users'
             """)
-            stats['support_requests_today'] = (await cursor.fetchone())[0]
-            
-            return stats
\ No newline at end of file
+            new_users_week = (await cursor.fetchone())[0]
+        
+        total_reviews = counters.get('reviews', 0)
+        rating_sum = counters.get('rating_sum', 0)
+        
+        return {
+            'total_users': counters.get('users', 0),
+            'total_orders': counters.get('orders', 0),
+            'orders_today': today.get('orders', 0),
+            'orders_by_status': {
+                name.split(':', 1)[1]: value
+                for name, value in counters.items() if name.startswith('orders:')
+            },
+            'average_rating': round(rating_sum / total_reviews, 2) if total_reviews else 0,
+            'total_reviews': total_reviews,
+            'support_requests_today': today.get('support_requests', 0),
+            'active_users_today': today.get('active_users', 0),
+            'new_users_week': new_users_week
+        }
\ No newline at end of file
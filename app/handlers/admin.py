@@ -2,7 +2,8 @@
 Обработчики админ-панели (обновленная версия)
 """
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime
+from functools import lru_cache
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import Command
@@ -12,11 +13,12 @@ from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
 
 from ..database.queries import DatabaseQueries
 from ..config import BotConfig
+from ..services.backup import BackupService
 from ..keyboards.main_menu import get_main_menu_keyboard
 
 
 # Создаем роутер для админки
-admin_router = Router()
+admin_router = Router(name="admin")
 
 
 # Состояния для ответа на поддержку
@@ -24,6 +26,7 @@ class AdminSupportStates(StatesGroup):
     responding_to_request = State()
 
 
+@lru_cache(maxsize=None)
 def get_admin_main_keyboard() -> InlineKeyboardMarkup:
     """Главная клавиатура админ-панели"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -83,33 +86,13 @@ async def show_admin_statistics(callback: CallbackQuery, db_queries: DatabaseQue
     try:
         stats = await db_queries.get_statistics()
         
-        # Получаем дополнительную статистику по заказам
-        status_counts = {
-            'pending': await db_queries.get_orders_count('pending'),
-            'confirmed': await db_queries.get_orders_count('confirmed'),
-            'in_progress': await db_queries.get_orders_count('in_progress'),
-            'completed': await db_queries.get_orders_count('completed'),
-            'cancelled': await db_queries.get_orders_count('cancelled')
-        }
-        
-        # Получаем активных пользователей за сегодня
-        # Подсчитываем пользователей, которые создали заказы сегодня
-        today_orders = await db_queries.get_all_orders(1000, 0)  # Получаем все заказы
-        active_users_today = len(set(
-            order['user_id'] for order in today_orders 
-            if order['created_at'] and order['created_at'][:10] == datetime.now().strftime('%Y-%m-%d')
-        )) if today_orders else 0
-        
-        # Получаем новых пользователей за неделю
-        week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        # Это требует модификации БД запроса, пока используем приблизительную оценку
-        new_users_week = max(0, stats.get('total_users', 0) // 10)  # Примерная оценка
+        status_counts = stats.get('orders_by_status', {})
         
         text = "📊 **Детальная статистика**\n\n"
         text += f"**Пользователи:**\n"
         text += f"• Всего зарегистрировано: {stats.get('total_users', 0)}\n"
-        text += f"• Активных сегодня: {active_users_today}\n"
-        text += f"• Новых за неделю: {new_users_week}\n\n"
+        text += f"• Активных сегодня: {stats.get('active_users_today', 0)}\n"
+        text += f"• Новых за неделю: {stats.get('new_users_week', 0)}\n\n"
         
         text += f"**Заказы:**\n"
         text += f"• Всего: {stats.get('total_orders', 0)}\n"
@@ -123,9 +106,9 @@ async def show_admin_statistics(callback: CallbackQuery, db_queries: DatabaseQue
             'cancelled': 'Отменены'
         }
         
-        for status, count in status_counts.items():
+        for status, status_name in status_names.items():
+            count = status_counts.get(status, 0)
             if count > 0:
-                status_name = status_names.get(status, status)
                 text += f"• {status_name}: {count}\n"
         
         text += f"\n**Отзывы:**\n"
@@ -274,7 +257,7 @@ async def confirm_complete_all_orders(callback: CallbackQuery, db_queries: Datab
         return
     
     try:
-        success = await db_queries.bulk_update_orders_status('completed')
+        success = await db_queries.bulk_update_orders_status('completed', notify=True)
         
         if success:
             text = "✅ **Массовое завершение выполнено**\n\nВсе активные заказы переведены в статус 'completed'"
@@ -573,42 +556,88 @@ async def show_admin_users(callback: CallbackQuery, db_queries: DatabaseQueries,
         await callback.answer("❌ Ошибка при загрузке пользователей")
 
 
+def format_backup_status(status: dict) -> str:
+    """Текст состояния резервного копирования"""
+    if status['running']:
+        total = status['pages_total']
+        progress = f"{status['pages_done']} из {total} ({status['pages_done'] * 100 // total}%)" if total else "подготовка"
+        text = "⏳ **Идет резервное копирование**\n\n"
+        text += f"Скопировано страниц: {progress}\n"
+        text += f"Начато: {datetime.fromtimestamp(status['started_at']).strftime('%H:%M:%S')}\n"
+        if status['restarts']:
+            text += f"Перезапусков из-за изменений БД: {status['restarts']}\n"
+    elif status['last_error']:
+        text = "❌ **Ошибка создания резервной копии**\n\n"
+        text += f"`{status['last_error']}`\n"
+        text += "Проверьте логи для получения подробностей.\n"
+    elif status['last_backup']:
+        backup = status['last_backup']
+        text = "✅ **Резервная копия создана**\n\n"
+        text += f"Файл: `{backup['path']}`\n"
+        text += f"Размер: {backup['size'] / 1024:.0f} КБ (gzip)\n"
+        text += f"SHA-256: `{backup['sha256'][:16]}…`\n"
+        text += f"Время: {datetime.fromtimestamp(backup['finished_at']).strftime('%d.%m.%Y %H:%M')}\n"
+    else:
+        text = "📥 **Резервное копирование**\n\nВ этом запуске копии еще не создавались.\n"
+    
+    text += f"\nКопий в хранилище: {status['backups']}"
+    # Время обновления - чтобы повторное нажатие всегда меняло сообщение
+    text += f"\nОбновлено: {datetime.now().strftime('%H:%M:%S')}"
+    return text
+
+
+async def show_backup_status(callback: CallbackQuery, backups: BackupService):
+    """Состояние копирования с кнопкой обновления, пока оно идет"""
+    if backups.running:
+        action = InlineKeyboardButton(text="🔄 Обновить", callback_data="admin_backup_status")
+    else:
+        action = InlineKeyboardButton(text="📥 Создать копию", callback_data="admin_backup")
+    
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [action],
+        [InlineKeyboardButton(text="🔙 Админ-панель", callback_data="admin_main")]
+    ])
+    await callback.message.edit_text(format_backup_status(backups.get_status()), reply_markup=keyboard,
+                                     parse_mode='Markdown')
+
+
 @admin_router.callback_query(F.data == "admin_backup")
-async def create_backup(callback: CallbackQuery, config: BotConfig):
-    """Создание резервной копии"""
+async def create_backup(callback: CallbackQuery, config: BotConfig, backups: BackupService):
+    """Запуск резервного копирования в фоне"""
     if not config.is_admin(callback.from_user.id):
         await callback.answer("❌ Доступ запрещен")
         return
     
     try:
-        from ..database.connection import DatabaseManager
-        
-        # Создаем бэкап
-        db_manager = DatabaseManager()
-        backup_path = f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
-        success = await db_manager.backup_database(backup_path)
-        
-        if success:
-            text = f"✅ **Резервная копия создана**\n\n"
-            text += f"Файл: `{backup_path}`\n"
-            text += f"Время: {datetime.now().strftime('%d.%m.%Y %H:%M')}\n"
+        # Копия снимается в фоне - обработчик не ждет ее завершения
+        if backups.trigger():
+            await callback.answer("⏳ Резервное копирование запущено")
         else:
-            text = "❌ **Ошибка создания резервной копии**\n\n"
-            text += "Проверьте логи для получения подробностей."
+            await callback.answer("Резервное копирование уже идет")
         
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="🔄 Создать еще один", callback_data="admin_backup")],
-            [InlineKeyboardButton(text="🔙 Админ-панель", callback_data="admin_main")]
-        ])
-        
-        await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='Markdown')
-        await callback.answer()
+        await show_backup_status(callback, backups)
     
     except Exception as e:
         logging.error(f"Ошибка в create_backup: {e}")
         await callback.answer("❌ Ошибка при создании резервной копии")
 
 
+@admin_router.callback_query(F.data == "admin_backup_status")
+async def backup_status(callback: CallbackQuery, config: BotConfig, backups: BackupService):
+    """Состояние резервного копирования"""
+    if not config.is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ запрещен")
+        return
+    
+    try:
+        await show_backup_status(callback, backups)
+        await callback.answer()
+    
+    except Exception as e:
+        logging.error(f"Ошибка в backup_status: {e}")
+        await callback.answer("❌ Ошибка при получении состояния копирования")
+
+
 @admin_router.callback_query(F.data == "admin_main")
 async def back_to_admin_main(callback: CallbackQuery, db_queries: DatabaseQueries, config: BotConfig):
     """Возврат к главной админ-панели"""
@@ -656,7 +685,7 @@ async def admin_complete_order(message: Message, db_queries: DatabaseQueries, co
             return
         
         order_id = int(command_parts[1])
-        success = await db_queries.update_order_status(order_id, 'completed')
+        success = await db_queries.update_order_status(order_id, 'completed', notify=True)
         
         if success:
             await message.answer(f"✅ Заказ №{order_id} переведен в статус 'completed'")
@@ -688,7 +717,7 @@ async def admin_cancel_order(message: Message, db_queries: DatabaseQueries, conf
             return
         
         order_id = int(command_parts[1])
-        success = await db_queries.update_order_status(order_id, 'cancelled')
+        success = await db_queries.update_order_status(order_id, 'cancelled', notify=True)
         
         if success:
             await message.answer(f"✅ Заказ №{order_id} отменен")
@@ -1,22 +1,30 @@
 """
 Обработчики ИИ консультации
 """
+import asyncio
 import logging
+from typing import Optional
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
+from ..cluster import release_chat
 from ..database.queries import DatabaseQueries
 from ..services.ai_service import AIConsultationService
+from ..services.catalog import ServiceCatalog
+from ..services.scheduler import MasterScheduler
 from ..services.validation_service import ValidationService
 from ..keyboards.main_menu import get_main_menu_keyboard
-from ..keyboards.order_keyboards import get_ai_services_keyboard, get_time_slots_keyboard
+from ..keyboards.order_keyboards import get_ai_services_keyboard
 from ..utils.constants import SECTION_DESCRIPTIONS, ERROR_MESSAGES, SUCCESS_MESSAGES
+from ..utils.streaming import ThrottledMessageEditor
 
 
 # Создаем роутер для ИИ консультации
-ai_router = Router()
+ai_router = Router(name="ai_consultation")
+
+logger = logging.getLogger(__name__)
 
 
 # Состояния ИИ консультации
@@ -36,6 +44,19 @@ async def delete_current_message(message):
         pass
 
 
+async def wait_while_in_state(task: asyncio.Task, state: FSMContext, expected_state: State,
+                              poll_interval: float = 0.5) -> Optional[dict]:
+    """Ожидание задачи; если пользователь покинул состояние, задача отменяется"""
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll_interval)
+        if done:
+            return None if task.cancelled() else task.result()
+        
+        if await state.get_state() != expected_state.state:
+            task.cancel()
+            return None
+
+
 # === ИИ КОНСУЛЬТАЦИЯ ===
 
 @ai_router.message(F.text == "🤖 Консультация ИИ")
@@ -65,8 +86,8 @@ async def start_ai_consultation(message: Message, state: FSMContext, user):
 
 
 @ai_router.message(AIConsultationStates.waiting_for_problem)
-async def process_ai_consultation(message: Message, state: FSMContext, 
-                                db_queries: DatabaseQueries, ai_service: AIConsultationService, is_admin: bool = False):
+async def process_ai_consultation(message: Message, state: FSMContext, catalog: ServiceCatalog,
+                                ai_service: AIConsultationService, is_admin: bool = False):
     """Обработка описания проблемы пользователем"""
     try:
         # Удаляем сообщение пользователя
@@ -83,15 +104,8 @@ async def process_ai_consultation(message: Message, state: FSMContext,
         loading_msg = await message.answer("🤖 Анализирую проблему...")
         
         try:
-            # Получаем все услуги для ИИ анализа
-            all_services = []
-            page = 0
-            while True:
-                services_page = await db_queries.get_services(page, 100)
-                if not services_page:
-                    break
-                all_services.extend(services_page)
-                page += 1
+            # Все услуги для ИИ анализа берем из снимка каталога
+            all_services = catalog.services
             
             if not all_services:
                 await delete_current_message(loading_msg)
@@ -102,12 +116,36 @@ async def process_ai_consultation(message: Message, state: FSMContext,
                 await state.clear()
                 return
             
-            # Обрабатываем консультацию через ИИ сервис
-            result = await ai_service.process_consultation(cleaned_problem, all_services)
+            # Ответ ИИ показываем по мере генерации, редактируя сообщение загрузки
+            editor = None
+            if ai_service.stream_responses:
+                editor = ThrottledMessageEditor(
+                    loading_msg,
+                    interval=ai_service.stream_edit_interval,
+                    prefix="🤖 Консультация ИИ\n\n"
+                )
             
-            await delete_current_message(loading_msg)
+            # Обрабатываем консультацию через ИИ сервис, не блокируя других пользователей
+            task = ai_service.start_consultation(
+                message.from_user.id, cleaned_problem, all_services,
+                on_text=editor.update if editor else None
+            )
+            # Дальше только ожидание: в многопроцессном режиме следующие обновления
+            # чата (выход в меню, новое описание) обрабатываются, не дожидаясь ответа
+            release_chat()
+            try:
+                result = await wait_while_in_state(task, state, AIConsultationStates.waiting_for_problem)
+            finally:
+                if editor:
+                    await editor.close()
+            
+            if result is None:
+                # Пользователь ушел из консультации или отправил новое описание
+                await delete_current_message(loading_msg)
+                return
             
             if not result['success']:
+                await delete_current_message(loading_msg)
                 await message.answer(
                     f"❌ **Ошибка консультации**\n\n{result['error']}\n\n"
                     "Попробуйте описать проблему по-другому или обратитесь в поддержку.",
@@ -153,11 +191,18 @@ async def process_ai_consultation(message: Message, state: FSMContext,
                 text += "\n❓ Не удалось подобрать подходящие услуги для вашей проблемы."
                 keyboard = get_ai_services_keyboard(has_services=False)
             
-            sent_message = await message.answer(text, reply_markup=keyboard, parse_mode='Markdown')
+            # Итоговый текст с разметкой и кнопками заменяет сообщение загрузки
+            try:
+                await loading_msg.edit_text(text, reply_markup=keyboard, parse_mode='Markdown')
+                sent_message = loading_msg
+            except Exception as e:
+                logging.warning(f"Не удалось обновить ответ ИИ, отправляем новым сообщением: {e}")
+                await delete_current_message(loading_msg)
+                sent_message = await message.answer(text, reply_markup=keyboard, parse_mode='Markdown')
             await state.update_data(current_message_id=sent_message.message_id)
             
             # НЕ ОЧИЩАЕМ STATE! Данные нужны для добавления в заказ
-            
+        
         except Exception as e:
             logging.error(f"Ошибка ИИ обработки: {e}")
             
@@ -186,31 +231,28 @@ async def process_ai_consultation(message: Message, state: FSMContext,
 
 
 @ai_router.callback_query(F.data == "add_ai_services")
-async def add_ai_recommended_services(callback: CallbackQuery, state: FSMContext):
+async def add_ai_recommended_services(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                                      scheduler: MasterScheduler):
     """Добавление рекомендованных ИИ услуг в заказ"""
     try:
         data = await state.get_data()
         recommended_services = data.get('recommended_services', [])
         
-        # Подробное логирование для отладки
-        logging.info(f"=== ОТЛАДКА add_ai_services ===")
-        logging.info(f"Все данные state: {data}")
-        logging.info(f"recommended_services из state: {recommended_services}")
-        logging.info(f"Тип recommended_services: {type(recommended_services)}")
+        logger.debug("Добавление услуг ИИ, recommended_services: %s", recommended_services)
         
         if not recommended_services:
             logging.error("❌ recommended_services пустой или None")
             await callback.answer("Ошибка: нет рекомендованных услуг")
             return
         
-        # Сохраняем выбранные услуги как set для совместимости с остальной логикой заказов
-        await state.update_data(selected_services=set(recommended_services))
+        # Сохраняем выбранные услуги списком, как и в остальной логике заказов
+        await state.update_data(selected_services=list(recommended_services))
         
         # Переходим к выбору времени
-        from ..handlers.orders import OrderStates
+        from ..handlers.orders import OrderStates, time_slots_keyboard
         await state.set_state(OrderStates.selecting_time)
         
-        keyboard = get_time_slots_keyboard()
+        keyboard = await time_slots_keyboard(state, catalog, scheduler)
         await callback.message.edit_text(
             f"🕐 **Выбор времени**\n\n"
             f"**Выбранные услуги от ИИ:**\n"
@@ -269,12 +311,21 @@ async def show_ai_settings(callback: CallbackQuery, ai_service: AIConsultationSe
     """Настройки ИИ консультанта (только для админов)"""
     try:
         # Проверка доступности ИИ сервиса
-        is_available = ai_service.check_service_availability()
+        is_available = await ai_service.check_service_availability()
         
         text = "⚙️ **Настройки ИИ консультанта**\n\n"
         text += f"**Статус сервиса:** {'🟢 Доступен' if is_available else '🔴 Недоступен'}\n"
         text += f"**Модель:** Gemini 1.5 Flash\n"
-        text += f"**Резервная логика:** Включена\n\n"
+        text += f"**Резервная логика:** Включена\n"
+        
+        cache_stats = ai_service.get_cache_stats()
+        if cache_stats:
+            text += (
+                f"**Кэш ответов:** {cache_stats['hits']} попаданий / {cache_stats['misses']} промахов "
+                f"({cache_stats['hit_rate']}%)\n"
+                f"**Сэкономлено времени ИИ:** ~{cache_stats['saved_seconds']} сек\n"
+            )
+        text += "\n"
         
         if is_available:
             text += "✅ ИИ консультант работает нормально"
@@ -301,7 +352,7 @@ async def check_ai_status(callback: CallbackQuery, ai_service: AIConsultationSer
     try:
         await callback.answer("Проверяю статус ИИ...")
         
-        is_available = ai_service.check_service_availability()
+        is_available = await ai_service.check_service_availability()
         
         if is_available:
             text = "✅ **Проверка завершена**\n\nИИ сервис работает нормально"
@@ -2,7 +2,6 @@
 Обработчики заказов (исправленная версия)
 """
 import logging
-import random
 from datetime import datetime
 from typing import Set
 from aiogram import Router, F
@@ -11,6 +10,9 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from ..database.queries import DatabaseQueries
+from ..database.profiler import query_budget
+from ..services.catalog import ServiceCatalog
+from ..services.scheduler import MasterScheduler
 from ..services.validation_service import ValidationService
 from ..keyboards.main_menu import get_main_menu_keyboard
 from ..keyboards.order_keyboards import (
@@ -18,12 +20,18 @@ from ..keyboards.order_keyboards import (
     get_address_selection_keyboard, get_order_confirmation_keyboard
 )
 from ..utils.constants import (
-    SECTION_DESCRIPTIONS, SUCCESS_MESSAGES, ERROR_MESSAGES, LIMITS
+    SECTION_DESCRIPTIONS, SUCCESS_MESSAGES, ERROR_MESSAGES, LIMITS, DEFAULT_ORDER_DURATION_MINUTES
 )
 
 
 # Создаем роутер для заказов
-orders_router = Router()
+orders_router = Router(name="orders")
+
+# Отладочные записи горячих обработчиков - на уровне DEBUG (в production отбрасываются до форматирования)
+logger = logging.getLogger(__name__)
+
+# Выбранное время заняли другие клиенты, пока заказ оформлялся
+SLOT_TAKEN_TEXT = "😔 Пока вы оформляли заказ, это время заняли.\n\nВыберите другое время:"
 
 
 # Состояния заказа
@@ -43,10 +51,35 @@ async def delete_current_message(message):
         pass
 
 
+def order_duration(data: dict, catalog: ServiceCatalog) -> int:
+    """Длительность заказа в минутах по выбранным услугам"""
+    _, duration = catalog.calculate_totals(data.get('selected_services', []))
+    return duration or DEFAULT_ORDER_DURATION_MINUTES
+
+
+async def time_slots_keyboard(state: FSMContext, catalog: ServiceCatalog,
+                              scheduler: MasterScheduler) -> InlineKeyboardMarkup:
+    """Клавиатура времени: слоты, на которые есть свободный мастер хотя бы в один из дней записи"""
+    days = scheduler.booking_days()
+    await scheduler.ensure_days(days)  # запрос к БД только при запуске окна и устаревании дня
+    duration = order_duration(await state.get_data(), catalog)
+    return get_time_slots_keyboard(tuple(scheduler.available_slots(days, duration)))
+
+
+async def dates_keyboard(state: FSMContext, catalog: ServiceCatalog,
+                         scheduler: MasterScheduler) -> InlineKeyboardMarkup:
+    """Клавиатура даты: дни, в которые на выбранное время есть свободный мастер"""
+    data = await state.get_data()
+    days = scheduler.booking_days()
+    await scheduler.ensure_days(days)
+    available = scheduler.available_dates(days, data.get('order_time'), order_duration(data, catalog))
+    return get_dates_keyboard(frozenset(available))
+
+
 # === СОЗДАНИЕ ЗАКАЗА ===
 
 @orders_router.message(F.text == "🛠️ Сделать заказ")
-async def start_order_creation(message: Message, state: FSMContext, db_queries: DatabaseQueries, user):
+async def start_order_creation(message: Message, state: FSMContext, catalog: ServiceCatalog, user):
     """Начало создания заказа"""
     if not user:
         await message.answer(
@@ -57,9 +90,8 @@ async def start_order_creation(message: Message, state: FSMContext, db_queries:
     
     try:
         # Получаем услуги
-        services = await db_queries.get_services(0, LIMITS['MAX_SERVICES_PER_PAGE'])
-        total_services = await db_queries.get_services_count()
-        total_pages = (total_services + LIMITS['MAX_SERVICES_PER_PAGE'] - 1) // LIMITS['MAX_SERVICES_PER_PAGE']
+        services = catalog.get_services_page(0)
+        total_pages = catalog.services_total_pages
         
         if not services:
             await message.answer(
@@ -92,7 +124,8 @@ async def start_order_creation(message: Message, state: FSMContext, db_queries:
 
 
 @orders_router.callback_query(F.data.startswith("order_service_"))
-async def handle_service_selection(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+@query_budget(1)
+async def handle_service_selection(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog):
     """Обработка выбора услуг"""
     try:
         callback_parts = callback.data.split("_")
@@ -100,11 +133,11 @@ async def handle_service_selection(callback: CallbackQuery, state: FSMContext, d
         if len(callback_parts) >= 4 and callback_parts[2] == "page":
             # Навигация по страницам
             page = int(callback_parts[3])
-            await handle_services_pagination(callback, state, db_queries, page)
+            await handle_services_pagination(callback, state, catalog, page)
         else:
             # Выбор/отмена услуги
             service_id = int(callback_parts[2])
-            await toggle_service_selection(callback, state, db_queries, service_id)
+            await toggle_service_selection(callback, state, catalog, service_id)
     
     except (ValueError, IndexError) as e:
         logging.error(f"Ошибка в handle_service_selection: {e}")
@@ -114,20 +147,19 @@ async def handle_service_selection(callback: CallbackQuery, state: FSMContext, d
         await callback.answer("Произошла ошибка")
 
 
-async def handle_services_pagination(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries, page: int):
+async def handle_services_pagination(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog, page: int):
     """Обработка пагинации услуг"""
     try:
         data = await state.get_data()
         selected_services = data.get('selected_services', [])
         
-        logging.info(f"=== ПАГИНАЦИЯ НА СТРАНИЦУ {page} ===")
-        logging.info(f"Выбранные услуги в state: {selected_services}")
+        logger.debug("Пагинация на страницу %s, выбранные услуги: %s", page, selected_services)
         
         # Обновляем номер страницы
         await state.update_data(page=page)
         
         # Используем единую функцию обновления страницы
-        await refresh_services_page(callback, state, db_queries)
+        await refresh_services_page(callback, state, catalog)
         await callback.answer()
     
     except Exception as e:
@@ -135,7 +167,7 @@ async def handle_services_pagination(callback: CallbackQuery, state: FSMContext,
         await callback.answer("Ошибка при переходе между страницами")
 
 
-async def refresh_services_page(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+async def refresh_services_page(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog):
     """Принудительное обновление текущей страницы услуг"""
     try:
         data = await state.get_data()
@@ -150,16 +182,12 @@ async def refresh_services_page(callback: CallbackQuery, state: FSMContext, db_q
             # Если это не list, пересохраняем как list
             await state.update_data(selected_services=[])
         
-        logging.info(f"=== ОБНОВЛЕНИЕ СТРАНИЦЫ {page} ===")
-        logging.info(f"State содержит: {data}")
-        logging.info(f"Selected services: {selected_services} (тип: {type(selected_services)})")
-        logging.info(f"Как set: {selected_services_set}")
+        logger.debug("Обновление страницы %s, state: %s", page, data)
         
-        services = await db_queries.get_services(page, LIMITS['MAX_SERVICES_PER_PAGE'])
-        total_services = await db_queries.get_services_count()
-        total_pages = (total_services + LIMITS['MAX_SERVICES_PER_PAGE'] - 1) // LIMITS['MAX_SERVICES_PER_PAGE']
+        services = catalog.get_services_page(page)
+        total_pages = catalog.services_total_pages
         
-        logging.info(f"Загружено {len(services)} услуг для страницы {page}")
+        logger.debug("Загружено %s услуг для страницы %s", len(services), page)
         
         keyboard = get_services_keyboard(services, page, total_pages, selected_services_set, "order_service")
         
@@ -175,7 +203,7 @@ async def refresh_services_page(callback: CallbackQuery, state: FSMContext, db_q
         raise
 
 
-async def toggle_service_selection(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries, service_id: int):
+async def toggle_service_selection(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog, service_id: int):
     """Переключение выбора услуги"""
     try:
         data = await state.get_data()
@@ -190,10 +218,7 @@ async def toggle_service_selection(callback: CallbackQuery, state: FSMContext, d
         else:
             selected_services_set = selected_services.copy()
         
-        logging.info(f"=== ПЕРЕКЛЮЧЕНИЕ УСЛУГИ {service_id} ===")
-        logging.info(f"До изменения - выбранные услуги: {selected_services}")
-        logging.info(f"Тип данных: {type(selected_services)}")
-        logging.info(f"Как set: {selected_services_set}")
+        logger.debug("Переключение услуги %s, выбранные услуги: %s", service_id, selected_services)
         
         # Проверяем лимит услуг
         if service_id not in selected_services_set and len(selected_services_set) >= LIMITS['MAX_SERVICES_PER_ORDER']:
@@ -203,24 +228,17 @@ async def toggle_service_selection(callback: CallbackQuery, state: FSMContext, d
         # Переключаем выбор
         if service_id in selected_services_set:
             selected_services_set.remove(service_id)
-            logging.info(f"✅ Убрана услуга {service_id}")
         else:
             selected_services_set.add(service_id)
-            logging.info(f"✅ Добавлена услуга {service_id}")
         
         # Преобразуем в list для сохранения в state и СРАЗУ сохраняем
         selected_services_list = list(selected_services_set)
         await state.update_data(selected_services=selected_services_list)
         
-        logging.info(f"После изменения - сохранено в state: {selected_services_list}")
-        
-        # Проверяем, что данные действительно сохранились
-        verification_data = await state.get_data()
-        verification_services = verification_data.get('selected_services', [])
-        logging.info(f"Проверка сохранения: {verification_services}")
+        logger.debug("Сохранено в state: %s", selected_services_list)
         
         # Принудительно обновляем страницу
-        await refresh_services_page(callback, state, db_queries)
+        await refresh_services_page(callback, state, catalog)
         await callback.answer()
     
     except Exception as e:
@@ -229,7 +247,8 @@ async def toggle_service_selection(callback: CallbackQuery, state: FSMContext, d
 
 
 @orders_router.callback_query(F.data == "confirm_order")
-async def confirm_services_selection(callback: CallbackQuery, state: FSMContext):
+async def confirm_services_selection(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                                     scheduler: MasterScheduler):
     """Подтверждение выбора услуг и переход к времени"""
     try:
         data = await state.get_data()
@@ -239,7 +258,7 @@ async def confirm_services_selection(callback: CallbackQuery, state: FSMContext)
         if isinstance(selected_services, set):
             selected_services = list(selected_services)
         
-        logging.info(f"Подтверждение услуг: {selected_services}")
+        logger.debug("Подтверждение услуг: %s", selected_services)
         
         if not selected_services:
             await callback.answer("Выберите хотя бы одну услугу!")
@@ -247,7 +266,7 @@ async def confirm_services_selection(callback: CallbackQuery, state: FSMContext)
         
         await state.set_state(OrderStates.selecting_time)
         
-        keyboard = get_time_slots_keyboard()
+        keyboard = await time_slots_keyboard(state, catalog, scheduler)
         await callback.message.edit_text(
             f"{SECTION_DESCRIPTIONS['TIME_SELECTION']}",
             reply_markup=keyboard,
@@ -261,14 +280,15 @@ async def confirm_services_selection(callback: CallbackQuery, state: FSMContext)
 
 
 @orders_router.callback_query(F.data.startswith("time_"))
-async def handle_time_selection(callback: CallbackQuery, state: FSMContext):
+async def handle_time_selection(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                                scheduler: MasterScheduler):
     """Обработка выбора времени"""
     try:
         time = callback.data.split("_")[1]
         await state.update_data(order_time=time)
         await state.set_state(OrderStates.selecting_date)
         
-        keyboard = get_dates_keyboard()
+        keyboard = await dates_keyboard(state, catalog, scheduler)
         await callback.message.edit_text(
             f"{SECTION_DESCRIPTIONS['DATE_SELECTION']}\n\n"
             f"Выбранное время: **{time}**\n"
@@ -284,7 +304,8 @@ async def handle_time_selection(callback: CallbackQuery, state: FSMContext):
 
 
 @orders_router.callback_query(F.data.startswith("date_"))
-async def handle_date_selection(callback: CallbackQuery, state: FSMContext):
+async def handle_date_selection(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                                scheduler: MasterScheduler):
     """Обработка выбора даты"""
     try:
         date = callback.data.split("_")[1]
@@ -298,12 +319,23 @@ async def handle_date_selection(callback: CallbackQuery, state: FSMContext):
             await callback.answer(error_msg)
             return
         
-        await state.update_data(order_date=date)
-        await state.set_state(OrderStates.selecting_address)
-        
         # Форматируем дату для отображения
         formatted_date = datetime_data['date_obj'].strftime('%d.%m.%Y')
         
+        # Проверяем, что на это время есть свободный мастер (его могли занять после показа клавиатуры)
+        duration = order_duration(data, catalog)
+        if not await scheduler.is_slot_free(date, time, duration):
+            free_slots = await scheduler.free_slots(date, duration)
+            if free_slots:
+                text = f"На {formatted_date} в {time} все мастера заняты.\nСвободное время: {', '.join(free_slots)}"
+            else:
+                text = f"На {formatted_date} свободного времени нет, выберите другую дату."
+            await callback.answer(text, show_alert=True)
+            return
+        
+        await state.update_data(order_date=date)
+        await state.set_state(OrderStates.selecting_address)
+        
         keyboard = get_address_selection_keyboard()
         await callback.message.edit_text(
             f"{SECTION_DESCRIPTIONS['ADDRESS_SELECTION']}\n\n"
@@ -321,7 +353,8 @@ async def handle_date_selection(callback: CallbackQuery, state: FSMContext):
 
 
 @orders_router.callback_query(F.data == "address_profile")
-async def use_profile_address(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries, user):
+async def use_profile_address(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                              scheduler: MasterScheduler, user):
     """Использование адреса из профиля"""
     try:
         if not user:
@@ -331,9 +364,14 @@ async def use_profile_address(callback: CallbackQuery, state: FSMContext, db_que
         await state.update_data(order_address=user['address'])
         
         # Назначаем мастера здесь, когда все данные заказа готовы
-        await assign_master_to_order(state, db_queries)
+        if not await assign_master_to_order(state, catalog, scheduler):
+            # Время заняли, пока пользователь выбирал адрес
+            await state.set_state(OrderStates.selecting_time)
+            await callback.message.edit_text(SLOT_TAKEN_TEXT, reply_markup=await time_slots_keyboard(state, catalog, scheduler))
+            await callback.answer()
+            return
         
-        await show_order_summary(callback, state, db_queries)
+        await show_order_summary(callback, state, catalog)
     
     except Exception as e:
         logging.error(f"Ошибка в use_profile_address: {e}")
@@ -354,7 +392,8 @@ async def use_custom_address(callback: CallbackQuery, state: FSMContext):
 
 
 @orders_router.message(OrderStates.entering_custom_address)
-async def process_custom_address(message: Message, state: FSMContext, db_queries: DatabaseQueries):
+async def process_custom_address(message: Message, state: FSMContext, catalog: ServiceCatalog,
+                                 scheduler: MasterScheduler):
     """Обработка пользовательского адреса"""
     try:
         # Удаляем сообщение пользователя
@@ -369,63 +408,75 @@ async def process_custom_address(message: Message, state: FSMContext, db_queries
         await state.update_data(order_address=cleaned_address)
         
         # Назначаем мастера здесь, когда все данные заказа готовы
-        await assign_master_to_order(state, db_queries)
+        if not await assign_master_to_order(state, catalog, scheduler):
+            await state.set_state(OrderStates.selecting_time)
+            await message.answer(SLOT_TAKEN_TEXT, reply_markup=await time_slots_keyboard(state, catalog, scheduler))
+            return
         
-        await show_order_summary_after_address(message, state, db_queries)
+        await show_order_summary_after_address(message, state, catalog)
     
     except Exception as e:
         logging.error(f"Ошибка в process_custom_address: {e}")
         await message.answer("Ошибка при обработке адреса")
 
 
-async def assign_master_to_order(state: FSMContext, db_queries: DatabaseQueries):
-    """Назначение мастера для заказа"""
+async def assign_master_to_order(state: FSMContext, catalog: ServiceCatalog, scheduler: MasterScheduler) -> bool:
+    """Назначение свободного мастера на выбранные дату и время (False - мастер не назначен: все заняты или ошибка)"""
     try:
         data = await state.get_data()
+        order_date = data.get('order_date')
+        order_time = data.get('order_time')
+        slot = f"{order_date} {order_time}"
         
-        # Если мастер уже назначен, не меняем
-        if data.get('assigned_master_id'):
-            logging.info("Мастер уже назначен, пропускаем")
-            return
+        # Если мастер уже назначен на это же время, не меняем
+        if data.get('assigned_master_id') and data.get('assigned_slot') == slot:
+            logger.debug("Мастер уже назначен, пропускаем")
+            return True
         
-        # Получаем всех мастеров и выбираем случайного
-        masters = await db_queries.get_masters()
-        if masters:
-            master = random.choice(masters)
-            
-            # Вычисляем общую стоимость
-            selected_services = data.get('selected_services', [])
-            
-            # Преобразуем в list, если это set
-            if isinstance(selected_services, set):
-                selected_services = list(selected_services)
-            
-            logging.info(f"Вычисление стоимости для услуг: {selected_services}")
-            
-            total_cost = 0
-            for service_id in selected_services:
-                service = await db_queries.get_service_by_id(service_id)
-                if service:
-                    total_cost += service['price']
-                    logging.info(f"Добавлена услуга {service_id}: {service['name']} - {service['price']}₽")
-            
+        # Вычисляем общую стоимость и длительность
+        selected_services = data.get('selected_services', [])
+        
+        # Преобразуем в list, если это set
+        if isinstance(selected_services, set):
+            selected_services = list(selected_services)
+        
+        logger.debug("Вычисление стоимости для услуг: %s", selected_services)
+        
+        total_cost, duration = catalog.calculate_totals(selected_services)
+        
+        if not order_date or not order_time:
+            # Время еще не выбрано (услуги от ИИ) - мастера назначим после выбора адреса
+            await state.update_data(total_cost=total_cost)
+            return True
+        
+        # Наименее загруженный мастер, свободный на это время
+        master = await scheduler.find_master(order_date, order_time, duration or DEFAULT_ORDER_DURATION_MINUTES)
+        if master:
             # Сохраняем назначенного мастера и стоимость
             await state.update_data(
                 assigned_master_id=master['id'],
                 assigned_master_name=master['name'],
+                assigned_slot=slot,
                 total_cost=total_cost
             )
             
             logging.info(f"Назначен мастер {master['name']} (ID: {master['id']}) для заказа на сумму {total_cost}₽")
+        else:
+            await state.update_data(assigned_master_id=None, assigned_master_name=None, total_cost=total_cost)
+            logging.info(f"Нет свободных мастеров на {slot}")
+            return False
     
     except Exception as e:
         logging.error(f"Ошибка в assign_master_to_order: {e}")
+        return False
+    
+    return True
 
 
-async def show_order_summary(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+async def show_order_summary(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog):
     """Показ итогового резюме заказа (из callback)"""
     try:
-        summary_text, keyboard = await build_order_summary(state, db_queries)
+        summary_text, keyboard = await build_order_summary(state, catalog)
         
         await callback.message.edit_text(summary_text, reply_markup=keyboard, parse_mode='Markdown')
         await callback.answer()
@@ -435,10 +486,10 @@ async def show_order_summary(callback: CallbackQuery, state: FSMContext, db_quer
         await callback.answer("Ошибка при формировании резюме заказа")
 
 
-async def show_order_summary_after_address(message: Message, state: FSMContext, db_queries: DatabaseQueries):
+async def show_order_summary_after_address(message: Message, state: FSMContext, catalog: ServiceCatalog):
     """Показ итогового резюме заказа (после ввода адреса)"""
     try:
-        summary_text, keyboard = await build_order_summary(state, db_queries)
+        summary_text, keyboard = await build_order_summary(state, catalog)
         
         await message.answer(summary_text, reply_markup=keyboard, parse_mode='Markdown')
     
@@ -447,7 +498,7 @@ async def show_order_summary_after_address(message: Message, state: FSMContext,
         await message.answer("Ошибка при формировании резюме заказа")
 
 
-async def build_order_summary(state: FSMContext, db_queries: DatabaseQueries) -> tuple:
+async def build_order_summary(state: FSMContext, catalog: ServiceCatalog) -> tuple:
     """Построение резюме заказа с уже назначенным мастером"""
     data = await state.get_data()
     selected_services = data.get('selected_services', [])
@@ -462,8 +513,8 @@ async def build_order_summary(state: FSMContext, db_queries: DatabaseQueries) ->
     if isinstance(selected_services, set):
         selected_services = list(selected_services)
     
-    logging.info(f"Построение резюме для услуг: {selected_services}")
-    logging.info(f"Назначенный мастер: {assigned_master_name} (ID: {assigned_master_id})")
+    logger.debug("Построение резюме: услуги %s, мастер %s (ID: %s)",
+                 selected_services, assigned_master_name, assigned_master_id)
     
     if not selected_services:
         raise ValueError("Не выбраны услуги для заказа")
@@ -476,17 +527,14 @@ async def build_order_summary(state: FSMContext, db_queries: DatabaseQueries) ->
     calculated_total_cost = 0
     total_duration = 0
     
-    for service_id in selected_services:
-        service = await db_queries.get_service_by_id(service_id)
-        if service:
-            services_info.append({
-                'name': service['name'],
-                'price': service['price'],
-                'duration': service['duration_minutes']
-            })
-            calculated_total_cost += service['price']
-            total_duration += service['duration_minutes']
-            logging.info(f"Добавлена в резюме услуга: {service['name']} - {service['price']}₽")
+    for service in catalog.get_services_by_ids(selected_services):
+        services_info.append({
+            'name': service['name'],
+            'price': service['price'],
+            'duration': service['duration_minutes']
+        })
+        calculated_total_cost += service['price']
+        total_duration += service['duration_minutes']
     
     if not services_info:
         raise ValueError("Выбранные услуги не найдены в базе данных")
@@ -495,7 +543,7 @@ async def build_order_summary(state: FSMContext, db_queries: DatabaseQueries) ->
     if total_cost == 0:
         total_cost = calculated_total_cost
     
-    logging.info(f"Итоговая стоимость: {total_cost}₽, продолжительность: {total_duration} мин")
+    logger.debug("Итоговая стоимость: %s₽, продолжительность: %s мин", total_cost, total_duration)
     
     # Форматируем дату
     formatted_date = datetime.strptime(order_date, '%Y-%m-%d').strftime('%d.%m.%Y')
@@ -519,7 +567,9 @@ async def build_order_summary(state: FSMContext, db_queries: DatabaseQueries) ->
 
 
 @orders_router.callback_query(F.data == "final_confirm")
-async def final_confirm_order(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+@query_budget(3)  # пользователь, день расписания (если не в памяти) и создание заказа
+async def final_confirm_order(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries,
+                              catalog: ServiceCatalog, scheduler: MasterScheduler):
     """Финальное подтверждение и создание заказа"""
     try:
         data = await state.get_data()
@@ -534,10 +584,8 @@ async def final_confirm_order(callback: CallbackQuery, state: FSMContext, db_que
         if isinstance(selected_services, set):
             selected_services = list(selected_services)
         
-        logging.info(f"Финальное подтверждение заказа:")
-        logging.info(f"- Мастер: {assigned_master_name} (ID: {assigned_master_id})")
-        logging.info(f"- Услуги: {selected_services}")
-        logging.info(f"- Стоимость: {total_cost}₽")
+        logger.debug("Финальное подтверждение: мастер %s (ID: %s), услуги %s, стоимость %s₽",
+                     assigned_master_name, assigned_master_id, selected_services, total_cost)
         
         if not assigned_master_id or not assigned_master_name:
             await callback.answer("Ошибка: мастер не назначен")
@@ -562,18 +610,43 @@ async def final_confirm_order(callback: CallbackQuery, state: FSMContext, db_que
             await callback.answer(error_msg)
             return
         
-        # Создаем заказ в БД
-        order_id = await db_queries.create_order(
+        # Назначенный мастер первым, остальные свободные - на случай, если его время заняли
+        order_date = validated_data['order_date']
+        order_time = validated_data['order_time']
+        _, duration = catalog.calculate_totals(validated_data['service_ids'])
+        free_master_ids = await scheduler.free_master_ids(
+            order_date, order_time, duration or DEFAULT_ORDER_DURATION_MINUTES, limit=5
+        )
+        master_ids = [assigned_master_id] + [mid for mid in free_master_ids if mid != assigned_master_id]
+        
+        # Создаем заказ в БД; занятость мастеров проверяется в той же транзакции
+        result = await db_queries.create_order_in_slot(
             user_id=validated_data['user_id'],
-            master_id=validated_data['master_id'],
+            master_ids=master_ids,
             address=validated_data['address'],
-            order_date=validated_data['order_date'],
-            order_time=validated_data['order_time'],
+            order_date=order_date,
+            order_time=order_time,
             total_cost=total_cost,
             service_ids=validated_data['service_ids']
         )
+        order_id = result['order_id'] if result else None
+        
+        if result and not order_id:
+            # Время заняли, пока пользователь оформлял заказ
+            scheduler.invalidate(order_date)
+            await state.update_data(assigned_master_id=None, assigned_master_name=None, assigned_slot=None)
+            await state.set_state(OrderStates.selecting_time)
+            await callback.message.edit_text(SLOT_TAKEN_TEXT, reply_markup=await time_slots_keyboard(state, catalog, scheduler))
+            await callback.answer()
+            return
         
         if order_id:
+            scheduler.reserve(order_id, order_date, order_time, result['duration_minutes'], result['master_id'])
+            if result['master_id'] != assigned_master_id:
+                master = catalog.get_master(result['master_id'])
+                assigned_master_id = result['master_id']
+                assigned_master_name = master['name'] if master else assigned_master_name
+            
             await callback.message.edit_text(
                 f"🎉 **Заказ успешно создан!**\n\n"
                 f"**Номер заказа:** №{order_id}\n\n"
@@ -601,17 +674,15 @@ async def final_confirm_order(callback: CallbackQuery, state: FSMContext, db_que
 
 # Обработчик для услуг ИИ (если есть)
 @orders_router.callback_query(F.data == "add_ai_services")
-async def add_ai_recommended_services(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+async def add_ai_recommended_services(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                                      scheduler: MasterScheduler):
     """Добавление рекомендованных ИИ услуг в заказ"""
     try:
         data = await state.get_data()
         recommended_services = data.get('recommended_services', [])
         
         # Подробное логирование для отладки
-        logging.info(f"=== ОТЛАДКА add_ai_services ===")
-        logging.info(f"Все данные state: {data}")
-        logging.info(f"recommended_services из state: {recommended_services}")
-        logging.info(f"Тип recommended_services: {type(recommended_services)}")
+        logger.debug("Добавление услуг ИИ, recommended_services: %s", recommended_services)
         
         if not recommended_services:
             logging.error("❌ recommended_services пустой или None")
@@ -621,14 +692,14 @@ async def add_ai_recommended_services(callback: CallbackQuery, state: FSMContext
         # Сохраняем выбранные услуги как list для совместимости с остальной логикой заказов
         await state.update_data(selected_services=list(recommended_services))
         
-        # Назначаем мастера сразу для ИИ услуг
-        await assign_master_to_order(state, db_queries)
+        # Стоимость услуг ИИ (мастер назначается после выбора даты и времени)
+        await assign_master_to_order(state, catalog, scheduler)
         
         # Переходим к выбору времени
         from ..handlers.orders import OrderStates
         await state.set_state(OrderStates.selecting_time)
         
-        keyboard = get_time_slots_keyboard()
+        keyboard = await time_slots_keyboard(state, catalog, scheduler)
         await callback.message.edit_text(
             f"🕐 **Выбор времени**\n\n"
             f"**Выбранные услуги от ИИ:**\n"
@@ -649,20 +720,19 @@ async def add_ai_recommended_services(callback: CallbackQuery, state: FSMContext
 # === НАВИГАЦИЯ ===
 
 @orders_router.callback_query(F.data == "back_to_services")
-async def back_to_services(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+async def back_to_services(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog):
     """Возврат к выбору услуг"""
     try:
         data = await state.get_data()
         selected_services = data.get('selected_services', [])
         page = data.get('page', 0)
         
-        logging.info(f"=== ВОЗВРАТ К УСЛУГАМ (СТРАНИЦА {page}) ===")
-        logging.info(f"Выбранные услуги из state: {selected_services}")
+        logger.debug("Возврат к услугам (страница %s), выбранные услуги: %s", page, selected_services)
         
         await state.set_state(OrderStates.selecting_services)
         
         # Используем единую функцию обновления страницы
-        await refresh_services_page(callback, state, db_queries)
+        await refresh_services_page(callback, state, catalog)
         await callback.answer()
     
     except Exception as e:
@@ -671,9 +741,10 @@ async def back_to_services(callback: CallbackQuery, state: FSMContext, db_querie
 
 
 @orders_router.callback_query(F.data == "back_to_time")
-async def back_to_time(callback: CallbackQuery, state: FSMContext):
+async def back_to_time(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                       scheduler: MasterScheduler):
     """Возврат к выбору времени"""
-    keyboard = get_time_slots_keyboard()
+    keyboard = await time_slots_keyboard(state, catalog, scheduler)
     await callback.message.edit_text(
         f"{SECTION_DESCRIPTIONS['TIME_SELECTION']}",
         reply_markup=keyboard,
@@ -684,12 +755,13 @@ async def back_to_time(callback: CallbackQuery, state: FSMContext):
 
 
 @orders_router.callback_query(F.data == "back_to_date")
-async def back_to_date(callback: CallbackQuery, state: FSMContext):
+async def back_to_date(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog,
+                       scheduler: MasterScheduler):
     """Возврат к выбору даты"""
     data = await state.get_data()
     time = data.get('order_time')
     
-    keyboard = get_dates_keyboard()
+    keyboard = await dates_keyboard(state, catalog, scheduler)
     await callback.message.edit_text(
         f"{SECTION_DESCRIPTIONS['DATE_SELECTION']}\n\n"
         f"Выбранное время: **{time}**\n"
@@ -16,12 +16,12 @@ from ..keyboards.profile_keyboards import (
     get_complete_order_keyboard
 )
 from ..utils.constants import (
-    SECTION_DESCRIPTIONS, SUCCESS_MESSAGES, ORDER_STATUS_EMOJI, ORDER_STATUSES
+    SECTION_DESCRIPTIONS, SUCCESS_MESSAGES, ORDER_STATUS_EMOJI, ORDER_STATUSES, LIMITS
 )
 
 
 # Создаем роутер для профиля
-profile_router = Router()
+profile_router = Router(name="profile")
 
 
 # Состояния редактирования профиля
@@ -281,27 +281,38 @@ async def show_order_history(callback: CallbackQuery, state: FSMContext, db_quer
 async def show_order_history_page_handler(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
     """Обработчик навигации по страницам истории заказов"""
     try:
-        page = int(callback.data.split("_")[-1])
-        await show_order_history_page(callback, state, db_queries, page=page)
+        # Формат: order_history_page_<страница>_<after|before>_<ID заказа-курсора>
+        page, direction, cursor_id = callback.data[len("order_history_page_"):].split("_")
+        cursor_id = int(cursor_id)
+        await show_order_history_page(
+            callback, state, db_queries, page=int(page),
+            after_id=cursor_id if direction == "after" else None,
+            before_id=cursor_id if direction == "before" else None
+        )
     except (ValueError, IndexError) as e:
         logging.error(f"Ошибка в show_order_history_page_handler: {e}")
         await callback.answer("Ошибка навигации")
 
 
-async def show_order_history_page(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries, page: int = 0):
+async def show_order_history_page(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries,
+                                  page: int = 0, after_id: int = None, before_id: int = None):
     """Показ конкретной страницы истории заказов"""
     try:
-        orders_per_page = 5
-        offset = page * orders_per_page
+        orders_per_page = LIMITS['MAX_ORDERS_PER_PAGE']
         
-        # Получаем заказы с запасом для определения наличия следующей страницы
-        orders = await db_queries.get_user_orders(callback.from_user.id, orders_per_page + 1, offset)
+        # Получаем заказы с запасом для определения наличия соседней страницы
+        orders = await db_queries.get_user_orders(
+            callback.from_user.id, orders_per_page + 1,
+            after_id=after_id, before_id=before_id
+        )
         
-        # Сохраняем текущую страницу в state
-        await state.update_data(order_history_page=page)
+        # Сохраняем курсор текущей страницы в state
+        await state.update_data(order_history_cursor={
+            'page': page, 'after_id': after_id, 'before_id': before_id
+        })
         
         if not orders:
-            if page == 0:
+            if page == 0 or (after_id is None and before_id is None):
                 # Нет заказов вообще
                 text = f"{SECTION_DESCRIPTIONS['ORDER_HISTORY']}"
                 text += "У вас пока нет заказов.\n"
@@ -312,17 +323,23 @@ async def show_order_history_page(callback: CallbackQuery, state: FSMContext, db
                     [InlineKeyboardButton(text="🔙 Назад к профилю", callback_data="back_to_profile")]
                 ])
             else:
-                # Страница пустая, возвращаемся на предыдущую
-                await show_order_history_page(callback, state, db_queries, page=max(0, page-1))
+                # Страница пустая, возвращаемся на первую
+                await show_order_history_page(callback, state, db_queries, page=0)
                 return
         else:
-            # Определяем есть ли следующая страница
-            has_next_page = len(orders) > orders_per_page
-            current_page_orders = orders[:orders_per_page]
+            has_more = len(orders) > orders_per_page
+            if before_id is not None:
+                # Лишний заказ при движении назад - самый новый
+                current_page_orders = orders[-orders_per_page:]
+                has_prev_page = has_more and page > 0
+                has_next_page = True
+            else:
+                current_page_orders = orders[:orders_per_page]
+                has_prev_page = page > 0
+                has_next_page = has_more
             
-            # Подсчитываем общее количество заказов для отображения
-            all_orders = await db_queries.get_user_orders(callback.from_user.id, 1000)  # Получаем все для подсчета
-            total_orders = len(all_orders) if all_orders else 0
+            # Общее количество заказов - отдельный запрос по индексу
+            total_orders = await db_queries.count_user_orders(callback.from_user.id) or 0
             
             text = f"{SECTION_DESCRIPTIONS['ORDER_HISTORY']}"
             text += f"**Всего заказов:** {total_orders}\n"
@@ -351,7 +368,7 @@ async def show_order_history_page(callback: CallbackQuery, state: FSMContext, db
             keyboard = get_order_history_keyboard(
                 orders=current_page_orders, 
                 page=page, 
-                has_prev=(page > 0), 
+                has_prev=has_prev_page, 
                 has_next=has_next_page
             )
         
@@ -586,11 +603,16 @@ async def back_to_profile(callback: CallbackQuery, user):
 async def back_to_order_history(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
     """Возврат к истории заказов"""
     try:
-        # Получаем сохраненную страницу из state
+        # Получаем курсор сохраненной страницы из state
         data = await state.get_data()
-        page = data.get('order_history_page', 0)
+        cursor = data.get('order_history_cursor') or {}
         
-        await show_order_history_page(callback, state, db_queries, page=page)
+        await show_order_history_page(
+            callback, state, db_queries,
+            page=cursor.get('page', 0),
+            after_id=cursor.get('after_id'),
+            before_id=cursor.get('before_id')
+        )
     
     except Exception as e:
         logging.error(f"Ошибка в back_to_order_history: {e}")
@@ -15,7 +15,7 @@ from ..utils.constants import SUCCESS_MESSAGES, SECTION_DESCRIPTIONS
 
 
 # Создаем роутер для регистрации
-registration_router = Router()
+registration_router = Router(name="registration")
 
 # Состояния регистрации
 class RegistrationStates(StatesGroup):
@@ -8,6 +8,7 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from ..database.queries import DatabaseQueries
+from ..database.profiler import query_budget
 from ..services.validation_service import ValidationService
 from ..keyboards.main_menu import get_main_menu_keyboard
 from ..keyboards.profile_keyboards import (
@@ -17,7 +18,7 @@ from ..utils.constants import SECTION_DESCRIPTIONS, SUCCESS_MESSAGES
 
 
 # Создаем роутер для отзывов
-reviews_router = Router()
+reviews_router = Router(name="reviews")
 
 
 # Состояния создания отзыва
@@ -38,6 +39,7 @@ async def delete_current_message(message):
 # === ПРОСМОТР ОТЗЫВОВ ===
 
 @reviews_router.message(F.text == "⭐ Отзывы")
+@query_budget(2)
 async def show_reviews(message: Message, state: FSMContext, db_queries: DatabaseQueries):
     """Показ отзывов клиентов"""
     try:
@@ -80,58 +82,54 @@ async def show_reviews(message: Message, state: FSMContext, db_queries: Database
 
 # === СОЗДАНИЕ ОТЗЫВА ===
 
+REVIEWABLE_ORDERS_PER_PAGE = 8
+
+
 @reviews_router.callback_query(F.data == "create_review")
+@query_budget(2)
 async def start_create_review(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
     """Начало создания отзыва"""
+    await show_reviewable_orders(callback, state, db_queries)
+
+
+@reviews_router.callback_query(F.data.startswith("create_review_after_"))
+async def show_more_reviewable_orders(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+    """Следующая страница заказов для отзыва"""
     try:
-        # Получаем заказы пользователя
-        orders = await db_queries.get_user_orders(callback.from_user.id, 20)
+        after_id = int(callback.data[len("create_review_after_"):])
+        await show_reviewable_orders(callback, state, db_queries, after_id=after_id)
+    except ValueError as e:
+        logging.error(f"Ошибка в show_more_reviewable_orders: {e}")
+        await callback.answer("Ошибка навигации")
+
+
+async def show_reviewable_orders(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries,
+                                 after_id: int = None):
+    """Показ выполненных заказов без отзыва"""
+    try:
+        # Один запрос: выполненные заказы без отзыва (с запасом для следующей страницы)
+        orders = await db_queries.get_reviewable_orders(
+            callback.from_user.id, REVIEWABLE_ORDERS_PER_PAGE + 1, after_id=after_id
+        ) or []
         
-        logging.info(f"Пользователь {callback.from_user.id}: найдено {len(orders) if orders else 0} заказов")
+        logging.info(f"Пользователь {callback.from_user.id}: доступно для отзыва {len(orders)} заказов")
         
-        if not orders:
-            new_text = (
-                f"{SECTION_DESCRIPTIONS['REVIEW_CREATION']}\n\n"
-                "❌ У вас пока нет заказов для оценки.\n"
-                "Сначала сделайте заказ и дождитесь его выполнения!"
-            )
-            keyboard = get_reviews_keyboard()
-            
-            # Проверяем, отличается ли новый текст от текущего
-            current_text = callback.message.text or ""
-            if new_text != current_text:
-                await callback.message.edit_text(
-                    new_text,
-                    reply_markup=keyboard,
-                    parse_mode='Markdown'
-                )
-            await callback.answer()
+        if not orders and after_id is not None:
+            # Заказы закончились - показываем с начала
+            await show_reviewable_orders(callback, state, db_queries)
             return
         
-        # Фильтруем заказы без отзывов
-        available_orders = []
-        for order in orders:
-            order_id = order['id']
-            order_status = order['status']
-            
-            logging.info(f"Заказ {order_id}: статус = {order_status}")
-            
-            # Проверяем, есть ли уже отзыв на этот заказ
-            has_review = await db_queries.check_review_exists(callback.from_user.id, order_id)
-            logging.info(f"Заказ {order_id}: отзыв существует = {has_review}")
-            
-            # Заказ доступен для отзыва если статус 'completed' и нет отзыва
-            if not has_review and order_status == 'completed':
-                available_orders.append(order)
-                logging.info(f"Заказ {order_id} добавлен для отзыва")
-        
-        logging.info(f"Доступно для отзыва: {len(available_orders)} заказов")
-        
-        if not available_orders:
+        if not orders:
             # Проверяем причину недоступности
-            completed_orders = [o for o in orders if o['status'] == 'completed']
+            counts = await db_queries.get_user_order_counts(callback.from_user.id) or {}
             
-            if not completed_orders:
+            if not counts.get('total'):
+                new_text = (
+                    f"{SECTION_DESCRIPTIONS['REVIEW_CREATION']}\n\n"
+                    "❌ У вас пока нет заказов для оценки.\n"
+                    "Сначала сделайте заказ и дождитесь его выполнения!"
+                )
+            elif not counts.get('completed'):
                 new_text = (
                     f"{SECTION_DESCRIPTIONS['REVIEW_CREATION']}\n\n"
                     "⏳ У вас нет завершенных заказов для оценки.\n"
@@ -158,11 +156,14 @@ async def start_create_review(callback: CallbackQuery, state: FSMContext, db_que
             return
         
         # Есть заказы для отзыва
+        page_orders = orders[:REVIEWABLE_ORDERS_PER_PAGE]
+        next_cursor = page_orders[-1]['id'] if len(orders) > REVIEWABLE_ORDERS_PER_PAGE else None
+        
         new_text = (
             f"{SECTION_DESCRIPTIONS['REVIEW_CREATION']}\n\n"
             "Выберите заказ для оценки:"
         )
-        keyboard = get_review_creation_keyboard(available_orders)
+        keyboard = get_review_creation_keyboard(page_orders, next_cursor=next_cursor)
         
         # Проверяем, отличается ли новый контент от текущего
         current_text = callback.message.text or ""
@@ -185,6 +186,7 @@ async def start_create_review(callback: CallbackQuery, state: FSMContext, db_que
 
 
 @reviews_router.callback_query(F.data.startswith("review_order_"))
+@query_budget(3)
 async def select_order_for_review(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
     """Выбор заказа для отзыва"""
     try:
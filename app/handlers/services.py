@@ -7,6 +7,8 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 
 from ..database.queries import DatabaseQueries
+from ..database.profiler import query_budget
+from ..services.catalog import ServiceCatalog
 from ..keyboards.order_keyboards import (
     get_services_keyboard, get_service_detail_keyboard,
     get_masters_keyboard, get_master_detail_keyboard
@@ -15,18 +17,17 @@ from ..utils.constants import SECTION_DESCRIPTIONS, LIMITS
 
 
 # Создаем роутер для услуг
-services_router = Router()
+services_router = Router(name="services")
 
 
 # === КАТАЛОГ УСЛУГ ===
 
 @services_router.message(F.text == "📋 Описание услуг")
-async def show_services_catalog(message: Message, state: FSMContext, db_queries: DatabaseQueries):
+async def show_services_catalog(message: Message, state: FSMContext, catalog: ServiceCatalog):
     """Показ каталога услуг"""
     try:
-        services = await db_queries.get_services(0, LIMITS['MAX_SERVICES_PER_PAGE'])
-        total_services = await db_queries.get_services_count()
-        total_pages = (total_services + LIMITS['MAX_SERVICES_PER_PAGE'] - 1) // LIMITS['MAX_SERVICES_PER_PAGE']
+        services = catalog.get_services_page(0)
+        total_pages = catalog.services_total_pages
         
         if not services:
             await message.answer(
@@ -55,7 +56,7 @@ async def show_services_catalog(message: Message, state: FSMContext, db_queries:
 
 
 @services_router.callback_query(F.data.startswith("view_service_"))
-async def handle_service_view(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+async def handle_service_view(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog):
     """Обработка просмотра услуг"""
     try:
         callback_parts = callback.data.split("_")
@@ -63,11 +64,11 @@ async def handle_service_view(callback: CallbackQuery, state: FSMContext, db_que
         if len(callback_parts) >= 4 and callback_parts[2] == "page":
             # Навигация по страницам
             page = int(callback_parts[3])
-            await handle_services_catalog_pagination(callback, state, db_queries, page)
+            await handle_services_catalog_pagination(callback, state, catalog, page)
         else:
             # Просмотр конкретной услуги
             service_id = int(callback_parts[2])
-            await show_service_details(callback, state, db_queries, service_id)
+            await show_service_details(callback, state, catalog, service_id)
     
     except (ValueError, IndexError) as e:
         logging.error(f"Ошибка в handle_service_view: {e}")
@@ -77,14 +78,13 @@ async def handle_service_view(callback: CallbackQuery, state: FSMContext, db_que
         await callback.answer("Произошла ошибка")
 
 
-async def handle_services_catalog_pagination(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries, page: int):
+async def handle_services_catalog_pagination(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog, page: int):
     """Пагинация каталога услуг"""
     try:
         await state.update_data(view_services_page=page)
         
-        services = await db_queries.get_services(page, LIMITS['MAX_SERVICES_PER_PAGE'])
-        total_services = await db_queries.get_services_count()
-        total_pages = (total_services + LIMITS['MAX_SERVICES_PER_PAGE'] - 1) // LIMITS['MAX_SERVICES_PER_PAGE']
+        services = catalog.get_services_page(page)
+        total_pages = catalog.services_total_pages
         
         keyboard = get_services_keyboard(services, page, total_pages, set(), "view_service")
         await callback.message.edit_text(
@@ -100,10 +100,10 @@ async def handle_services_catalog_pagination(callback: CallbackQuery, state: FSM
         await callback.answer("Ошибка при навигации по каталогу")
 
 
-async def show_service_details(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries, service_id: int):
+async def show_service_details(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog, service_id: int):
     """Показ детальной информации об услуге"""
     try:
-        service = await db_queries.get_service_by_id(service_id)
+        service = catalog.get_service(service_id)
         
         if not service:
             await callback.answer("Услуга не найдена")
@@ -146,15 +146,14 @@ async def show_service_details(callback: CallbackQuery, state: FSMContext, db_qu
 
 
 @services_router.callback_query(F.data == "back_to_services_catalog")
-async def back_to_services_catalog(callback: CallbackQuery, state: FSMContext, db_queries: DatabaseQueries):
+async def back_to_services_catalog(callback: CallbackQuery, state: FSMContext, catalog: ServiceCatalog):
     """Возврат к каталогу услуг"""
     try:
         data = await state.get_data()
         page = data.get('view_services_page', 0)
         
-        services = await db_queries.get_services(page, LIMITS['MAX_SERVICES_PER_PAGE'])
-        total_services = await db_queries.get_services_count()
-        total_pages = (total_services + LIMITS['MAX_SERVICES_PER_PAGE'] - 1) // LIMITS['MAX_SERVICES_PER_PAGE']
+        services = catalog.get_services_page(page)
+        total_pages = catalog.services_total_pages
         
         keyboard = get_services_keyboard(services, page, total_pages, set(), "view_service")
         await callback.message.edit_text(
@@ -173,12 +172,12 @@ async def back_to_services_catalog(callback: CallbackQuery, state: FSMContext, d
 # === МАСТЕРА ===
 
 @services_router.message(F.text == "👥 Мастера")
-async def show_masters_list(message: Message, state: FSMContext, db_queries: DatabaseQueries):
+async def show_masters_list(message: Message, state: FSMContext, catalog: ServiceCatalog):
     """Показ списка мастеров"""
     try:
-        masters = await db_queries.get_masters(0, LIMITS['MAX_MASTERS_PER_PAGE'])
-        total_masters = await db_queries.get_masters_count()
-        total_pages = (total_masters + LIMITS['MAX_MASTERS_PER_PAGE'] - 1) // LIMITS['MAX_MASTERS_PER_PAGE']
+        masters = catalog.get_masters_page(0)
+        total_masters = catalog.masters_count
+        total_pages = catalog.masters_total_pages
         
         if not masters:
             await message.answer(
@@ -205,11 +204,11 @@ async def show_masters_list(message: Message, state: FSMContext, db_queries: Dat
 
 
 @services_router.callback_query(F.data.startswith("master_"))
-async def view_master_details(callback: CallbackQuery, db_queries: DatabaseQueries):
+async def view_master_details(callback: CallbackQuery, catalog: ServiceCatalog):
     """Просмотр информации о мастере"""
     try:
         master_id = int(callback.data.split("_")[1])
-        master = await db_queries.get_master_by_id(master_id)
+        master = catalog.get_master(master_id)
         
         if not master:
             await callback.answer("Мастер не найден")
@@ -263,12 +262,12 @@ async def view_master_details(callback: CallbackQuery, db_queries: DatabaseQueri
 
 
 @services_router.callback_query(F.data == "back_to_masters_catalog")
-async def back_to_masters_catalog(callback: CallbackQuery, db_queries: DatabaseQueries):
+async def back_to_masters_catalog(callback: CallbackQuery, catalog: ServiceCatalog):
     """Возврат к списку мастеров"""
     try:
-        masters = await db_queries.get_masters(0, LIMITS['MAX_MASTERS_PER_PAGE'])
-        total_masters = await db_queries.get_masters_count()
-        total_pages = (total_masters + LIMITS['MAX_MASTERS_PER_PAGE'] - 1) // LIMITS['MAX_MASTERS_PER_PAGE']
+        masters = catalog.get_masters_page(0)
+        total_masters = catalog.masters_count
+        total_pages = catalog.masters_total_pages
         
         keyboard = get_masters_keyboard(masters, 0, total_pages)
         await callback.message.edit_text(
@@ -302,17 +301,8 @@ async def search_services(message: Message, db_queries: DatabaseQueries):
             )
             return
         
-        # Получаем все услуги для поиска
-        all_services = await db_queries.get_services(0, 100)  # Получаем больше услуг для поиска
-        
-        # Фильтруем услуги по запросу
-        found_services = []
-        query_lower = query.lower()
-        
-        for service in all_services:
-            if (query_lower in service['name'].lower() or 
-                query_lower in service['description'].lower()):
-                found_services.append(service)
+        # Полнотекстовый поиск по всему каталогу (с учетом форм слов)
+        found_services = await db_queries.search_services(query, limit=10)
         
         if not found_services:
             await message.answer(
@@ -325,14 +315,15 @@ async def search_services(message: Message, db_queries: DatabaseQueries):
         
         # Формируем результаты поиска
         text = f"🔍 **Результаты поиска: «{query}»**\n\n"
-        text += f"Найдено услуг: **{len(found_services)}**\n\n"
+        total_found = found_services[0]['total_found']
+        text += f"Найдено услуг: **{total_found}**\n\n"
         
-        for i, service in enumerate(found_services[:10], 1):  # Показываем максимум 10
+        for i, service in enumerate(found_services, 1):  # Показываем максимум 10
             text += f"{i}. **{service['name']}** - {service['price']}₽\n"
             text += f"   _{service['description'][:60]}..._\n\n"
         
-        if len(found_services) > 10:
-            text += f"... и еще {len(found_services) - 10} услуг.\n\n"
+        if total_found > len(found_services):
+            text += f"... и еще {total_found - len(found_services)} услуг.\n\n"
         
         text += "Для просмотра полного каталога используйте кнопку «📋 Описание услуг»."
         
@@ -349,7 +340,8 @@ async def search_services(message: Message, db_queries: DatabaseQueries):
 # === ПОПУЛЯРНЫЕ УСЛУГИ ===
 
 @services_router.callback_query(F.data == "popular_services")
-async def show_popular_services(callback: CallbackQuery, db_queries: DatabaseQueries):
+@query_budget(1)
+async def show_popular_services(callback: CallbackQuery, catalog: ServiceCatalog):
     """Показ популярных услуг"""
     try:
         # ID популярных услуг (можно вынести в константы)
@@ -358,7 +350,7 @@ async def show_popular_services(callback: CallbackQuery, db_queries: DatabaseQue
         text = "🔥 **Популярные услуги**\n\n"
         
         for i, service_id in enumerate(popular_service_ids, 1):
-            service = await db_queries.get_service_by_id(service_id)
+            service = catalog.get_service(service_id)
             if service:
                 text += f"{i}. **{service['name']}** - {service['price']}₽\n"
                 text += f"   ⏱️ {service['duration_minutes']} мин\n\n"
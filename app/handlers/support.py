@@ -2,6 +2,7 @@
 Обработчики службы поддержки (обновленная версия)
 """
 import logging
+from functools import lru_cache
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
@@ -14,7 +15,7 @@ from ..utils.constants import SECTION_DESCRIPTIONS, SUCCESS_MESSAGES
 
 
 # Создаем роутер для поддержки
-support_router = Router()
+support_router = Router(name="support")
 
 
 # Состояния поддержки
@@ -30,6 +31,7 @@ async def delete_current_message(message):
         pass
 
 
+@lru_cache(maxsize=None)
 def get_support_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура поддержки"""
     keyboard = [
@@ -53,6 +55,7 @@ def get_support_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_faq_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура FAQ"""
     keyboard = [
@@ -1,6 +1,10 @@
 """
 Клавиатуры главного меню (исправленная версия с админ панелью)
+
+Статические клавиатуры кэшируются: вызывающий код получает общий
+экземпляр и не должен его изменять.
 """
+from functools import lru_cache
 from aiogram.types import (
     ReplyKeyboardMarkup, KeyboardButton,
     InlineKeyboardMarkup, InlineKeyboardButton
@@ -8,11 +12,9 @@ from aiogram.types import (
 from ..utils.constants import BUTTON_TEXTS, CALLBACK_DATA
 
 
+@lru_cache(maxsize=None)
 def get_main_menu_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
-    """Главное меню бота с поддержкой админ панели"""
-    
-    print(f"DEBUG get_main_menu_keyboard: is_admin = {is_admin}")
-    
+    """Главное меню бота с поддержкой админ панели (строится один раз на вариант)"""
     keyboard = [
         [
             KeyboardButton(text=BUTTON_TEXTS['MAKE_ORDER']), 
@@ -33,12 +35,9 @@ def get_main_menu_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
     
     # Добавляем кнопку админ панели для администраторов
     if is_admin:
-        print("DEBUG: Добавляем админ кнопку!")
         keyboard.append([
             KeyboardButton(text="🔧 Админ панель")
         ])
-    else:
-        print("DEBUG: Админ кнопка НЕ добавлена")
     
     return ReplyKeyboardMarkup(
         keyboard=keyboard,
@@ -47,6 +46,7 @@ def get_main_menu_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
     )
 
 
+@lru_cache(maxsize=None)
 def get_welcome_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура приветствия для новых пользователей"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -58,6 +58,7 @@ def get_welcome_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_main_menu_inline_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
     """Inline-версия главного меню с поддержкой админ панели"""
     keyboard = [
@@ -111,6 +112,7 @@ def get_main_menu_inline_keyboard(is_admin: bool = False) -> InlineKeyboardMarku
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_back_to_main_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура с кнопкой возврата в главное меню"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -122,6 +124,7 @@ def get_back_to_main_keyboard(is_admin: bool = False) -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_help_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура помощи"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -159,6 +162,7 @@ def get_help_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_error_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для обработки ошибок"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -182,6 +186,7 @@ def get_error_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=256)
 def get_confirmation_keyboard(confirm_callback: str, cancel_callback: str = None) -> InlineKeyboardMarkup:
     """
     Клавиатура подтверждения действия
@@ -202,6 +207,7 @@ def get_confirmation_keyboard(confirm_callback: str, cancel_callback: str = None
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_admin_menu_keyboard() -> InlineKeyboardMarkup:
     """Админ-панель (для будущего использования)"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -227,6 +233,7 @@ def get_admin_menu_keyboard() -> InlineKeyboardMarkup:
     return keyboard
 
 
+@lru_cache(maxsize=None)
 def get_loading_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура во время загрузки"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -1,10 +1,47 @@
 """
 Клавиатуры для заказов
+
+Статические клавиатуры и кнопки кэшируются: вызывающий код получает
+общие экземпляры и не должен их изменять.
 """
-from datetime import datetime, timedelta
-from typing import List, Dict, Set
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Set, FrozenSet, Optional, Tuple
+from functools import lru_cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from ..utils.constants import TIME_SLOTS, BUTTON_TEXTS, CALLBACK_DATA
+from ..utils.constants import TIME_SLOTS, BOOKING_DAYS, BUTTON_TEXTS, CALLBACK_DATA
+
+
+@lru_cache(maxsize=1024)
+def _service_buttons(action_prefix: str, service_id: int, name: str, price: int) -> tuple:
+    """Кнопка услуги без отметки и с отметкой (ключ включает название и цену)"""
+    button_text = f"{name} - {price}₽"
+    callback_data = f"{action_prefix}_{service_id}"
+    return (
+        InlineKeyboardButton(text=button_text, callback_data=callback_data),
+        InlineKeyboardButton(text=f"✅ {button_text}", callback_data=callback_data)
+    )
+
+
+@lru_cache(maxsize=256)
+def _navigation_row(action_prefix: str, page: int, total_pages: int) -> tuple:
+    """Кнопки навигации по страницам услуг"""
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton(
+            text=BUTTON_TEXTS['PREV'], 
+            callback_data=f"{action_prefix}_page_{page-1}"
+        ))
+    if page < total_pages - 1:
+        nav_buttons.append(InlineKeyboardButton(
+            text=BUTTON_TEXTS['NEXT'], 
+            callback_data=f"{action_prefix}_page_{page+1}"
+        ))
+    return tuple(nav_buttons)
+
+
+@lru_cache(maxsize=None)
+def _control_button(text_key: str, callback_key: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=BUTTON_TEXTS[text_key], callback_data=CALLBACK_DATA[callback_key])
 
 
 def get_services_keyboard(services: List[Dict], page: int, total_pages: int, 
@@ -12,6 +49,9 @@ def get_services_keyboard(services: List[Dict], page: int, total_pages: int,
     """
     Клавиатура для выбора услуг
     
+    Кнопки берутся из кэша, при переключении услуги меняется только
+    выбор между вариантом с отметкой и без.
+    
     Args:
         services: Список услуг
         page: Текущая страница
@@ -19,72 +59,44 @@ def get_services_keyboard(services: List[Dict], page: int, total_pages: int,
         selected_services: Выбранные услуги
         action_prefix: Префикс для callback'ов
     """
+    show_checkmarks = action_prefix == "order_service"
     keyboard = []
     
     # Кнопки услуг
     for service in services:
-        service_id = service['id']
-        name = service['name']
-        price = service['price']
-        
-        if action_prefix == "order_service":
-            checkmark = "✅ " if service_id in selected_services else ""
-            button_text = f"{checkmark}{name} - {price}₽"
-        else:
-            button_text = f"{name} - {price}₽"
-        
-        keyboard.append([InlineKeyboardButton(
-            text=button_text, 
-            callback_data=f"{action_prefix}_{service_id}"
-        )])
+        plain, checked = _service_buttons(action_prefix, service['id'], service['name'], service['price'])
+        selected = show_checkmarks and service['id'] in selected_services
+        keyboard.append([checked if selected else plain])
     
     # Кнопки навигации
-    nav_buttons = []
-    if page > 0:
-        nav_buttons.append(InlineKeyboardButton(
-            text=BUTTON_TEXTS['PREV'], 
-            callback_data=f"{action_prefix}_page_{page-1}"
-        ))
-    if page < total_pages - 1:
-        nav_buttons.append(InlineKeyboardButton(
-            text=BUTTON_TEXTS['NEXT'], 
-            callback_data=f"{action_prefix}_page_{page+1}"
-        ))
-    
+    nav_buttons = _navigation_row(action_prefix, page, total_pages)
     if nav_buttons:
-        keyboard.append(nav_buttons)
+        keyboard.append(list(nav_buttons))
     
     # Кнопки управления
-    if action_prefix == "order_service":
+    if show_checkmarks:
         if selected_services:
-            keyboard.append([InlineKeyboardButton(
-                text=BUTTON_TEXTS['CONFIRM_ORDER'], 
-                callback_data=CALLBACK_DATA['CONFIRM_ORDER']
-            )])
-        keyboard.append([InlineKeyboardButton(
-            text=BUTTON_TEXTS['BACK_TO_MAIN'], 
-            callback_data=CALLBACK_DATA['MAIN_MENU']
-        )])
+            keyboard.append([_control_button('CONFIRM_ORDER', 'CONFIRM_ORDER')])
+        keyboard.append([_control_button('BACK_TO_MAIN', 'MAIN_MENU')])
     elif action_prefix == "view_service":
-        keyboard.append([InlineKeyboardButton(
-            text=BUTTON_TEXTS['BACK_TO_MAIN'], 
-            callback_data=CALLBACK_DATA['MAIN_MENU']
-        )])
+        keyboard.append([_control_button('BACK_TO_MAIN', 'MAIN_MENU')])
     
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_time_slots_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора времени"""
+@lru_cache(maxsize=128)
+def get_time_slots_keyboard(available: Optional[Tuple[str, ...]] = None) -> InlineKeyboardMarkup:
+    """Клавиатура выбора времени (available - только слоты, где есть свободные мастера)"""
     keyboard = []
+    slots = TIME_SLOTS if available is None else [slot for slot in TIME_SLOTS if slot in available]
     
     # Разбиваем временные слоты по 3 в ряд
-    for i in range(0, len(TIME_SLOTS), 3):
+    for i in range(0, len(slots), 3):
         row = []
-        for j in range(i, min(i + 3, len(TIME_SLOTS))):
+        for j in range(i, min(i + 3, len(slots))):
             row.append(InlineKeyboardButton(
-                text=TIME_SLOTS[j], 
-                callback_data=f"time_{TIME_SLOTS[j]}"
+                text=slots[j], 
+                callback_data=f"time_{slots[j]}"
             ))
         keyboard.append(row)
     
@@ -97,37 +109,31 @@ def get_time_slots_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_dates_keyboard() -> InlineKeyboardMarkup:
-    """Клавиатура выбора даты"""
+def get_dates_keyboard(available: Optional[FrozenSet[str]] = None) -> InlineKeyboardMarkup:
+    """Клавиатура выбора даты (available - только дни, где есть свободные мастера)"""
+    return _build_dates_keyboard(datetime.now().date(), available)
+
+
+def _date_button(day: date) -> InlineKeyboardButton:
+    day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][day.weekday()]
+    return InlineKeyboardButton(
+        text=f"{day_name} {day.strftime('%d.%m')}", 
+        callback_data=f"date_{day.strftime('%Y-%m-%d')}"
+    )
+
+
+@lru_cache(maxsize=256)
+def _build_dates_keyboard(today: date, available: Optional[FrozenSet[str]] = None) -> InlineKeyboardMarkup:
     keyboard = []
-    today = datetime.now()
     
-    # Следующие 14 дней
-    for i in range(1, 15):
-        date = today + timedelta(days=i)
-        date_str = date.strftime("%d.%m")
-        day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][date.weekday()]
-        button_text = f"{day_name} {date_str}"
+    # Следующие BOOKING_DAYS дней
+    days = [today + timedelta(days=i) for i in range(1, BOOKING_DAYS + 1)]
+    if available is not None:
+        days = [day for day in days if day.strftime('%Y-%m-%d') in available]
         
         # По 2 кнопки в ряд
-        if i % 2 == 1:
-            row = [InlineKeyboardButton(
-                text=button_text, 
-                callback_data=f"date_{date.strftime('%Y-%m-%d')}"
-            )]
-            
-            # Добавляем вторую кнопку если есть
-            if i + 1 <= 14:
-                next_date = today + timedelta(days=i + 1)
-                next_date_str = next_date.strftime("%d.%m")
-                next_day_name = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"][next_date.weekday()]
-                next_button_text = f"{next_day_name} {next_date_str}"
-                row.append(InlineKeyboardButton(
-                    text=next_button_text, 
-                    callback_data=f"date_{next_date.strftime('%Y-%m-%d')}"
-                ))
-            
-            keyboard.append(row)
+    for i in range(0, len(days), 2):
+        keyboard.append([_date_button(day) for day in days[i:i + 2]])
     
     # Кнопка назад
     keyboard.append([InlineKeyboardButton(
@@ -138,6 +144,7 @@ def get_dates_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_address_selection_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора адреса"""
     keyboard = [
@@ -157,6 +164,7 @@ def get_address_selection_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_order_confirmation_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения заказа"""
     keyboard = [
@@ -250,6 +258,7 @@ def get_order_actions_keyboard(order_id: int, status: str) -> InlineKeyboardMark
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_ai_services_keyboard(has_services: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура для ИИ консультации"""
     keyboard = []
@@ -274,6 +283,7 @@ def get_ai_services_keyboard(has_services: bool = False) -> InlineKeyboardMarkup
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_service_detail_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для детального просмотра услуги"""
     keyboard = [
@@ -289,6 +299,7 @@ def get_service_detail_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_master_detail_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для детального просмотра мастера"""
     keyboard = [
@@ -304,6 +315,7 @@ def get_master_detail_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_order_navigation_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура навигации по этапам заказа"""
     keyboard = [
@@ -1,11 +1,13 @@
 """
 Клавиатуры для профиля пользователя (обновленная версия)
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
+from functools import lru_cache
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from ..utils.constants import BUTTON_TEXTS, CALLBACK_DATA
 
 
+@lru_cache(maxsize=None)
 def get_profile_keyboard() -> InlineKeyboardMarkup:
     """Основная клавиатура профиля"""
     keyboard = [
@@ -25,6 +27,7 @@ def get_profile_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_profile_edit_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура редактирования профиля"""
     keyboard = [
@@ -54,7 +57,7 @@ def get_order_history_keyboard(orders: List[Dict] = None, page: int = 0,
     Клавиатура истории заказов с пагинацией
     
     Args:
-        orders: Список заказов пользователя
+        orders: Заказы текущей страницы (размер страницы задает обработчик)
         page: Текущая страница (начиная с 0)
         has_prev: Есть ли предыдущая страница
         has_next: Есть ли следующая страница
@@ -62,8 +65,8 @@ def get_order_history_keyboard(orders: List[Dict] = None, page: int = 0,
     keyboard = []
     
     if orders:
-        # Показываем заказы как кнопки (максимум 5)
-        for order in orders[:5]:
+        # Показываем заказы страницы как кнопки
+        for order in orders:
             order_id = order['id']
             date = order['order_date']
             status_emoji = "✅" if order['status'] == 'completed' else "⏳"
@@ -74,18 +77,18 @@ def get_order_history_keyboard(orders: List[Dict] = None, page: int = 0,
                 callback_data=f"order_details_{order_id}"
             )])
         
-        # Кнопки навигации по страницам
+        # Кнопки навигации по страницам несут курсор: крайний заказ текущей страницы
         nav_buttons = []
         if has_prev:
             nav_buttons.append(InlineKeyboardButton(
                 text="⬅️ Предыдущие", 
-                callback_data=f"order_history_page_{page - 1}"
+                callback_data=f"order_history_page_{page - 1}_before_{orders[0]['id']}"
             ))
         
         if has_next:
             nav_buttons.append(InlineKeyboardButton(
                 text="➡️ Следующие", 
-                callback_data=f"order_history_page_{page + 1}"
+                callback_data=f"order_history_page_{page + 1}_after_{orders[-1]['id']}"
             ))
         
         if nav_buttons:
@@ -114,6 +117,7 @@ def get_order_history_keyboard(orders: List[Dict] = None, page: int = 0,
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_reviews_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура отзывов"""
     keyboard = [
@@ -129,12 +133,13 @@ def get_reviews_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_review_creation_keyboard(orders: List[Dict]) -> InlineKeyboardMarkup:
+def get_review_creation_keyboard(orders: List[Dict], next_cursor: Optional[int] = None) -> InlineKeyboardMarkup:
     """
     Клавиатура для создания отзыва
     
     Args:
         orders: Список заказов для оценки
+        next_cursor: ID последнего показанного заказа, если есть следующая страница
     """
     keyboard = []
     
@@ -149,6 +154,12 @@ def get_review_creation_keyboard(orders: List[Dict]) -> InlineKeyboardMarkup:
                 text=button_text, 
                 callback_data=f"review_order_{order_id}"
             )])
+        
+        if next_cursor is not None:
+            keyboard.append([InlineKeyboardButton(
+                text="➡️ Еще заказы", 
+                callback_data=f"create_review_after_{next_cursor}"
+            )])
     
     # Кнопка назад
     keyboard.append([InlineKeyboardButton(
@@ -159,6 +170,7 @@ def get_review_creation_keyboard(orders: List[Dict]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_rating_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура выбора рейтинга"""
     keyboard = []
@@ -180,6 +192,7 @@ def get_rating_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_support_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура поддержки"""
     keyboard = [
@@ -199,6 +212,7 @@ def get_support_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_faq_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура FAQ"""
     keyboard = [
@@ -312,6 +326,7 @@ def get_cancel_order_keyboard(order_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_notification_settings_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура настроек уведомлений"""
     keyboard = [
@@ -335,6 +350,7 @@ def get_notification_settings_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_profile_export_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура экспорта данных профиля"""
     keyboard = [
@@ -358,6 +374,7 @@ def get_profile_export_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=None)
 def get_delete_account_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура подтверждения удаления аккаунта"""
     keyboard = [
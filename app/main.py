@@ -3,8 +3,10 @@
 """
 import asyncio
 import logging
+import signal
 import sys
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Optional
 
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.types import Message, CallbackQuery
@@ -15,7 +17,17 @@ from aiogram.fsm.context import FSMContext
 from .config import ConfigLoader, setup_logging, validate_config, BotConfig
 from .database.connection import DatabaseManager
 from .database.queries import DatabaseQueries
+from .database.fsm_storage import SQLiteStorage
+from .database.profiler import QueryProfilerMiddleware, profiler
 from .services.ai_service import AIConsultationService
+from .services.ai_cache import AIResponseCache
+from .services.catalog import ServiceCatalog
+from .services.notifications import NotificationService
+from .services.scheduler import MasterScheduler
+from .services.backup import BackupService
+from .webhook import WebhookServer
+from .utils.metrics import HandlerMetricsMiddleware, MetricsServer, metrics
+from .utils.logs import log_context_middleware
 from .keyboards.main_menu import get_main_menu_keyboard, get_main_menu_inline_keyboard
 from .utils.constants import CALLBACK_DATA
 
@@ -24,8 +36,17 @@ from .utils.constants import CALLBACK_DATA
 class RepairBot:
     """Основной класс бота"""
     
-    def __init__(self, config_path: str = "config.txt"):
-        """Инициализация бота"""
+    def __init__(self, config_path: str = "config.txt", worker_index: Optional[int] = None,
+                 log_queue: Optional[Any] = None):
+        """
+        Инициализация бота.
+        
+        worker_index - номер процесса-воркера в многопроцессном режиме
+        (CLUSTER_WORKERS), log_queue - общая очередь логов кластера.
+        """
+        self.config_path = config_path
+        self.worker_index = worker_index
+        
         # Загружаем конфигурацию
         self.config = ConfigLoader.load_from_file(config_path)
         
@@ -33,35 +54,124 @@ class RepairBot:
         if not validate_config(self.config):
             raise ValueError("Некорректная конфигурация")
         
-        # Настраиваем логирование
-        self.logger = setup_logging(self.config)
+        # Настраиваем логирование (записи воркеров пишет процесс приема обновлений)
+        self.logger = setup_logging(self.config, log_queue=log_queue, listen=worker_index is None)
+        
+        # Профилирование запросов к БД
+        profiler.configure(
+            slow_query_ms=self.config.db_slow_query_ms,
+            explain=self.config.db_explain_queries,
+            default_budget=self.config.db_query_budget,
+            strict=self.config.db_query_budget_strict
+        )
         
         # Инициализируем компоненты
         self.bot = Bot(token=self.config.bot_token)
-        self.storage = MemoryStorage()
-        self.dp = Dispatcher(storage=self.storage)
+        if self.config.fsm_storage == "sqlite":
+            self.storage = SQLiteStorage(
+                self.config.fsm_db_path or self.config.db_path,
+                flush_interval=self.config.fsm_flush_interval,
+                ttl=self.config.fsm_state_ttl_hours * 3600
+            )
+        else:
+            self.storage = MemoryStorage()
+        self.dp = Dispatcher(storage=self.storage, name="main")
         
         # Инициализируем сервисы
         self.db_manager = DatabaseManager(self.config.db_path)
-        self.db_queries = DatabaseQueries(self.config.db_path)
-        self.ai_service = AIConsultationService(self.config.gemini_api_key)
+        self.db_queries = DatabaseQueries(
+            self.config.db_path,
+            user_cache_size=self.config.user_cache_size,
+            user_cache_ttl=self.config.user_cache_ttl
+        )
+        self.catalog = ServiceCatalog(self.config.db_path)
+        self.ai_cache = AIResponseCache(
+            self.config.db_path,
+            max_size=self.config.ai_cache_size,
+            ttl=self.config.ai_cache_ttl_hours * 3600
+        )
+        self.ai_service = AIConsultationService(
+            self.config.gemini_api_key,
+            request_timeout=self.config.ai_request_timeout,
+            max_concurrency=self.config.ai_max_concurrency,
+            cache=self.ai_cache,
+            catalog=self.catalog,
+            stream_responses=self.config.ai_streaming,
+            stream_edit_interval=self.config.ai_stream_edit_interval
+        )
+        
+        self.notifications = NotificationService(
+            self.bot, self.config.db_path,
+            rate_per_second=self.config.notify_rate_per_second,
+            chat_interval=self.config.notify_chat_interval,
+            max_attempts=self.config.notify_max_attempts
+        )
+        self.db_queries.on_notifications_enqueued = self.notifications.wake
+        
+        # Резервные копии БД в фоне (по расписанию и из админ-панели)
+        self.backups = BackupService(
+            self.config.db_path,
+            backup_dir=self.config.backup_dir,
+            interval_hours=self.config.backup_interval_hours,
+            keep=self.config.backup_keep,
+            pages_per_step=self.config.backup_pages_per_step
+        )
+        
+        # Занятость мастеров: индекс по дням, освобождается при отмене и завершении заказов
+        self.scheduler = MasterScheduler(self.config.db_path, self.catalog)
+        self.db_queries.on_order_status_changed = self.scheduler.on_order_status_changed
         
         # Инициализируем бизнес-сервисы после создания db_queries
         from .services.order_service import OrderService
         self.order_service = None  # Будет инициализирован в setup_middleware
         
+        # HTTP-эндпоинт метрик (METRICS_PORT=0 - отключен); у воркеров кластера - METRICS_PORT + номер
+        self.metrics_server = None
+        if self.config.metrics_port:
+            self.metrics_server = MetricsServer(
+                self.config.metrics_host, self.config.metrics_port + (worker_index or 0)
+            )
+        
         self.logger.info("✅ Компоненты бота инициализированы")
     
+    @property
+    def runs_background_jobs(self) -> bool:
+        """Доставка уведомлений и резервные копии: один процесс на БД"""
+        return not self.worker_index
+    
     async def setup_database(self):
         """Настройка базы данных"""
         try:
+            started = time.perf_counter()
+            
+            # Миграции выполняются, только если схема устарела
             await self.db_manager.init_database()
-            await self.db_manager.populate_test_data()
             
-            # Проверяем здоровье БД
-            health_check = await self.db_manager.check_db_health()
+            # Открываем пул соединений для всех запросов к БД
+            await self.db_manager.open_pool(self.config.db_pool_size)
+            
+            if self.config.db_seed_data:
+                await self.db_manager.populate_test_data()
+            
+            # Восстанавливаем незавершенные диалоги пользователей
+            if isinstance(self.storage, SQLiteStorage):
+                await self.storage.open()
+            
+            # Загружаем снимок каталога услуг и мастеров
+            if not await self.catalog.load():
+                raise Exception("Не удалось загрузить каталог услуг")
+            if not self.catalog.services:
+                self.logger.warning("⚠️ Каталог услуг пуст: добавьте услуги или включите DB_SEED_DATA=true")
+            
+            # Занятость мастеров на дни записи - для клавиатур даты и времени
+            await self.scheduler.ensure_days(self.scheduler.booking_days())
+            
+            # Проверяем здоровье БД (полная проверка - по DB_DEEP_HEALTH_CHECK)
+            health_check = await self.db_manager.check_db_health(self.config.db_deep_health_check)
             if health_check:
-                self.logger.info("✅ База данных готова к работе")
+                self.logger.info(
+                    f"✅ База данных готова к работе за {(time.perf_counter() - started) * 1000:.0f} мс"
+                )
             else:
                 raise Exception("Проблемы с базой данных")
                 
@@ -163,13 +273,27 @@ class RepairBot:
                             return
                         
                         order_id = int(command_parts[1])
-                        success = await db_queries.update_order_status(order_id, 'completed')
+                        success = await db_queries.update_order_status(order_id, 'completed', notify=True)
                         
                         if success:
                             await message.answer(f"✅ Заказ №{order_id} переведен в статус 'completed'")
                         else:
                             await message.answer(f"❌ Ошибка обновления заказа №{order_id}")
                     
+                    elif command == "/admin_cancel":
+                        # Команда: /admin_cancel 12 (отменить заказ №12)
+                        if len(command_parts) < 2:
+                            await message.answer("Использование: /admin_cancel <order_id>")
+                            return
+                        
+                        order_id = int(command_parts[1])
+                        success = await db_queries.update_order_status(order_id, 'cancelled', notify=True)
+                        
+                        if success:
+                            await message.answer(f"✅ Заказ №{order_id} отменен")
+                        else:
+                            await message.answer(f"❌ Ошибка отмены заказа №{order_id}")
+                    
                     elif command == "/admin_orders":
                         # Показать все заказы пользователя
                         orders = await db_queries.get_user_orders(message.from_user.id, 10)
@@ -189,11 +313,16 @@ class RepairBot:
                         
                         await message.answer(text, parse_mode='Markdown')
                     
+                    elif command == "/admin_metrics":
+                        await message.answer(self.format_metrics_summary())
+                    
                     elif command == "/admin_help":
                         await message.answer(
                             "🔧 **Админские команды:**\n\n"
                             "`/admin_orders` - показать ваши заказы\n"
                             "`/admin_complete <id>` - завершить заказ\n"
+                            "`/admin_cancel <id>` - отменить заказ\n"
+                            "`/admin_metrics` - метрики производительности\n"
                             "`/admin_help` - эта справка\n\n"
                             "**Пример:** `/admin_complete 12`",
                             parse_mode='Markdown'
@@ -207,7 +336,7 @@ class RepairBot:
                     await message.answer(f"❌ Ошибка: {e}")
             
             # Создаем роутер для общих обработчиков (должен быть последним)
-            general_router = Router()
+            general_router = Router(name="general")
             
             # Добавляем общие обработчики в отдельный роутер
             general_router.message.register(self.handle_unknown_message)
@@ -228,13 +357,16 @@ class RepairBot:
         try:
             # Инициализируем order_service здесь, когда db_queries уже готов
             from .services.order_service import OrderService
-            self.order_service = OrderService(self.db_queries)
+            self.order_service = OrderService(self.db_queries, self.catalog, self.scheduler)
             
             # Middleware для передачи зависимостей
             async def inject_dependencies(handler, event, data: Dict[str, Any]):
                 data['db_queries'] = self.db_queries
                 data['ai_service'] = self.ai_service
                 data['order_service'] = self.order_service
+                data['catalog'] = self.catalog
+                data['scheduler'] = self.scheduler
+                data['backups'] = self.backups
                 data['config'] = self.config  # Добавляем конфиг
                 
                 # Добавляем информацию о пользователе для всех обработчиков
@@ -246,16 +378,73 @@ class RepairBot:
                 
                 return await handler(event, data)
             
-            # Регистрируем middleware
+            # Регистрируем middleware (счетчик запросов первым, чтобы учесть и загрузку пользователя)
+            self.dp.message.middleware(QueryProfilerMiddleware())
+            self.dp.callback_query.middleware(QueryProfilerMiddleware())
             self.dp.message.middleware(inject_dependencies)
             self.dp.callback_query.middleware(inject_dependencies)
             
+            # Контекст записей лога (update_id, user_id) для всех обновлений
+            self.dp.update.outer_middleware(log_context_middleware)
+            
+            # Метрики: outer замеряет всю обработку, inner определяет обработчик
+            self.dp.message.outer_middleware(HandlerMetricsMiddleware('message'))
+            self.dp.callback_query.outer_middleware(HandlerMetricsMiddleware('callback_query'))
+            self.dp.message.middleware(HandlerMetricsMiddleware.label_handler)
+            self.dp.callback_query.middleware(HandlerMetricsMiddleware.label_handler)
+            
             self.logger.info("✅ Middleware настроены")
             
         except Exception as e:
             self.logger.error(f"❌ Ошибка настройки middleware: {e}")
             raise
     
+    def format_metrics_summary(self) -> str:
+        """Текст сводки метрик для /admin_metrics"""
+        summary = metrics.summary()
+        hours, rest = divmod(int(summary['uptime']), 3600)
+        
+        text = "📈 Метрики производительности\n\n"
+        text += f"⏱ Время работы: {hours} ч {rest // 60} мин\n"
+        text += f"📨 Обновлений: {summary['updates']} ({summary['updates_per_second']:.2f}/с), "
+        text += f"ошибок: {summary['handler_errors']}\n"
+        text += f"💾 Запросов к БД: {summary['db_calls']}, ошибок: {summary['db_errors']}\n"
+        text += f"🤖 Запросов к ИИ: {summary['ai_calls']}, ошибок: {summary['ai_errors']}"
+        if summary['ai_calls']:
+            text += f", p50 {summary['ai_p50']:.2f} с, p95 {summary['ai_p95']:.2f} с"
+        text += "\n"
+        if summary['ai_streams']:
+            text += (
+                f"⚡ Первый фрагмент ответа ИИ: p50 {summary['ai_first_token_p50']:.2f} с, "
+                f"p95 {summary['ai_first_token_p95']:.2f} с\n"
+            )
+        notifications = self.notifications.get_stats()
+        text += (
+            f"📬 Уведомлений отправлено: {notifications['sent']}, "
+            f"повторов: {notifications['retried']}, не доставлено: {notifications['failed']}\n"
+        )
+        
+        if summary['slowest_handlers']:
+            text += "\n🐢 Самые медленные обработчики (p95):\n"
+            for item in summary['slowest_handlers']:
+                text += (
+                    f"• {item['router']}.{item['handler']}: {item['p95'] * 1000:.0f} мс "
+                    f"(p50 {item['p50'] * 1000:.0f} мс, вызовов {item['calls']}, ошибок {item['errors']})\n"
+                )
+        
+        if summary['heaviest_queries']:
+            text += "\n🗄 Запросы к БД (суммарное время):\n"
+            for item in summary['heaviest_queries']:
+                text += (
+                    f"• {item['query']}: {item['total']:.2f} с "
+                    f"({item['calls']} x {item['mean'] * 1000:.1f} мс, ошибок {item['errors']})\n"
+                )
+        
+        if self.metrics_server:
+            text += f"\nPrometheus: http://{self.config.metrics_host}:{self.config.metrics_port}/metrics"
+        
+        return text
+    
     async def handle_main_menu_callback(self, callback: CallbackQuery, state, is_admin=False, **kwargs):
         """Обработчик возврата в главное меню"""
         await state.clear()
@@ -356,6 +545,24 @@ class RepairBot:
             # Настраиваем обработчики ошибок
             await self.setup_error_handlers()
             
+            # Следим за изменениями каталога
+            self.catalog.start_auto_refresh()
+            
+            # Фоновые задачи - в одном процессе (в кластере - в первом воркере)
+            if self.runs_background_jobs:
+                # Доставка уведомлений (включая оставшиеся с прошлого запуска)
+                self.notifications.start()
+                
+                self.backups.start()
+            
+            # Эндпоинт метрик не обязателен для работы бота
+            if self.metrics_server:
+                try:
+                    await self.metrics_server.start()
+                except OSError as e:
+                    self.logger.error(f"❌ Не удалось запустить сервер метрик: {e}")
+                    self.metrics_server = None
+            
             # Проверяем ИИ сервис
             if self.ai_service.is_available:
                 self.logger.info("✅ ИИ сервис доступен")
@@ -378,9 +585,21 @@ class RepairBot:
         try:
             self.logger.info("🛑 Остановка бота...")
             
-            # Создаем резервную копию БД
-            backup_path = f"backup_{self.config.db_path}"
-            await self.db_manager.backup_database(backup_path)
+            # Полная копия при остановке не делается: копии создаются по расписанию
+            await self.backups.stop()
+            
+            await self.catalog.stop_auto_refresh()
+            
+            await self.notifications.stop()
+            
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            
+            # Сбрасываем состояния диалогов на диск до закрытия пула
+            await self.storage.close()
+            
+            # Закрываем пул соединений с БД
+            await self.db_manager.close_pool()
             
             # Закрываем сессию бота
             await self.bot.session.close()
@@ -390,18 +609,63 @@ class RepairBot:
         except Exception as e:
             self.logger.error(f"❌ Ошибка при остановке бота: {e}")
     
+    async def run_polling(self):
+        """Получение обновлений через long polling"""
+        # Webhook, оставшийся от прошлого запуска, блокирует getUpdates
+        await self.bot.delete_webhook(drop_pending_updates=False)
+        await self.dp.start_polling(self.bot)
+    
+    async def run_webhook(self):
+        """Получение обновлений через webhook"""
+        server = WebhookServer(
+            self.bot, self.dp,
+            path=self.config.webhook_path,
+            host=self.config.webhook_host,
+            port=self.config.webhook_port,
+            secret_token=self.config.webhook_secret or None,
+            max_concurrency=self.config.webhook_max_concurrency
+        )
+        stop_event = asyncio.Event()
+        
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                # Windows: остановка через KeyboardInterrupt
+                pass
+        
+        await server.start()
+        try:
+            if self.config.webhook_url:
+                await self.bot.set_webhook(
+                    url=self.config.webhook_url,
+                    secret_token=self.config.webhook_secret or None,
+                    allowed_updates=self.dp.resolve_used_update_types()
+                )
+                self.logger.info(f"🌐 Webhook зарегистрирован: {self.config.webhook_url}")
+            else:
+                self.logger.info("🌐 WEBHOOK_URL не задан, webhook в Telegram не регистрируется")
+            
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            if self.config.webhook_url:
+                try:
+                    await self.bot.delete_webhook()
+                except Exception as e:
+                    self.logger.error(f"❌ Ошибка удаления webhook: {e}")
+    
     async def run(self):
         """Запуск бота"""
         try:
             # Выполняем действия при запуске
             await self.on_startup()
             
-            # Запускаем polling
-            await self.dp.start_polling(
-                self.bot,
-                on_startup=None,  # Уже выполнили
-                on_shutdown=self.on_shutdown
-            )
+            if self.config.run_mode == "webhook":
+                await self.run_webhook()
+            else:
+                await self.run_polling()
             
         except KeyboardInterrupt:
             self.logger.info("👋 Получен сигнал остановки")
@@ -417,7 +681,12 @@ async def main():
     try:
         # Создаем и запускаем бота
         bot = RepairBot()
-        await bot.run()
+        if bot.config.cluster_workers:
+            # Этот процесс принимает обновления, обрабатывают их процессы-воркеры
+            from .cluster import ClusterIngress
+            await ClusterIngress(bot).run()
+        else:
+            await bot.run()
         
     except Exception as e:
         logging.error(f"❌ Критическая ошибка приложения: {e}")
@@ -3,11 +3,15 @@
 """
 
 from .ai_service import AIConsultationService
+from .ai_cache import AIResponseCache
+from .catalog import ServiceCatalog
 from .validation_service import ValidationService
 from .order_service import OrderService
 
 __all__ = [
     'AIConsultationService',
+    'AIResponseCache',
+    'ServiceCatalog',
     'ValidationService', 
     'OrderService'
 ]
\ No newline at end of file
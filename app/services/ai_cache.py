@@ -0,0 +1,140 @@
+"""
+Кэш ответов ИИ консультанта
+"""
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..database.connection import get_db_connection, handle_db_errors
+from ..utils.cache import TTLCache
+from ..utils.text import normalize_text
+from .catalog import catalog_fingerprint
+
+
+class AIResponseCache:
+    """
+    Двухуровневый кэш ответов ИИ: LRU в памяти и таблица ai_response_cache в SQLite.
+
+    Ключ строится из нормализованного текста проблемы и хэша каталога услуг,
+    по которому был составлен промпт. При изменении таблицы services триггеры
+    очищают таблицу кэша, а записи в памяти перестают совпадать по хэшу каталога.
+    """
+
+    def __init__(self, db_path: str = "repair_bot.db", max_size: int = 500, ttl: float = 7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.memory = TTLCache(max_size=self.max_size, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def catalog_hash(all_services: List[Dict]) -> str:
+        """Хэш каталога услуг, из которого строится промпт"""
+        return catalog_fingerprint(all_services)
+
+    @staticmethod
+    def make_key(problem_text: str, catalog_hash: str) -> str:
+        """Ключ кэша: нормализованный текст проблемы + хэш каталога"""
+        raw = f"{normalize_text(problem_text)}|{catalog_hash}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    async def get(self, problem_text: str, catalog_hash: str) -> Optional[Dict[str, Any]]:
+        """Поиск готового ответа"""
+        key = self.make_key(problem_text, catalog_hash)
+
+        result = self.memory.get(key)
+        if result is None:
+            loaded = await self._load(key)
+            if loaded is not None:
+                # В памяти запись живет не дольше, чем осталось жить записи в БД
+                result, remaining = loaded
+                self.memory.set(key, result, ttl=remaining)
+
+        if result is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return dict(result, cached=True)
+
+    async def set(self, problem_text: str, catalog_hash: str, result: Dict[str, Any]):
+        """Сохранение ответа ИИ"""
+        key = self.make_key(problem_text, catalog_hash)
+        value = {
+            'success': result['success'],
+            'ai_response': result['ai_response'],
+            'recommended_services': list(result['recommended_services']),
+            'error': None
+        }
+        self.memory.set(key, value)
+        await self._store(key, catalog_hash, value)
+
+    @handle_db_errors
+    async def _load(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Чтение записи из SQLite с учетом TTL: (ответ, оставшееся время жизни в секундах)"""
+        async with get_db_connection(self.db_path) as db:
+            now = time.time()
+            cursor = await db.execute(
+                "SELECT response, created_at FROM ai_response_cache WHERE cache_key = ? AND created_at > ?",
+                (key, now - self.ttl)
+            )
+            row = await cursor.fetchone()
+            if not row:
+                return None
+
+            await db.execute(
+                "UPDATE ai_response_cache SET last_used_at = ? WHERE cache_key = ?",
+                (now, key)
+            )
+            await db.commit()
+            return json.loads(row['response']), row['created_at'] + self.ttl - now
+
+    @handle_db_errors
+    async def _store(self, key: str, catalog_hash: str, value: Dict[str, Any]) -> bool:
+        """Запись в SQLite с вытеснением устаревших и давно неиспользуемых записей"""
+        async with get_db_connection(self.db_path) as db:
+            now = time.time()
+            await db.execute('''
+                INSERT INTO ai_response_cache (cache_key, catalog_hash, response, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    catalog_hash = excluded.catalog_hash,
+                    response = excluded.response,
+                    created_at = excluded.created_at,
+                    last_used_at = excluded.last_used_at
+            ''', (key, catalog_hash, json.dumps(value, ensure_ascii=False), now, now))
+
+            await db.execute(
+                "DELETE FROM ai_response_cache WHERE created_at <= ?",
+                (now - self.ttl,)
+            )
+            await db.execute('''
+                DELETE FROM ai_response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM ai_response_cache
+                    ORDER BY last_used_at DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_size,))
+            await db.commit()
+            return True
+
+    @handle_db_errors
+    async def clear(self) -> bool:
+        """Полная очистка кэша"""
+        self.memory.clear()
+        async with get_db_connection(self.db_path) as db:
+            await db.execute("DELETE FROM ai_response_cache")
+            await db.commit()
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов"""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0,
+            'memory_size': len(self.memory)
+        }
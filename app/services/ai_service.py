@@ -1,18 +1,41 @@
 """
 Сервис для работы с ИИ консультациями
 """
+import asyncio
 import logging
 import re
-from typing import List, Dict, Tuple, Optional
+import time
+from typing import Awaitable, Callable, List, Dict, Tuple, Optional
 import google.generativeai as genai
 from ..utils.constants import AI_PROBLEM_PATTERNS
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.metrics import metrics
+from .ai_cache import AIResponseCache
+from .catalog import ServiceCatalog
 
 
 class AIConsultationService:
     """Сервис для ИИ консультаций"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, request_timeout: float = 30.0, max_concurrency: int = 4,
+                 cache: Optional[AIResponseCache] = None, catalog: Optional[ServiceCatalog] = None,
+                 stream_responses: bool = True, stream_edit_interval: float = 1.5):
         """Инициализация сервиса"""
+        self.cache = cache
+        self.catalog = catalog
+        self._services_list_cache: Tuple[Optional[str], str] = (None, "")
+        self.ai_calls = 0
+        self.ai_total_seconds = 0.0
+        self.request_timeout = request_timeout
+        self.stream_responses = stream_responses
+        self.stream_edit_interval = stream_edit_interval
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._user_tasks: Dict[int, asyncio.Task] = {}
+        
+        # Резервный анализ по ключевым словам: автомат строится один раз
+        self.keyword_matcher = KeywordMatcher.from_patterns(AI_PROBLEM_PATTERNS)
+        
         try:
             genai.configure(api_key=api_key)
             self.model = genai.GenerativeModel('gemini-1.5-flash')
@@ -23,25 +46,123 @@ class AIConsultationService:
             self.is_available = False
             self.model = None
     
-    def _analyze_problem_keywords(self, problem_text: str) -> Tuple[str, List[int], str]:
-        """Анализ проблемы по ключевым словам"""
-        problem_lower = problem_text.lower()
+    def _release_slot(self, task: asyncio.Future):
+        """Освобождение слота семафора после завершения потока синхронного клиента"""
+        self._semaphore.release()
+        if not task.cancelled():
+            # Ошибку потока после дедлайна уже никто не ждет - забираем, чтобы не было
+            # предупреждения "exception was never retrieved"
+            task.exception()
+    
+    async def _to_thread_limited(self, prompt: str):
+        """
+        Вызов синхронного клиента в отдельном потоке с ограничением числа запросов
+        
+        Поток нельзя прервать: после дедлайна он продолжает работу, поэтому слот
+        освобождается по его завершении, а не при отмене ожидания. Зависшие
+        вызовы не превышают max_concurrency, новые ждут в очереди.
+        """
+        await self._semaphore.acquire()
+        try:
+            task = asyncio.ensure_future(asyncio.to_thread(self.model.generate_content, prompt))
+        except BaseException:
+            self._semaphore.release()
+            raise
+        task.add_done_callback(self._release_slot)
+        return await asyncio.shield(task)
+    
+    async def _generate_limited(self, prompt: str):
+        """Вызов модели с ограничением числа одновременных запросов"""
+        generate_async = getattr(self.model, 'generate_content_async', None)
+        if generate_async is None:
+            return await self._to_thread_limited(prompt)
+        
+        async with self._semaphore:
+            return await generate_async(prompt)
+    
+    async def _stream_model(self, prompt: str, on_text: Callable[[str], None], started: float) -> str:
+        """Потоковый вызов модели: on_text получает накопленный текст после каждого фрагмента"""
+        text = ""
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                piece = chunk.text
+            except ValueError:
+                # Фрагмент без текста (например, только причина остановки)
+                continue
+            if not piece:
+                continue
+            if not text:
+                metrics.observe_ai_first_token(time.perf_counter() - started)
+            text += piece
+            on_text(text)
+        return text
+    
+    async def _stream_limited(self, prompt: str, on_text: Callable[[str], None]) -> str:
+        """Потоковый вызов с ограничением числа одновременных запросов"""
+        # Время до первого фрагмента считаем с учетом ожидания в очереди - его видит пользователь
+        started = time.perf_counter()
+        if getattr(self.model, 'generate_content_async', None) is None:
+            # Синхронный клиент не стримим: ответ приходит целиком
+            response = await self._to_thread_limited(prompt)
+            metrics.observe_ai_first_token(time.perf_counter() - started)
+            on_text(response.text)
+            return response.text
+        
+        async with self._semaphore:
+            return await self._stream_model(prompt, on_text, started)
+    
+    async def _with_deadline(self, call: Awaitable, timeout: Optional[float] = None):
+        """Выполнение запроса к модели с дедлайном (включая ожидание в очереди)"""
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            result = await asyncio.wait_for(call, timeout or self.request_timeout)
+            status = 'ok'
+            return result
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            raise
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            raise
+        finally:
+            metrics.observe_ai(status, time.perf_counter() - started)
+    
+    async def _generate_content(self, prompt: str, timeout: Optional[float] = None):
+        """Генерация ответа целиком"""
+        return await self._with_deadline(self._generate_limited(prompt), timeout)
+    
+    async def _generate_stream(self, prompt: str, on_text: Callable[[str], None],
+                               timeout: Optional[float] = None) -> str:
+        """Генерация ответа по фрагментам; дедлайн - на весь ответ"""
+        return await self._with_deadline(self._stream_limited(prompt, on_text), timeout)
+    
+    def _analyze_problem_keywords(self, problem_text: str, max_services: int = 5,
+                                  secondary_ratio: float = 0.5) -> Tuple[str, List[int], str]:
+        """
+        Анализ проблемы по ключевым словам
         
-        # Подсчитываем совпадения для каждой категории
-        category_scores = {}
-        for category, data in AI_PROBLEM_PATTERNS.items():
-            score = sum(1 for keyword in data['keywords'] if keyword in problem_lower)
-            if score > 0:
-                category_scores[category] = score
+        Основная категория - с наибольшим весом совпадений. Категории с весом
+        не меньше secondary_ratio от основного тоже учитываются: их услуги
+        добавляются после услуг основной категории.
+        """
+        ranking = self.keyword_matcher.rank(problem_text)
         
-        if not category_scores:
+        if not ranking:
             return 'general', [1, 2, 9], 'Рекомендуется базовая диагностика системы.'
         
-        # Выбираем категорию с наибольшим количеством совпадений
-        best_category = max(category_scores.keys(), key=lambda k: category_scores[k])
-        pattern_data = AI_PROBLEM_PATTERNS[best_category]
+        best_category, best_score = ranking[0]
+        services: List[int] = []
+        descriptions: List[str] = []
+        for category, score in ranking:
+            if score < best_score * secondary_ratio:
+                break
+            pattern_data = AI_PROBLEM_PATTERNS[category]
+            descriptions.append(pattern_data['description'])
+            services.extend(sid for sid in pattern_data['services'] if sid not in services)
         
-        return best_category, pattern_data['services'], pattern_data['description']
+        return best_category, services[:max_services], ' '.join(descriptions)
     
     def _create_ai_prompt(self, problem_text: str, services_list: str) -> str:
         """Создание промпта для ИИ"""
@@ -69,9 +190,40 @@ class AIConsultationService:
 - Обязательно укажи [ID: X] для каждой рекомендуемой услуги
 
 Проблема клиента: {problem_text}"""
+
+    def _uses_catalog(self, services: Optional[List[Dict]]) -> bool:
+        """Передан ли общий снимок каталога (или ничего)"""
+        return self.catalog is not None and (services is None or services is self.catalog.services)
+    
+    def _build_services_list(self, all_services: List[Dict]) -> str:
+        """Список услуг для промпта (для снимка каталога строится один раз на версию)"""
+        if self._uses_catalog(all_services):
+            fingerprint, services_list = self._services_list_cache
+            if fingerprint == self.catalog.fingerprint:
+                return services_list
+        
+        services_list = ""
+        for service in all_services:
+            if isinstance(service, dict):
+                # Новый формат (dict)
+                service_id = service['id']
+                name = service['name']
+                price = service['price']
+                duration = service['duration_minutes']
+                description = service['description']
+            else:
+                # Старый формат (tuple)
+                service_id, name, price, duration, description = service[:5]
+            
+            services_list += f"ID: {service_id}, {name}, {price}₽, {duration} мин - {description}\n"
+        
+        if self._uses_catalog(all_services):
+            self._services_list_cache = (self.catalog.fingerprint, services_list)
+        return services_list
     
-    async def get_ai_recommendation(self, problem_text: str, all_services: List[Dict]) -> Dict:
-        """Получение рекомендации от ИИ"""
+    async def get_ai_recommendation(self, problem_text: str, all_services: List[Dict],
+                                    on_text: Optional[Callable[[str], None]] = None) -> Dict:
+        """Получение рекомендации от ИИ (on_text - получатель текста по мере генерации)"""
         if not self.is_available or not self.model:
             return {
                 'success': False,
@@ -82,30 +234,24 @@ class AIConsultationService:
         
         try:
             # Формируем список услуг для промпта
-            services_list = ""
-            for service in all_services:
-                if isinstance(service, dict):
-                    # Новый формат (dict)
-                    service_id = service['id']
-                    name = service['name']
-                    price = service['price']
-                    duration = service['duration_minutes']
-                    description = service['description']
-                else:
-                    # Старый формат (tuple)
-                    service_id, name, price, duration, description = service[:5]
-                
-                services_list += f"ID: {service_id}, {name}, {price}₽, {duration} мин - {description}\n"
+            services_list = self._build_services_list(all_services)
             
             # Создаем и отправляем промпт
             prompt = self._create_ai_prompt(problem_text, services_list)
-            response = self.model.generate_content(prompt)
+            started = time.perf_counter()
+            if on_text is not None and self.stream_responses:
+                response_text = await self._generate_stream(prompt, on_text)
+            else:
+                response = await self._generate_content(prompt)
+                response_text = response.text
+            self.ai_calls += 1
+            self.ai_total_seconds += time.perf_counter() - started
             
-            if not response.text:
+            if not response_text:
                 raise ValueError("Пустой ответ от ИИ")
             
-            # Извлекаем ID услуг из ответа
-            service_ids = re.findall(r'\[ID:\s*(\d+)\]', response.text)
+            # Извлекаем ID услуг из полного ответа
+            service_ids = re.findall(r'\[ID:\s*(\d+)\]', response_text)
             recommended_services = [int(sid) for sid in service_ids if sid.isdigit()]
             
             # Ограничиваем количество рекомендаций
@@ -115,11 +261,19 @@ class AIConsultationService:
             
             return {
                 'success': True,
-                'ai_response': response.text,
+                'ai_response': response_text,
                 'recommended_services': recommended_services,
                 'error': None
             }
-            
+        
+        except asyncio.TimeoutError:
+            logging.warning(f"ИИ не ответил за {self.request_timeout} сек")
+            return {
+                'success': False,
+                'ai_response': None,
+                'recommended_services': [],
+                'error': 'Превышено время ожидания ответа ИИ'
+            }
         except Exception as e:
             logging.error(f"Ошибка ИИ консультации: {e}")
             return {
@@ -146,8 +300,9 @@ class AIConsultationService:
             'fallback': True
         }
     
-    async def process_consultation(self, problem_text: str, all_services: List[Dict]) -> Dict:
-        """Основной метод обработки консультации"""
+    async def process_consultation(self, problem_text: str, all_services: Optional[List[Dict]] = None,
+                                   on_text: Optional[Callable[[str], None]] = None) -> Dict:
+        """Основной метод обработки консультации (по умолчанию - по снимку каталога)"""
         # Валидация входных данных
         if not problem_text or len(problem_text.strip()) < 10:
             return {
@@ -160,8 +315,22 @@ class AIConsultationService:
         if len(problem_text) > 1000:
             problem_text = problem_text[:1000]  # Ограничиваем длину
         
+        if all_services is None:
+            all_services = self.catalog.services if self.catalog else []
+        
+        # Проверяем кэш готовых ответов
+        catalog_hash = None
+        if self.cache:
+            if self._uses_catalog(all_services):
+                catalog_hash = self.catalog.fingerprint
+            else:
+                catalog_hash = self.cache.catalog_hash(all_services)
+            cached_result = await self.cache.get(problem_text, catalog_hash)
+            if cached_result:
+                return cached_result
+        
         # Попытка получить ИИ рекомендацию
-        ai_result = await self.get_ai_recommendation(problem_text, all_services)
+        ai_result = await self.get_ai_recommendation(problem_text, all_services, on_text)
         
         # Если ИИ не сработал или не дал услуги, используем резервную логику
         if not ai_result['success'] or not ai_result['recommended_services']:
@@ -173,18 +342,61 @@ class AIConsultationService:
             
             return fallback_result
         
+        # Кэшируем только настоящие ответы ИИ, резервная логика и так дешевая
+        if self.cache:
+            await self.cache.set(problem_text, catalog_hash, ai_result)
+        
         return ai_result
     
-    def validate_recommended_services(self, service_ids: List[int], available_services: List[Dict]) -> List[int]:
+    def start_consultation(self, user_id: int, problem_text: str,
+                           all_services: Optional[List[Dict]] = None,
+                           on_text: Optional[Callable[[str], None]] = None) -> asyncio.Task:
+        """Запуск консультации в фоновой задаче (предыдущая консультация пользователя отменяется)"""
+        self.cancel_consultation(user_id)
+        
+        task = asyncio.create_task(self.process_consultation(problem_text, all_services, on_text))
+        self._user_tasks[user_id] = task
+        
+        def _forget(finished: asyncio.Task):
+            if self._user_tasks.get(user_id) is finished:
+                del self._user_tasks[user_id]
+        
+        task.add_done_callback(_forget)
+        return task
+    
+    def cancel_consultation(self, user_id: int) -> bool:
+        """Отмена текущей консультации пользователя"""
+        task = self._user_tasks.pop(user_id, None)
+        if task and not task.done():
+            task.cancel()
+            logging.info(f"ИИ консультация пользователя {user_id} отменена")
+            return True
+        return False
+    
+    def get_cache_stats(self) -> Dict:
+        """Статистика кэша и оценка сэкономленного времени ИИ"""
+        if not self.cache:
+            return {}
+        
+        stats = self.cache.get_stats()
+        avg_latency = self.ai_total_seconds / self.ai_calls if self.ai_calls else 0.0
+        stats['avg_ai_latency'] = round(avg_latency, 2)
+        stats['saved_seconds'] = round(stats['hits'] * avg_latency, 1)
+        return stats
+    
+    def validate_recommended_services(self, service_ids: List[int],
+                                      available_services: Optional[List[Dict]] = None) -> List[int]:
         """Валидация рекомендованных услуг"""
         if not service_ids:
             return []
         
         # Получаем список доступных ID
-        if available_services and isinstance(available_services[0], dict):
+        if self._uses_catalog(available_services):
+            available_ids = self.catalog.services_by_id
+        elif available_services and isinstance(available_services[0], dict):
             available_ids = {service['id'] for service in available_services}
         else:
-            available_ids = {service[0] for service in available_services}  # tuple format
+            available_ids = {service[0] for service in available_services or []}  # tuple format
         
         # Фильтруем только существующие услуги
         valid_services = [sid for sid in service_ids if sid in available_ids]
@@ -195,9 +407,12 @@ class AIConsultationService:
         
         return valid_services
     
-    def get_service_info(self, service_id: int, available_services: List[Dict]) -> Optional[Dict]:
+    def get_service_info(self, service_id: int, available_services: Optional[List[Dict]] = None) -> Optional[Dict]:
         """Получение информации об услуге по ID"""
-        for service in available_services:
+        if self._uses_catalog(available_services):
+            return self.catalog.get_service(service_id)
+        
+        for service in available_services or []:
             if isinstance(service, dict):
                 if service['id'] == service_id:
                     return service
@@ -212,7 +427,7 @@ class AIConsultationService:
                     }
         return None
     
-    def calculate_total_cost(self, service_ids: List[int], available_services: List[Dict]) -> int:
+    def calculate_total_cost(self, service_ids: List[int], available_services: Optional[List[Dict]] = None) -> int:
         """Расчет общей стоимости услуг"""
         total_cost = 0
         for service_id in service_ids:
@@ -221,7 +436,7 @@ class AIConsultationService:
                 total_cost += service_info['price']
         return total_cost
     
-    def format_services_info(self, service_ids: List[int], available_services: List[Dict]) -> str:
+    def format_services_info(self, service_ids: List[int], available_services: Optional[List[Dict]] = None) -> str:
         """Форматирование информации об услугах"""
         services_text = ""
         total_cost = 0
@@ -234,15 +449,18 @@ class AIConsultationService:
         
         return services_text, total_cost
     
-    def check_service_availability(self) -> bool:
+    async def check_service_availability(self, timeout: float = 10.0) -> bool:
         """Проверка доступности ИИ сервиса"""
         if not self.is_available:
             return False
         
         try:
             # Простая проверка доступности API
-            test_response = self.model.generate_content("Test")
+            await self._generate_content("Test", timeout=timeout)
             return True
+        except asyncio.TimeoutError:
+            logging.error(f"ИИ сервис не ответил за {timeout} сек")
+            return False
         except Exception as e:
             logging.error(f"ИИ сервис недоступен: {e}")
             return False
\ No newline at end of file
@@ -0,0 +1,265 @@
+"""
+Резервное копирование базы данных в фоне
+"""
+import asyncio
+import glob
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+class BackupAborted(Exception):
+    """Копирование прервано (остановка бота или слишком много перезапусков)"""
+
+
+class BackupService:
+    """
+    Фоновое резервное копирование БД по расписанию и по запросу администратора.
+    
+    Копия снимается online backup API SQLite порциями по pages_per_step
+    страниц с паузой между шагами в отдельном потоке: бот продолжает
+    обслуживать запросы, а блокировка чтения держится только на время шага.
+    Если БД меняется другим соединением, SQLite начинает копирование заново;
+    после max_restarts перезапусков оставшееся копируется одним шагом
+    (в режиме WAL это не блокирует запись).
+    
+    Готовая копия проверяется PRAGMA quick_check, сжимается gzip, рядом
+    пишется контрольная сумма SHA-256 в формате sha256sum; копии сверх keep
+    удаляются, начиная с самых старых.
+    """
+    
+    def __init__(self, db_path: str, backup_dir: str = "backups", interval_hours: float = 24.0,
+                 keep: int = 7, pages_per_step: int = 256, step_pause: float = 0.01,
+                 max_restarts: int = 5):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.interval = interval_hours * 3600
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.max_restarts = max_restarts
+        self.prefix = os.path.splitext(os.path.basename(db_path))[0]
+        
+        # Состояние для админ-панели
+        self.running = False
+        self.started_at: Optional[float] = None
+        self.pages_total = 0
+        self.pages_done = 0
+        self.restarts = 0
+        self.last_backup: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        
+        self._task: Optional[asyncio.Task] = None
+        self._backup_task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._abort = False
+        self._remaining: Optional[int] = None
+    
+    # === ЖИЗНЕННЫЙ ЦИКЛ ===
+    
+    def start(self):
+        """Запуск копирования по расписанию (BACKUP_INTERVAL_HOURS=0 - только вручную)"""
+        if self._task is None and self.interval > 0:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logging.info(f"Резервное копирование по расписанию: каждые {self.interval / 3600:g} ч")
+    
+    async def stop(self, timeout: float = 5.0):
+        """Остановка расписания; незавершенное копирование прерывается"""
+        self._stopping = True
+        self._wakeup.set()
+        
+        if self._backup_task is not None and not self._backup_task.done():
+            self._abort = True
+            try:
+                await asyncio.wait_for(asyncio.shield(self._backup_task), timeout)
+            except asyncio.TimeoutError:
+                logging.warning("Резервное копирование не завершилось при остановке")
+            except Exception as e:
+                logging.error(f"Ошибка остановки резервного копирования: {e}")
+        
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _run(self):
+        while not self._stopping:
+            delay = self._seconds_until_due()
+            if delay <= 0:
+                # Копия, запущенная администратором, тоже считается
+                self.trigger()
+                await asyncio.shield(self._backup_task)
+                if not self.last_error:
+                    continue
+                # Неудача - повторяем позже, а не сразу
+                delay = min(self.interval, 600.0)
+            
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+    
+    def _seconds_until_due(self) -> float:
+        """Время до следующей копии: от последней копии (в том числе прошлого запуска)"""
+        backups = self.list_backups()
+        if not backups:
+            return 0.0
+        return max(0.0, os.path.getmtime(backups[-1]) + self.interval - time.time())
+    
+    # === КОПИРОВАНИЕ ===
+    
+    def trigger(self) -> bool:
+        """Запуск копирования в фоне; False - копирование уже идет"""
+        if self.running:
+            return False
+        
+        self.running = True
+        self.started_at = time.time()
+        self.pages_total = self.pages_done = self.restarts = 0
+        self._abort = False
+        self._remaining = None
+        self._backup_task = asyncio.create_task(self._backup())
+        return True
+    
+    async def _backup(self) -> Optional[Dict[str, Any]]:
+        try:
+            result = await asyncio.to_thread(self._create_backup)
+            self.last_backup = result
+            self.last_error = None
+            logging.info(
+                f"Резервная копия создана: {result['path']} ({result['size'] / 1024:.0f} КБ "
+                f"за {result['duration']:.1f} с, перезапусков: {result['restarts']})"
+            )
+            self._rotate()
+            return result
+        except BackupAborted as e:
+            self.last_error = str(e)
+            logging.info(f"{e}: бот останавливается")
+            return None
+        except Exception as e:
+            self.last_error = str(e)
+            logging.error(f"Ошибка создания резервной копии: {e}")
+            return None
+        finally:
+            self.running = False
+    
+    def _create_backup(self) -> Dict[str, Any]:
+        """Копирование, проверка, сжатие и контрольная сумма (в отдельном потоке)"""
+        os.makedirs(self.backup_dir, exist_ok=True)
+        name = f"{self.prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db"
+        raw_path = os.path.join(self.backup_dir, f"{name}.partial")
+        gz_path = os.path.join(self.backup_dir, f"{name}.gz")
+        started = time.monotonic()
+        
+        try:
+            self._copy_database(raw_path)
+            
+            check = sqlite3.connect(raw_path)
+            try:
+                result = check.execute("PRAGMA quick_check").fetchone()[0]
+            finally:
+                check.close()
+            if result != "ok":
+                raise RuntimeError(f"Копия не прошла проверку: {result}")
+            
+            tmp_path = f"{gz_path}.tmp"
+            with open(raw_path, 'rb') as source, gzip.open(tmp_path, 'wb', compresslevel=6) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            sha256 = self._file_sha256(tmp_path)
+            os.replace(tmp_path, gz_path)
+            with open(f"{gz_path}.sha256", 'w', encoding='utf-8') as f:
+                f.write(f"{sha256}  {os.path.basename(gz_path)}\n")
+        finally:
+            for path in (raw_path, f"{gz_path}.tmp"):
+                if os.path.exists(path):
+                    os.remove(path)
+        
+        return {
+            'path': gz_path,
+            'size': os.path.getsize(gz_path),
+            'sha256': sha256,
+            'pages': self.pages_total,
+            'restarts': self.restarts,
+            'duration': time.monotonic() - started,
+            'finished_at': time.time()
+        }
+    
+    def _copy_database(self, target_path: str):
+        source = sqlite3.connect(self.db_path)
+        target = sqlite3.connect(target_path)
+        try:
+            try:
+                source.backup(target, pages=self.pages_per_step, progress=self._on_progress,
+                              sleep=self.step_pause)
+            except BackupAborted:
+                if self._abort:
+                    raise
+                # БД постоянно меняется - докопируем одним шагом
+                logging.warning(f"Резервное копирование перезапускалось {self.restarts} раз, копируем целиком")
+                source.backup(target)
+        finally:
+            target.close()
+            source.close()
+    
+    def _on_progress(self, status: int, remaining: int, total: int):
+        """Вызывается SQLite после каждого шага копирования"""
+        if self._abort:
+            raise BackupAborted("Резервное копирование прервано")
+        
+        # Оставшихся страниц стало больше - источник изменился и копирование началось заново
+        if self._remaining is not None and remaining > self._remaining:
+            self.restarts += 1
+            if self.restarts > self.max_restarts:
+                raise BackupAborted("Слишком много перезапусков")
+        self._remaining = remaining
+        self.pages_total = total
+        self.pages_done = total - remaining
+    
+    @staticmethod
+    def _file_sha256(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    # === РОТАЦИЯ ===
+    
+    def list_backups(self) -> List[str]:
+        """Готовые копии, от старых к новым"""
+        return sorted(glob.glob(os.path.join(self.backup_dir, f"{self.prefix}_*.db.gz")))
+    
+    def _rotate(self):
+        for path in self.list_backups()[:-self.keep]:
+            try:
+                os.remove(path)
+                if os.path.exists(f"{path}.sha256"):
+                    os.remove(f"{path}.sha256")
+                logging.info(f"Удалена старая резервная копия: {path}")
+            except OSError as e:
+                logging.error(f"Ошибка удаления резервной копии {path}: {e}")
+    
+    def get_status(self) -> Dict[str, Any]:
+        """Состояние для админ-панели"""
+        return {
+            'running': self.running,
+            'started_at': self.started_at,
+            'pages_done': self.pages_done,
+            'pages_total': self.pages_total,
+            'restarts': self.restarts,
+            'last_backup': self.last_backup,
+            'last_error': self.last_error,
+            'backups': len(self.list_backups())
+        }
@@ -0,0 +1,174 @@
+"""
+Снимок каталога услуг и мастеров в памяти
+"""
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..database.connection import get_db_connection, handle_db_errors
+from ..utils.constants import LIMITS
+
+
+def catalog_fingerprint(services: Iterable) -> str:
+    """Хэш содержимого каталога услуг"""
+    digest = hashlib.sha1()
+    for service in services:
+        if isinstance(service, dict):
+            values = (service['id'], service['name'], service['price'],
+                      service['duration_minutes'], service['description'])
+        else:
+            values = tuple(service[:5])
+        digest.update(repr(values).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ServiceCatalog:
+    """
+    Неизменяемый снимок услуг и мастеров с индексами по ID и готовыми страницами.
+
+    Триггеры на таблицах services и masters увеличивают счетчик в catalog_version;
+    фоновая задача сверяет его и перезагружает снимок при изменении.
+    """
+
+    def __init__(self, db_path: str = "repair_bot.db",
+                 services_page_size: int = LIMITS['MAX_SERVICES_PER_PAGE'],
+                 masters_page_size: int = LIMITS['MAX_MASTERS_PER_PAGE']):
+        self.db_path = db_path
+        self.services_page_size = services_page_size
+        self.masters_page_size = masters_page_size
+
+        self.version: Optional[int] = None
+        self.fingerprint = catalog_fingerprint([])
+        self.services: List[Dict] = []
+        self.services_by_id: Dict[int, Dict] = {}
+        self.masters: List[Dict] = []
+        self.masters_by_id: Dict[int, Dict] = {}
+        self._service_pages: List[List[Dict]] = []
+        self._master_pages: List[List[Dict]] = []
+
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # === ЗАГРУЗКА ===
+
+    @handle_db_errors
+    async def load(self) -> bool:
+        """Загрузка снимка из БД"""
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute("SELECT version FROM catalog_version WHERE id = 1")
+            row = await cursor.fetchone()
+            version = row[0] if row else 0
+
+            cursor = await db.execute(
+                "SELECT id, name, price, duration_minutes, description, image_url FROM services ORDER BY id"
+            )
+            services = [dict(row) for row in await cursor.fetchall()]
+
+            cursor = await db.execute(
+                "SELECT id, name, experience_years, rating FROM masters ORDER BY id"
+            )
+            masters = [dict(row) for row in await cursor.fetchall()]
+
+        # Подменяем все структуры разом, чтобы обработчики не увидели половину снимка
+        self.services = services
+        self.services_by_id = {service['id']: service for service in services}
+        self._service_pages = self._split_pages(services, self.services_page_size)
+        self.masters = masters
+        self.masters_by_id = {master['id']: master for master in masters}
+        self._master_pages = self._split_pages(masters, self.masters_page_size)
+        self.fingerprint = catalog_fingerprint(services)
+        self.version = version
+
+        logging.info(f"Каталог загружен: версия {version}, услуг {len(services)}, мастеров {len(masters)}")
+        return True
+
+    @handle_db_errors
+    async def _read_version(self) -> Optional[int]:
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute("SELECT version FROM catalog_version WHERE id = 1")
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
+    async def refresh_if_changed(self) -> bool:
+        """Перезагрузка снимка, если таблицы каталога изменились"""
+        version = await self._read_version()
+        if version is None or version == self.version:
+            return False
+        return bool(await self.load())
+
+    async def _refresh_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.refresh_if_changed()
+            except Exception as e:
+                logging.error(f"Ошибка обновления каталога: {e}")
+
+    def start_auto_refresh(self, interval: float = 30.0):
+        """Запуск фоновой проверки версии каталога"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_loop(interval))
+
+    async def stop_auto_refresh(self):
+        """Остановка фоновой проверки"""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    @staticmethod
+    def _split_pages(items: List[Dict], page_size: int) -> List[List[Dict]]:
+        return [items[i:i + page_size] for i in range(0, len(items), page_size)]
+
+    # === УСЛУГИ ===
+
+    @property
+    def services_count(self) -> int:
+        return len(self.services)
+
+    @property
+    def services_total_pages(self) -> int:
+        return len(self._service_pages)
+
+    def get_services_page(self, page: int) -> List[Dict]:
+        """Страница услуг"""
+        if 0 <= page < len(self._service_pages):
+            return self._service_pages[page]
+        return []
+
+    def get_service(self, service_id: int) -> Optional[Dict]:
+        """Услуга по ID"""
+        return self.services_by_id.get(service_id)
+
+    def get_services_by_ids(self, service_ids: Iterable[int]) -> List[Dict]:
+        """Существующие услуги из списка ID (порядок сохраняется)"""
+        return [self.services_by_id[sid] for sid in service_ids if sid in self.services_by_id]
+
+    def calculate_totals(self, service_ids: Iterable[int]) -> Tuple[int, int]:
+        """Общая стоимость и длительность услуг"""
+        services = self.get_services_by_ids(service_ids)
+        return (sum(service['price'] for service in services),
+                sum(service['duration_minutes'] for service in services))
+
+    # === МАСТЕРА ===
+
+    @property
+    def masters_count(self) -> int:
+        return len(self.masters)
+
+    @property
+    def masters_total_pages(self) -> int:
+        return len(self._master_pages)
+
+    def get_masters_page(self, page: int) -> List[Dict]:
+        """Страница мастеров"""
+        if 0 <= page < len(self._master_pages):
+            return self._master_pages[page]
+        return []
+
+    def get_master(self, master_id: int) -> Optional[Dict]:
+        """Мастер по ID"""
+        return self.masters_by_id.get(master_id)
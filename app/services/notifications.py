@@ -0,0 +1,265 @@
+"""
+Доставка уведомлений пользователям из очереди notification_outbox
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNotFound,
+    TelegramRetryAfter, TelegramUnauthorizedError
+)
+
+from ..database.connection import get_db_connection, handle_db_errors
+
+# Ошибки, после которых повторять отправку бессмысленно (бот заблокирован, чат не найден)
+PERMANENT_ERRORS = (TelegramForbiddenError, TelegramBadRequest, TelegramNotFound, TelegramUnauthorizedError)
+
+
+class NotificationService:
+    """
+    Фоновый воркер доставки уведомлений.
+    
+    Уведомления пишутся в notification_outbox в одной транзакции с изменением
+    данных, поэтому переживают перезапуск бота. Воркер отправляет их с общим
+    ограничением скорости и не чаще одного сообщения в чат за chat_interval,
+    соблюдает TelegramRetryAfter и повторяет временные ошибки с
+    экспоненциальной задержкой.
+    """
+    
+    def __init__(self, bot: Bot, db_path: str, rate_per_second: float = 25.0,
+                 chat_interval: float = 1.0, max_attempts: int = 8,
+                 poll_interval: float = 5.0, batch_size: int = 50,
+                 base_backoff: float = 2.0, max_backoff: float = 600.0,
+                 retention_days: int = 7):
+        self.bot = bot
+        self.db_path = db_path
+        self.send_interval = 1.0 / rate_per_second
+        self.chat_interval = chat_interval
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.retention = retention_days * 86400
+        
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._next_send_at = 0.0
+        self._paused_until = 0.0
+        self._chat_next_at: Dict[int, float] = {}
+        self._last_cleanup = 0.0
+    
+    # === ЖИЗНЕННЫЙ ЦИКЛ ===
+    
+    def start(self):
+        """Запуск воркера доставки"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logging.info("Воркер уведомлений запущен")
+    
+    async def stop(self, timeout: float = 5.0):
+        """Остановка воркера; недоставленное остается в очереди до следующего запуска"""
+        if self._task is None:
+            return
+        
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        except Exception as e:
+            logging.error(f"Ошибка остановки воркера уведомлений: {e}")
+        self._task = None
+        logging.info("Воркер уведомлений остановлен")
+    
+    def wake(self):
+        """Сигнал о новых уведомлениях в очереди"""
+        self._wakeup.set()
+    
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await self.deliver_due()
+                await self._cleanup_if_needed()
+                delay = await self._seconds_until_next()
+                if delay is None:
+                    delay = self.poll_interval
+            except Exception as e:
+                logging.error(f"Ошибка в воркере уведомлений: {e}")
+                delay = self.poll_interval
+            
+            if self._stopping:
+                break
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+            self._wakeup.clear()
+    
+    # === ДОСТАВКА ===
+    
+    async def deliver_due(self) -> int:
+        """Отправка всех уведомлений, срок которых наступил; возвращает число отправленных"""
+        delivered = 0
+        while not self._stopping:
+            batch = await self._fetch_due(time.time())
+            if not batch:
+                break
+            
+            for item in batch:
+                if self._stopping:
+                    break
+                if await self._deliver(item):
+                    delivered += 1
+            
+            # Глобальная пауза от Telegram: остальное дождется следующего прохода
+            if self._paused_until > time.time() or len(batch) < self.batch_size:
+                break
+        return delivered
+    
+    async def _deliver(self, item: Dict[str, Any]) -> bool:
+        chat_id = item['chat_id']
+        now = time.time()
+        
+        # Не чаще одного сообщения в чат за chat_interval - переносим, не блокируя остальные чаты
+        chat_next_at = max(self._chat_next_at.get(chat_id, 0.0), self._paused_until)
+        if chat_next_at > now:
+            await self._reschedule(item['id'], chat_next_at, item['attempts'])
+            return False
+        
+        await self._wait_for_rate_limit()
+        
+        try:
+            await self.bot.send_message(chat_id, item['text'])
+        except TelegramRetryAfter as e:
+            # Попытка не засчитывается: Telegram просит подождать
+            self._paused_until = time.time() + e.retry_after
+            self.retried += 1
+            logging.warning(f"Уведомления: ограничение Telegram, пауза {e.retry_after} с")
+            await self._reschedule(item['id'], self._paused_until, item['attempts'], str(e))
+            return False
+        except PERMANENT_ERRORS as e:
+            self.failed += 1
+            logging.warning(f"Уведомление {item['id']} для чата {chat_id} не доставлено: {e}")
+            await self._mark_failed(item['id'], item['attempts'] + 1, str(e))
+            return False
+        except Exception as e:
+            await self._retry_later(item, e)
+            return False
+        finally:
+            self._chat_next_at[chat_id] = time.time() + self.chat_interval
+        
+        self.sent += 1
+        await self._mark_sent(item['id'], item['attempts'] + 1)
+        return True
+    
+    async def _wait_for_rate_limit(self):
+        """Глобальное ограничение скорости отправки"""
+        now = time.monotonic()
+        if self._next_send_at > now:
+            await asyncio.sleep(self._next_send_at - now)
+            now = time.monotonic()
+        self._next_send_at = max(now, self._next_send_at) + self.send_interval
+    
+    async def _retry_later(self, item: Dict[str, Any], error: Exception):
+        """Временная ошибка (сеть, 5xx): экспоненциальная задержка с разбросом"""
+        attempts = item['attempts'] + 1
+        if attempts >= self.max_attempts:
+            self.failed += 1
+            logging.error(f"Уведомление {item['id']} не доставлено после {attempts} попыток: {error}")
+            await self._mark_failed(item['id'], attempts, str(error))
+            return
+        
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (attempts - 1))
+        delay *= random.uniform(0.8, 1.2)
+        self.retried += 1
+        logging.warning(f"Уведомление {item['id']}: попытка {attempts} неудачна ({error}), повтор через {delay:.0f} с")
+        await self._reschedule(item['id'], time.time() + delay, attempts, str(error))
+    
+    # === ОЧЕРЕДЬ В БД ===
+    
+    @handle_db_errors
+    async def _fetch_due(self, now: float) -> List[Dict[str, Any]]:
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute('''
+                SELECT id, chat_id, text, attempts FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id
+                LIMIT ?
+            ''', (now, self.batch_size))
+            return [dict(row) for row in await cursor.fetchall()]
+    
+    @handle_db_errors
+    async def _seconds_until_next(self) -> float:
+        """Время до ближайшего отложенного уведомления (не больше poll_interval)"""
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT MIN(next_attempt_at) FROM notification_outbox WHERE status = 'pending'"
+            )
+            row = await cursor.fetchone()
+        if row is None or row[0] is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, row[0] - time.time()))
+    
+    @handle_db_errors
+    async def _mark_sent(self, notification_id: int, attempts: int):
+        async with get_db_connection(self.db_path) as db:
+            await db.execute(
+                "UPDATE notification_outbox SET status = 'sent', attempts = ?, sent_at = ?, last_error = NULL "
+                "WHERE id = ?",
+                (attempts, time.time(), notification_id)
+            )
+            await db.commit()
+    
+    @handle_db_errors
+    async def _mark_failed(self, notification_id: int, attempts: int, error: str):
+        async with get_db_connection(self.db_path) as db:
+            await db.execute(
+                "UPDATE notification_outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                (attempts, error[:500], notification_id)
+            )
+            await db.commit()
+    
+    @handle_db_errors
+    async def _reschedule(self, notification_id: int, next_attempt_at: float, attempts: int,
+                          error: Optional[str] = None):
+        async with get_db_connection(self.db_path) as db:
+            await db.execute(
+                "UPDATE notification_outbox SET next_attempt_at = ?, attempts = ?, "
+                "last_error = COALESCE(?, last_error) WHERE id = ?",
+                (next_attempt_at, attempts, error[:500] if error else None, notification_id)
+            )
+            await db.commit()
+    
+    async def _cleanup_if_needed(self):
+        """Раз в час удаляем давно доставленные уведомления"""
+        now = time.time()
+        if now - self._last_cleanup < 3600:
+            return
+        self._last_cleanup = now
+        await self._delete_sent_before(now - self.retention)
+    
+    @handle_db_errors
+    async def _delete_sent_before(self, timestamp: float):
+        async with get_db_connection(self.db_path) as db:
+            await db.execute(
+                "DELETE FROM notification_outbox WHERE status = 'sent' AND sent_at < ?",
+                (timestamp,)
+            )
+            await db.commit()
+    
+    def get_stats(self) -> Dict[str, int]:
+        """Статистика доставки с момента запуска"""
+        return {'sent': self.sent, 'failed': self.failed, 'retried': self.retried}
@@ -2,18 +2,22 @@
 Сервис для работы с заказами
 """
 import logging
-import random
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional, Tuple
 from ..database.queries import DatabaseQueries
-from ..utils.constants import ORDER_STATUSES, ORDER_STATUS_EMOJI
+from .catalog import ServiceCatalog
+from .scheduler import MasterScheduler
+from ..utils.constants import ORDER_STATUSES, ORDER_STATUS_EMOJI, DEFAULT_ORDER_DURATION_MINUTES
 
 
 class OrderService:
     """Сервис для управления заказами"""
     
-    def __init__(self, db_queries: DatabaseQueries):
+    def __init__(self, db_queries: DatabaseQueries, catalog: ServiceCatalog,
+                 scheduler: Optional[MasterScheduler] = None):
         self.db_queries = db_queries
+        self.catalog = catalog
+        self.scheduler = scheduler
     
     async def create_order_with_validation(self, user_id: int, service_ids: List[int], 
                                          order_date: str, order_time: str, 
@@ -36,7 +40,7 @@ class OrderService:
                 }
             
             # Валидируем услуги
-            services_validation = await self._validate_services(service_ids)
+            services_validation = self._validate_services(service_ids)
             if not services_validation['valid']:
                 return {
                     'success': False,
@@ -55,31 +59,46 @@ class OrderService:
                     'details': {}
                 }
             
-            # Выбираем мастера
-            master = await self._assign_master()
-            if not master:
+            # Кандидаты в мастера: свободные на это время, лучший первым
+            master_ids = await self._assign_master(order_date, order_time, services_validation['total_duration'])
+            if not master_ids:
                 return {
                     'success': False,
                     'order_id': None,
-                    'message': 'Нет доступных мастеров',
+                    'message': 'Нет свободных мастеров на это время',
                     'details': {}
                 }
             
             # Вычисляем стоимость
             total_cost = services_validation['total_cost']
             
-            # Создаем заказ
-            order_id = await self.db_queries.create_order(
+            # Создаем заказ; занятость мастера проверяется в той же транзакции
+            result = await self.db_queries.create_order_in_slot(
                 user_id=user_id,
-                master_id=master['id'],
+                master_ids=master_ids,
                 address=address,
                 order_date=order_date,
                 order_time=order_time,
                 total_cost=total_cost,
                 service_ids=service_ids
             )
+            order_id = result['order_id'] if result else None
+            
+            if result and not order_id:
+                if self.scheduler:
+                    self.scheduler.invalidate(order_date)
+                return {
+                    'success': False,
+                    'order_id': None,
+                    'message': 'Это время уже занято, выберите другое',
+                    'details': {}
+                }
             
             if order_id:
+                master = self.catalog.get_master(result['master_id']) or {'name': '', 'rating': 0}
+                if self.scheduler:
+                    self.scheduler.reserve(order_id, order_date, order_time,
+                                           result['duration_minutes'], result['master_id'])
                 return {
                     'success': True,
                     'order_id': order_id,
@@ -109,7 +128,7 @@ class OrderService:
                 'details': {}
             }
     
-    async def _validate_services(self, service_ids: List[int]) -> Dict:
+    def _validate_services(self, service_ids: List[int]) -> Dict:
         """Валидация списка услуг"""
         if not service_ids:
             return {
@@ -132,7 +151,7 @@ class OrderService:
         valid_services = []
         
         for service_id in service_ids:
-            service = await self.db_queries.get_service_by_id(service_id)
+            service = self.catalog.get_service(service_id)
             if not service:
                 return {
                     'valid': False,
@@ -194,16 +213,14 @@ class OrderService:
                 'message': 'Некорректный формат даты или времени'
             }
     
-    async def _assign_master(self) -> Optional[Dict]:
-        """Назначение мастера для заказа"""
-        masters = await self.db_queries.get_masters()
-        
-        if not masters:
-            return None
+    async def _assign_master(self, order_date: str, order_time: str, duration: int,
+                             limit: int = 5) -> List[int]:
+        """Свободные на это время мастера в порядке предпочтения (по загруженности и рейтингу)"""
+        if self.scheduler:
+            return await self.scheduler.free_master_ids(order_date, order_time, duration, limit)
         
-        # Простая логика: выбираем случайного мастера
-        # В будущем можно усложнить (по загруженности, рейтингу, специализации)
-        return random.choice(masters)
+        # Без планировщика занятость проверит только транзакция создания заказа
+        return [master['id'] for master in self.catalog.masters][:limit]
     
     async def get_order_summary(self, order_id: int, user_id: int) -> Optional[Dict]:
         """Получение детального резюме заказа"""
@@ -325,7 +342,7 @@ class OrderService:
     async def estimate_order_cost(self, service_ids: List[int]) -> Dict:
         """Оценка стоимости заказа до создания"""
         try:
-            validation = await self._validate_services(service_ids)
+            validation = self._validate_services(service_ids)
             
             if not validation['valid']:
                 return {
@@ -366,11 +383,13 @@ class OrderService:
         else:
             return f"{hours} ч {remaining_minutes} мин"
     
-    async def get_available_time_slots(self, date: str) -> List[str]:
-        """Получение доступных временных слотов на дату"""
+    async def get_available_time_slots(self, date: str,
+                                       duration: int = DEFAULT_ORDER_DURATION_MINUTES) -> List[str]:
+        """Получение доступных временных слотов на дату (есть свободный мастер на duration минут)"""
         try:
-            # В будущем можно проверять занятость мастеров
-            # Пока возвращаем все стандартные слоты
+            if self.scheduler:
+                return await self.scheduler.free_slots(date, duration)
+            
             from ..utils.constants import TIME_SLOTS
             
             # Если это сегодня, убираем прошедшие слоты
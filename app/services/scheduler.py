@@ -0,0 +1,329 @@
+"""
+Планировщик мастеров: занятость по дням и подбор свободного мастера
+"""
+import asyncio
+import bisect
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from ..database.connection import get_db_connection, handle_db_errors
+from ..utils.constants import ACTIVE_ORDER_STATUSES, BOOKING_DAYS, DEFAULT_ORDER_DURATION_MINUTES, TIME_SLOTS
+from .catalog import ServiceCatalog
+
+
+def to_minutes(time_str: str) -> int:
+    """'HH:MM' -> минуты от начала суток"""
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class MasterDay:
+    """
+    Занятость мастеров на один день.
+    
+    У каждого мастера - отсортированный по началу список интервалов
+    (начало, конец, ID заказа) в минутах; проверка пересечения - бинарный
+    поиск. Рейтинг мастеров (занятость за день, затем рейтинг) хранится
+    отсортированным и обновляется бинарным поиском при каждой записи.
+    
+    Для клавиатур дня ведется битовая карта слоты × мастера: busy[i] -
+    маска мастеров, занятых в слоте i (слот длится до начала следующего).
+    Заказы начинаются в начале слота, поэтому проверка по карте совпадает
+    с проверкой по интервалам.
+    """
+    
+    def __init__(self, slot_starts: List[int]):
+        self.intervals: Dict[int, List[Tuple[int, int, int]]] = {}
+        self.load: Dict[int, int] = {}
+        self.ranking: List[Tuple[int, float, int]] = []
+        self._rating: Dict[int, float] = {}
+        self.catalog_version: Optional[int] = None
+        self.loaded_at = time.monotonic()
+    
+        self.slot_starts = slot_starts
+        self.busy: List[int] = [0] * len(slot_starts)
+        self.all_masters = 0
+        self._bits: Dict[int, int] = {}
+    
+    def set_masters(self, masters: Iterable[Dict], catalog_version: Optional[int]):
+        """Пересборка рейтинга и битовой карты (при загрузке дня и смене версии каталога)"""
+        self._rating = {master['id']: -(master['rating'] or 0.0) for master in masters}
+        self.ranking = sorted(
+            (self.load.get(master_id, 0), rating, master_id) for master_id, rating in self._rating.items()
+        )
+        self.catalog_version = catalog_version
+        
+        self._bits = {master_id: 1 << index for index, master_id in enumerate(sorted(self._rating))}
+        self.all_masters = (1 << len(self._bits)) - 1
+        self.busy = [0] * len(self.slot_starts)
+        for master_id, intervals in self.intervals.items():
+            for start, end, _ in intervals:
+                self._mark(master_id, start, end)
+    
+    def is_free(self, master_id: int, start: int, end: int) -> bool:
+        intervals = self.intervals.get(master_id)
+        if not intervals:
+            return True
+        # Первый интервал, начинающийся не раньше конца нового; пересечься может только предыдущий
+        index = bisect.bisect_left(intervals, (end,))
+        return index == 0 or intervals[index - 1][1] <= start
+    
+    def free_masters(self, start: int, end: int) -> Iterable[int]:
+        """Свободные мастера от наименее загруженного"""
+        for _, _, master_id in self.ranking:
+            if self.is_free(master_id, start, end):
+                yield master_id
+    
+    def has_capacity(self, slot_index: int, duration: int) -> bool:
+        """Есть ли мастер, свободный во всех слотах, которые займет заказ с начала слота"""
+        start = self.slot_starts[slot_index]
+        busy = 0
+        for index in self._slot_range(start, start + duration):
+            busy |= self.busy[index]
+        return busy != self.all_masters
+    
+    def add(self, master_id: int, start: int, end: int, order_id: int):
+        bisect.insort(self.intervals.setdefault(master_id, []), (start, end, order_id))
+        self._change_load(master_id, end - start)
+        self._mark(master_id, start, end)
+    
+    def remove(self, master_id: int, start: int, end: int, order_id: int):
+        intervals = self.intervals.get(master_id, [])
+        index = bisect.bisect_left(intervals, (start, end, order_id))
+        if index < len(intervals) and intervals[index] == (start, end, order_id):
+            del intervals[index]
+            self._change_load(master_id, start - end)
+            
+            # Снимаем бит в слотах заказа и восстанавливаем его для оставшихся заказов мастера
+            bit = self._bits.get(master_id, 0)
+            for slot_index in self._slot_range(start, end):
+                self.busy[slot_index] &= ~bit
+            for other_start, other_end, _ in intervals:
+                self._mark(master_id, other_start, other_end)
+    
+    def _slot_range(self, start: int, end: int) -> range:
+        """Индексы слотов, с которыми пересекается интервал [start, end)"""
+        first = max(bisect.bisect_right(self.slot_starts, start) - 1, 0)
+        return range(first, bisect.bisect_left(self.slot_starts, end))
+    
+    def _mark(self, master_id: int, start: int, end: int):
+        bit = self._bits.get(master_id)
+        if bit is None:
+            return  # мастера нет в каталоге - в подборе не участвует
+        for slot_index in self._slot_range(start, end):
+            self.busy[slot_index] |= bit
+    
+    def _change_load(self, master_id: int, delta: int):
+        old_load = self.load.get(master_id, 0)
+        self.load[master_id] = old_load + delta
+        
+        rating = self._rating.get(master_id)
+        if rating is None:
+            return  # мастера нет в каталоге - в подборе не участвует
+        index = bisect.bisect_left(self.ranking, (old_load, rating, master_id))
+        if index < len(self.ranking) and self.ranking[index] == (old_load, rating, master_id):
+            del self.ranking[index]
+        bisect.insort(self.ranking, (old_load + delta, rating, master_id))
+
+
+class MasterScheduler:
+    """
+    Индекс занятости мастеров по дням в памяти.
+    
+    Дни окна записи загружаются из orders при запуске (ensure_days) и
+    обновляются при записи и смене статуса заказов; клавиатуры даты и
+    времени строятся по индексу без запросов к БД. Индекс - быстрый путь для подбора мастера и
+    свободных слотов; окончательная проверка пересечений выполняется в
+    транзакции создания заказа (DatabaseQueries.create_order_in_slot), поэтому
+    одновременные записи и другие экземпляры бота не приводят к двойному
+    бронированию. Дни старше max_age перечитываются из БД.
+    """
+    
+    def __init__(self, db_path: str, catalog: ServiceCatalog, slots: List[str] = TIME_SLOTS,
+                 max_age: float = 300.0):
+        self.db_path = db_path
+        self.catalog = catalog
+        self.slots = list(slots)
+        self._slot_starts = [to_minutes(slot) for slot in self.slots]
+        self.max_age = max_age
+        self._days: Dict[str, MasterDay] = {}
+        # ID заказа -> (день, мастер, начало, конец) для освобождения времени
+        self._orders: Dict[int, Tuple[str, int, int, int]] = {}
+        self._load_lock = asyncio.Lock()
+        # Вызывается после учета нового заказа: (ID заказа, день, время, длительность, мастер)
+        self.on_reserved: Optional[Callable[[int, str, str, int, int], None]] = None
+    
+    # === ИНДЕКС ===
+    
+    @handle_db_errors
+    async def _load_days_orders(self, days: List[str]) -> List[Tuple[str, int, int, str, int]]:
+        day_placeholders = ", ".join("?" * len(days))
+        status_placeholders = ", ".join("?" * len(ACTIVE_ORDER_STATUSES))
+        async with get_db_connection(self.db_path) as db:
+            cursor = await db.execute(f"""
+                SELECT order_date, id, master_id, order_time, COALESCE(duration_minutes, ?)
+                FROM orders
+                WHERE order_date IN ({day_placeholders}) AND status IN ({status_placeholders})
+            """, (DEFAULT_ORDER_DURATION_MINUTES, *days, *ACTIVE_ORDER_STATUSES))
+            return [tuple(row) for row in await cursor.fetchall()]
+    
+    def _is_stale(self, day: str) -> bool:
+        schedule = self._days.get(day)
+        return schedule is None or time.monotonic() - schedule.loaded_at > self.max_age
+    
+    async def ensure_days(self, days: List[str]) -> bool:
+        """Загрузка отсутствующих и устаревших дней одним запросом; False - БД недоступна"""
+        if not any(self._is_stale(day) for day in days):
+            return True
+        
+        async with self._load_lock:
+            stale = [day for day in days if self._is_stale(day)]
+            if not stale:
+                return True
+            rows = await self._load_days_orders(stale)
+            if rows is None:
+                return False
+            
+            rows_by_day: Dict[str, List[Tuple[int, int, str, int]]] = {day: [] for day in stale}
+            for order_date, *row in rows:
+                rows_by_day[order_date].append(tuple(row))
+            for day, day_rows in rows_by_day.items():
+                self._build_day(day, day_rows)
+            
+            # Прошедшие дни больше не нужны
+            today = datetime.now().strftime('%Y-%m-%d')
+            for old_day in [d for d in self._days if d < today]:
+                self._forget_day(old_day)
+        return True
+    
+    async def _get_day(self, day: str) -> Optional[MasterDay]:
+        await self.ensure_days([day])
+        return self._current_day(day)
+    
+    def _current_day(self, day: str) -> Optional[MasterDay]:
+        """День из индекса без обращения к БД (None - не загружен)"""
+        schedule = self._days.get(day)
+        if schedule is not None and schedule.catalog_version != self.catalog.version:
+            schedule.set_masters(self.catalog.masters, self.catalog.version)
+        return schedule
+    
+    def _build_day(self, day: str, rows: List[Tuple[int, int, str, int]]) -> MasterDay:
+        self._forget_day(day)
+        schedule = MasterDay(self._slot_starts)
+        schedule.set_masters(self.catalog.masters, self.catalog.version)
+        for order_id, master_id, order_time, duration in rows:
+            start = to_minutes(order_time)
+            schedule.add(master_id, start, start + duration, order_id)
+            self._orders[order_id] = (day, master_id, start, start + duration)
+        self._days[day] = schedule
+        return schedule
+    
+    def _forget_day(self, day: str):
+        schedule = self._days.pop(day, None)
+        if schedule is None:
+            return
+        for intervals in schedule.intervals.values():
+            for _, _, order_id in intervals:
+                self._orders.pop(order_id, None)
+    
+    def invalidate(self, day: str):
+        """Сброс дня: при следующем обращении он перечитывается из БД"""
+        self._forget_day(day)
+    
+    # === ПОДБОР ===
+    
+    async def free_master_ids(self, day: str, order_time: str, duration: int,
+                              limit: Optional[int] = None) -> List[int]:
+        """Свободные на это время мастера, лучший первым (наименьшая занятость, затем рейтинг)"""
+        schedule = await self._get_day(day)
+        if schedule is None:
+            # Индекс недоступен - решит проверка в транзакции
+            return [master['id'] for master in self.catalog.masters][:limit]
+        
+        start = to_minutes(order_time)
+        result = []
+        for master_id in schedule.free_masters(start, start + duration):
+            result.append(master_id)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+    
+    async def find_master(self, day: str, order_time: str, duration: int) -> Optional[Dict]:
+        """Лучший свободный мастер или None"""
+        master_ids = await self.free_master_ids(day, order_time, duration, limit=1)
+        return self.catalog.get_master(master_ids[0]) if master_ids else None
+    
+    async def is_slot_free(self, day: str, order_time: str, duration: int) -> bool:
+        """Есть ли хотя бы один свободный мастер"""
+        return bool(await self.free_master_ids(day, order_time, duration, limit=1))
+    
+    async def free_slots(self, day: str, duration: int) -> List[str]:
+        """Слоты TIME_SLOTS, на которые есть свободный мастер (сегодня - только будущие)"""
+        now = datetime.now()
+        await self.ensure_days([day])
+        slots = self.available_slots([day], duration)
+        if day == now.strftime('%Y-%m-%d'):
+            slots = [slot for slot in slots if slot > now.strftime('%H:%M')]
+        return slots
+        
+    # === ДОСТУПНОСТЬ ДЛЯ КЛАВИАТУР (без запросов к БД) ===
+        
+    def booking_days(self) -> List[str]:
+        """Дни, доступные для записи: с завтрашнего на BOOKING_DAYS вперед"""
+        today = datetime.now().date()
+        return [(today + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(1, BOOKING_DAYS + 1)]
+    
+    def _day_has_capacity(self, day: str, slot_index: int, duration: int) -> bool:
+        schedule = self._current_day(day)
+        # Незагруженный день считаем свободным - занятость проверит транзакция
+        return schedule is None or schedule.has_capacity(slot_index, duration)
+    
+    def available_slots(self, days: List[str], duration: int) -> List[str]:
+        """Слоты, на которые есть свободный мастер хотя бы в один из дней"""
+        return [
+            slot for slot_index, slot in enumerate(self.slots)
+            if any(self._day_has_capacity(day, slot_index, duration) for day in days)
+        ]
+    
+    def available_dates(self, days: List[str], order_time: str, duration: int) -> List[str]:
+        """Дни, в которые на order_time есть свободный мастер"""
+        if order_time not in self.slots:
+            return list(days)
+        slot_index = self.slots.index(order_time)
+        return [day for day in days if self._day_has_capacity(day, slot_index, duration)]
+    
+    # === ИЗМЕНЕНИЯ ===
+    
+    def reserve(self, order_id: int, day: str, order_time: str, duration: int, master_id: int,
+                broadcast: bool = True):
+        """Учет созданного заказа (после коммита транзакции); broadcast=False - без on_reserved"""
+        if broadcast and self.on_reserved:
+            self.on_reserved(order_id, day, order_time, duration, master_id)
+        
+        if order_id in self._orders:
+            return  # день уже перечитан из БД вместе с заказом
+        schedule = self._days.get(day)
+        if schedule is None:
+            return  # день не загружен - прочитается из БД вместе с заказом
+        start = to_minutes(order_time)
+        schedule.add(master_id, start, start + duration, order_id)
+        self._orders[order_id] = (day, master_id, start, start + duration)
+    
+    def release(self, order_ids: Iterable[int]):
+        """Освобождение времени отмененных или завершенных заказов"""
+        for order_id in order_ids:
+            entry = self._orders.pop(order_id, None)
+            if entry is None:
+                continue
+            day, master_id, start, end = entry
+            schedule = self._days.get(day)
+            if schedule is not None:
+                schedule.remove(master_id, start, end, order_id)
+    
+    def on_order_status_changed(self, order_ids: List[int], status: str):
+        """Обработчик DatabaseQueries.on_order_status_changed"""
+        if status not in ACTIVE_ORDER_STATUSES:
+            self.release(order_ids)
+            logging.debug(f"Освобождено время заказов {order_ids} (статус {status})")
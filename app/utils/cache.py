@@ -0,0 +1,65 @@
+"""
+Кэши в памяти
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """LRU-кэш с ограничением размера и временем жизни записей"""
+    
+    def __init__(self, max_size: int = 1000, ttl: float = 300.0):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Получение значения (просроченные записи удаляются)"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Сохранение значения с вытеснением самых старых записей"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Удаление записи"""
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+    
+    def clear(self):
+        """Очистка кэша"""
+        self._data.clear()
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика попаданий"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0.0
+        }
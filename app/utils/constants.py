@@ -17,6 +17,12 @@ ORDER_STATUSES = {
     ORDER_STATUS_CANCELLED: "Отменен"
 }
 
+# Статусы, при которых время мастера занято
+ACTIVE_ORDER_STATUSES = (ORDER_STATUS_PENDING, ORDER_STATUS_CONFIRMED, ORDER_STATUS_IN_PROGRESS)
+
+# Длительность заказа, для которого она неизвестна (старые заказы без услуг), мин
+DEFAULT_ORDER_DURATION_MINUTES = 60
+
 # Эмодзи для статусов
 ORDER_STATUS_EMOJI = {
     ORDER_STATUS_PENDING: "⏳",
@@ -26,12 +32,23 @@ ORDER_STATUS_EMOJI = {
     ORDER_STATUS_CANCELLED: "❌"
 }
 
+# Уведомления пользователю при смене статуса заказа администратором
+ORDER_STATUS_NOTIFICATIONS = {
+    ORDER_STATUS_CONFIRMED: "✅ Ваш заказ №{order_id} подтвержден. Мастер приедет в назначенное время.",
+    ORDER_STATUS_IN_PROGRESS: "🔧 Мастер приступил к работе над заказом №{order_id}.",
+    ORDER_STATUS_COMPLETED: "✅ Заказ №{order_id} выполнен! Будем рады вашему отзыву в разделе «⭐ Отзывы».",
+    ORDER_STATUS_CANCELLED: "❌ Заказ №{order_id} отменен. Если это ошибка, напишите в поддержку."
+}
+
 # Временные слоты для записи
 TIME_SLOTS = [
     "10:00", "11:30", "13:00", "14:30", 
     "16:00", "17:30", "19:00", "20:30", "22:00"
 ]
 
+# На сколько дней вперед можно записаться (начиная с завтра)
+BOOKING_DAYS = 14
+
 # Сообщения об ошибках
 ERROR_MESSAGES = {
     'INVALID_PHONE': "❌ Некорректный номер телефона!\n\nПримеры правильного формата:\n• +7 900 123 45 67\n• 8 (900) 123-45-67\n• 79001234567\n\nПожалуйста, введите корректный номер:",
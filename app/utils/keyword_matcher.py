@@ -0,0 +1,156 @@
+"""
+Поиск ключевых слов по категориям (автомат Ахо-Корасик)
+"""
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple, Union
+
+from .text import stem_text
+
+# Ключевое слово: строка или (строка, вес)
+Keyword = Union[str, Tuple[str, float]]
+
+
+def prepare_text(text: str) -> str:
+    """
+    Текст для поиска: нормализованные основы слов через пробел
+    
+    «Компьютер тормозит, вирусы» -> «компьютер тормоз вирус»
+    """
+    return " ".join(stem_text(text))
+
+
+class KeywordMatcher:
+    """
+    Автомат Ахо-Корасик над основами слов.
+    
+    Ключевые слова и текст проходят одинаковую нормализацию и стемминг,
+    поэтому «вирус» находит «вирусы» и «вирусов», а «тормозит» - «тормозят».
+    Совпадение должно начинаться с начала слова и может заканчиваться
+    внутри слова (основа - префикс). Текст просматривается один раз
+    независимо от количества ключевых слов.
+    """
+    
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Ключевые слова, заканчивающиеся в состоянии (свои и по суффиксным ссылкам)
+        self._matches: List[List[int]] = [[]]
+        self._output: List[List[int]] = [[]]
+        # Ключевые слова: (основа, категория, вес)
+        self._keywords: List[Tuple[str, str, float]] = []
+        self._categories: List[str] = []
+        self._known: Set[Tuple[str, str]] = set()
+        self._compiled = False
+    
+    @classmethod
+    def from_patterns(cls, patterns: Dict[str, Dict]) -> "KeywordMatcher":
+        """Сборка автомата по таблице вида AI_PROBLEM_PATTERNS"""
+        matcher = cls()
+        for category, data in patterns.items():
+            matcher.add_category(category, data['keywords'])
+        matcher.compile()
+        return matcher
+    
+    def add_category(self, category: str, keywords: Iterable[Keyword]):
+        """
+        Добавление ключевых слов категории
+        
+        Вес по умолчанию - число слов во фразе: «низкий fps» точнее, чем «fps».
+        """
+        if category not in self._categories:
+            self._categories.append(category)
+        
+        for keyword in keywords:
+            if isinstance(keyword, str):
+                keyword, weight = keyword, None
+            else:
+                keyword, weight = keyword
+            
+            stem = prepare_text(keyword)
+            # «игры» и «игра» дают одну основу - считаем ее один раз
+            if not stem or (stem, category) in self._known:
+                continue
+            self._known.add((stem, category))
+            if weight is None:
+                weight = float(stem.count(" ") + 1)
+            
+            self._add(stem, len(self._keywords))
+            self._keywords.append((stem, category, weight))
+        self._compiled = False
+    
+    def _add(self, stem: str, keyword_id: int):
+        state = 0
+        for char in stem:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._matches.append([])
+            state = next_state
+        self._matches[state].append(keyword_id)
+    
+    def compile(self):
+        """Построение переходов по неудаче (обход в ширину)"""
+        self._output = [list(matches) for matches in self._matches]
+        queue = deque()
+        for state in self._goto[0].values():
+            self._fail[state] = 0
+            queue.append(state)
+        
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                # Совпадения более коротких суффиксов тоже заканчиваются здесь
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        
+        self._compiled = True
+    
+    @property
+    def categories(self) -> List[str]:
+        return list(self._categories)
+    
+    def __len__(self) -> int:
+        return len(self._keywords)
+    
+    def _find_prepared(self, text: str) -> Iterator[int]:
+        """ID найденных ключевых слов в подготовленном тексте"""
+        if not self._compiled:
+            self.compile()
+        
+        goto, fail, output, keywords = self._goto, self._fail, self._output, self._keywords
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            
+            for keyword_id in output[state]:
+                start = index - len(keywords[keyword_id][0]) + 1
+                if start == 0 or text[start - 1] == " ":
+                    yield keyword_id
+    
+    def find(self, text: str) -> List[str]:
+        """Найденные ключевые слова (основы) в порядке появления, без повторов"""
+        found = (self._keywords[keyword_id][0] for keyword_id in self._find_prepared(prepare_text(text)))
+        return list(dict.fromkeys(found))
+    
+    def score(self, text: str) -> Dict[str, float]:
+        """Сумма весов найденных ключевых слов по категориям (каждое слово учитывается один раз)"""
+        scores: Dict[str, float] = {}
+        for keyword_id in set(self._find_prepared(prepare_text(text))):
+            _, category, weight = self._keywords[keyword_id]
+            scores[category] = scores.get(category, 0.0) + weight
+        return scores
+    
+    def rank(self, text: str) -> List[Tuple[str, float]]:
+        """Категории по убыванию веса; при равенстве - в порядке добавления"""
+        scores = self.score(text)
+        order = {category: index for index, category in enumerate(self._categories)}
+        return sorted(scores.items(), key=lambda item: (-item[1], order[item[0]]))
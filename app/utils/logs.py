@@ -0,0 +1,193 @@
+"""
+Логирование через очередь: запись в файл и консоль в отдельном потоке
+"""
+import atexit
+import contextvars
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# В многопроцессном режиме видно, какой процесс (воркер) сделал запись
+CLUSTER_LOG_FORMAT = '%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s'
+
+# Контекст текущего обновления Telegram (заполняет log_context_middleware)
+update_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('update_id', default=None)
+user_id_var: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar('user_id', default=None)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет в запись update_id и user_id обрабатываемого обновления"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.update_id = update_id_var.get()
+        record.user_id = user_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Выборочная запись для шумных логгеров.
+    
+    rates - доля сохраняемых записей по имени логгера (учитываются и дочерние
+    логгеры, побеждает самое длинное совпадение). Сохраняется каждая N-я
+    запись, а не случайная: частота предсказуема. WARNING и выше пишутся всегда.
+    """
+    
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Самые длинные имена первыми - точнее совпадение
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self._counters: Dict[str, int] = {}
+        self._cache: Dict[str, Optional[int]] = {}
+    
+    def _every(self, name: str) -> Optional[int]:
+        """Каждую какую запись логгера сохранять (None - все)"""
+        if name not in self._cache:
+            every = None
+            for prefix, rate in self.rates:
+                if name == prefix or name.startswith(prefix + '.'):
+                    every = max(1, round(1 / rate)) if rate > 0 else 0
+                    break
+            self._cache[name] = every
+        return self._cache[name]
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        every = self._every(record.name)
+        if every is None:
+            return True
+        if every == 0:
+            return False
+        
+        count = self._counters.get(record.name, 0)
+        self._counters[record.name] = count + 1
+        return count % every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in ('update_id', 'user_id'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.processName != 'MainProcess':
+            entry['process'] = record.processName
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _gzip_namer(name: str) -> str:
+    return name + ".gz"
+
+
+def _gzip_rotator(source: str, dest: str):
+    """Сжатие ротированного файла (выполняется в потоке записи логов)"""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """'app.handlers.orders:0.01,aiogram.event:0.1' -> {имя логгера: доля}"""
+    rates = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, rate = item.rpartition(':')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def setup_queue_logging(level: int, log_file: str = 'bot.log', max_bytes: int = 10 * 1024 * 1024,
+                        backup_count: int = 5, json_format: bool = False,
+                        sampling: Optional[Dict[str, float]] = None,
+                        log_queue: Optional[Any] = None, listen: bool = True):
+    """
+    Настройка корневого логгера: QueueHandler без блокирующего I/O в вызывающем
+    коде и QueueListener, который пишет в консоль и в файл с ротацией по
+    размеру и сжатием старых файлов.
+    
+    log_queue - общая очередь процессов кластера (multiprocessing.Queue).
+    Воркеры вызывают функцию с listen=False: их записи только ставятся в
+    очередь, а в файл пишет один процесс приема обновлений.
+    """
+    global _listener
+    stop_queue_logging()
+    
+    cluster = log_queue is not None
+    log_queue = log_queue if cluster else queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # Фильтры работают до постановки в очередь: отброшенная запись не форматируется
+    if sampling:
+        queue_handler.addFilter(SamplingFilter(sampling))
+    queue_handler.addFilter(ContextFilter())
+    
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    
+    if not listen:
+        return
+    
+    text_format = CLUSTER_LOG_FORMAT if cluster else LOG_FORMAT
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    file_handler.namer = _gzip_namer
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(text_format))
+    
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(text_format))
+    
+    _listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def stop_queue_logging():
+    """Запись оставшихся в очереди сообщений и остановка потока логирования"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_queue_logging)
+
+
+async def log_context_middleware(handler, event, data):
+    """Outer-middleware обновлений: update_id и user_id для записей лога"""
+    user = data.get('event_from_user')
+    update_token = update_id_var.set(getattr(event, 'update_id', None))
+    user_token = user_id_var.set(user.id if user else None)
+    try:
+        return await handler(event, data)
+    finally:
+        update_id_var.reset(update_token)
+        user_id_var.reset(user_token)
@@ -0,0 +1,309 @@
+"""
+Метрики работы бота: задержки обработчиков, запросов к БД и к Gemini
+"""
+import bisect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[str, ...]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (как в Prometheus)"""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина - +Inf
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+    
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class TimedCounter:
+    """Гистограмма времени выполнения и счетчик ошибок для набора меток"""
+    
+    def __init__(self):
+        self.histograms: Dict[LabelKey, Histogram] = {}
+        self.errors: Dict[LabelKey, int] = {}
+    
+    def observe(self, labels: LabelKey, seconds: float, error: bool = False):
+        histogram = self.histograms.get(labels)
+        if histogram is None:
+            histogram = self.histograms[labels] = Histogram()
+            self.errors[labels] = 0
+        histogram.observe(seconds)
+        if error:
+            self.errors[labels] += 1
+    
+    @property
+    def total_calls(self) -> int:
+        return sum(histogram.count for histogram in self.histograms.values())
+    
+    @property
+    def total_errors(self) -> int:
+        return sum(self.errors.values())
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelKey, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_float(value: float) -> str:
+    return repr(float(value))
+
+
+class MetricsRegistry:
+    """Хранилище метрик процесса"""
+    
+    HANDLER_LABELS = ('event', 'router', 'handler')
+    DB_LABELS = ('query',)
+    AI_LABELS = ('status',)
+    
+    def __init__(self):
+        self.started_at = time.time()
+        self.handlers = TimedCounter()
+        self.db = TimedCounter()
+        self.ai = TimedCounter()
+        self.ai_first_token = TimedCounter()
+    
+    def reset(self):
+        """Сброс всех метрик"""
+        self.__init__()
+    
+    # === ЗАПИСЬ ===
+    
+    def observe_handler(self, event: str, router: str, handler: str, seconds: float, error: bool = False):
+        self.handlers.observe((event, router, handler), seconds, error)
+    
+    def observe_db(self, query: str, seconds: float, error: bool = False):
+        self.db.observe((query,), seconds, error)
+    
+    def observe_ai(self, status: str, seconds: float):
+        self.ai.observe((status,), seconds, error=status in ('timeout', 'error'))
+    
+    def observe_ai_first_token(self, seconds: float):
+        """Время до первого фрагмента потокового ответа (задержка, которую видит пользователь)"""
+        self.ai_first_token.observe((), seconds)
+    
+    # === ЭКСПОРТ ===
+    
+    def _render_timed(self, lines: List[str], name: str, help_text: str,
+                      label_names: Tuple[str, ...], counter: TimedCounter,
+                      errors_name: Optional[str] = None):
+        lines.append(f"# HELP {name}_seconds {help_text}")
+        lines.append(f"# TYPE {name}_seconds histogram")
+        for labels, histogram in sorted(counter.histograms.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                le = _format_labels(label_names, labels, f'le="{bound}"')
+                lines.append(f"{name}_seconds_bucket{le} {cumulative}")
+            le = _format_labels(label_names, labels, 'le="+Inf"')
+            lines.append(f"{name}_seconds_bucket{le} {histogram.count}")
+            lines.append(f"{name}_seconds_sum{_format_labels(label_names, labels)} {_format_float(histogram.sum)}")
+            lines.append(f"{name}_seconds_count{_format_labels(label_names, labels)} {histogram.count}")
+        
+        if errors_name:
+            lines.append(f"# HELP {errors_name} Количество завершившихся ошибкой вызовов")
+            lines.append(f"# TYPE {errors_name} counter")
+            for labels, errors in sorted(counter.errors.items()):
+                lines.append(f"{errors_name}{_format_labels(label_names, labels)} {errors}")
+    
+    def render_prometheus(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = [
+            "# HELP repairbot_uptime_seconds Время работы процесса",
+            "# TYPE repairbot_uptime_seconds gauge",
+            f"repairbot_uptime_seconds {_format_float(time.time() - self.started_at)}",
+        ]
+        self._render_timed(lines, "repairbot_handler_duration", "Время обработки обновления",
+                           self.HANDLER_LABELS, self.handlers, "repairbot_handler_errors_total")
+        self._render_timed(lines, "repairbot_db_query_duration", "Время выполнения запроса к БД",
+                           self.DB_LABELS, self.db, "repairbot_db_errors_total")
+        self._render_timed(lines, "repairbot_ai_request_duration",
+                           "Время запроса к Gemini (status: ok, timeout, error, cancelled)",
+                           self.AI_LABELS, self.ai)
+        self._render_timed(lines, "repairbot_ai_first_token",
+                           "Время до первого фрагмента потокового ответа Gemini",
+                           (), self.ai_first_token)
+        return "\n".join(lines) + "\n"
+    
+    def summary(self, top: int = 5) -> Dict[str, Any]:
+        """Краткая сводка для админ-команды"""
+        uptime = time.time() - self.started_at
+        handlers = sorted(
+            (
+                {
+                    'router': labels[1],
+                    'handler': labels[2],
+                    'calls': histogram.count,
+                    'errors': self.handlers.errors[labels],
+                    'p50': histogram.quantile(0.5),
+                    'p95': histogram.quantile(0.95),
+                }
+                for labels, histogram in self.handlers.histograms.items()
+            ),
+            key=lambda item: item['p95'],
+            reverse=True
+        )
+        db_queries = sorted(
+            (
+                {
+                    'query': labels[0],
+                    'calls': histogram.count,
+                    'errors': self.db.errors[labels],
+                    'total': histogram.sum,
+                    'mean': histogram.mean,
+                }
+                for labels, histogram in self.db.histograms.items()
+            ),
+            key=lambda item: item['total'],
+            reverse=True
+        )
+        ai_ok = self.ai.histograms.get(('ok',))
+        ai_first_token = self.ai_first_token.histograms.get(())
+        
+        return {
+            'uptime': uptime,
+            'updates': self.handlers.total_calls,
+            'updates_per_second': self.handlers.total_calls / uptime if uptime else 0.0,
+            'handler_errors': self.handlers.total_errors,
+            'slowest_handlers': handlers[:top],
+            'db_calls': self.db.total_calls,
+            'db_errors': self.db.total_errors,
+            'heaviest_queries': db_queries[:top],
+            'ai_calls': self.ai.total_calls,
+            'ai_errors': self.ai.total_errors,
+            'ai_p50': ai_ok.quantile(0.5) if ai_ok else 0.0,
+            'ai_p95': ai_ok.quantile(0.95) if ai_ok else 0.0,
+            'ai_streams': ai_first_token.count if ai_first_token else 0,
+            'ai_first_token_p50': ai_first_token.quantile(0.5) if ai_first_token else 0.0,
+            'ai_first_token_p95': ai_first_token.quantile(0.95) if ai_first_token else 0.0,
+        }
+
+
+# Метрики процесса (декоратор handle_db_errors и сервисы пишут сюда)
+metrics = MetricsRegistry()
+
+
+# === MIDDLEWARE ===
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Замер времени обработки обновлений по роутерам и обработчикам.
+    
+    Регистрируется как outer middleware (замер всей обработки, включая
+    фильтры и внедрение зависимостей) и как inner middleware, которое
+    узнает, какой обработчик был выбран.
+    """
+    
+    LABELS_KEY = 'metrics_labels'
+    
+    def __init__(self, event_type: str, registry: MetricsRegistry = metrics):
+        self.event_type = event_type
+        self.registry = registry
+    
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        labels = {'router': 'none', 'handler': 'unhandled'}
+        data[self.LABELS_KEY] = labels
+        
+        start = time.perf_counter()
+        error = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.registry.observe_handler(
+                self.event_type, labels['router'], labels['handler'],
+                time.perf_counter() - start, error
+            )
+    
+    @classmethod
+    async def label_handler(cls, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                            event: TelegramObject, data: Dict[str, Any]) -> Any:
+        """Inner middleware: запоминает выбранный роутер и обработчик"""
+        labels = data.get(cls.LABELS_KEY)
+        if labels is not None:
+            router = data.get('event_router')
+            handler_object = data.get('handler')
+            labels['router'] = router.name if router is not None else 'none'
+            if handler_object is not None:
+                labels['handler'] = getattr(handler_object.callback, '__name__', 'unknown')
+        return await handler(event, data)
+
+
+# === HTTP ===
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics для Prometheus"""
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 9100, registry: MetricsRegistry = metrics):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+    
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.registry.render_prometheus().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+    
+    async def start(self):
+        """Запуск HTTP-сервера"""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logging.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+    
+    async def stop(self):
+        """Остановка HTTP-сервера"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
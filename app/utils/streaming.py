@@ -0,0 +1,93 @@
+"""
+Постепенное обновление сообщения по мере поступления текста
+"""
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+# Ограничение Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+class ThrottledMessageEditor:
+    """
+    Редактирование сообщения с ограничением частоты.
+    
+    update() не ждет Telegram: запоминается последний текст, а фоновая задача
+    редактирует сообщение не чаще одного раза за interval. Промежуточные
+    версии текста пропускаются - показывается всегда самая свежая.
+    """
+    
+    CURSOR = " ▌"
+    
+    def __init__(self, message: Message, interval: float = 1.5, prefix: str = ""):
+        self.message = message
+        self.interval = interval
+        self.prefix = prefix
+        self.edits = 0
+        
+        self._pending: Optional[str] = None
+        self._shown = message.text or ""
+        self._next_edit_at = 0.0  # первый фрагмент показываем сразу
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    def update(self, text: str):
+        """Новый вариант текста (вызывается на каждый фрагмент ответа)"""
+        if self._closed:
+            return
+        self._pending = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+    
+    async def close(self):
+        """Остановка обновлений (перед финальным редактированием сообщения)"""
+        self._closed = True
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+    
+    def _render(self, text: str) -> str:
+        """Промежуточный текст без разметки: незакрытые ** ломают Markdown"""
+        limit = MAX_MESSAGE_LENGTH - len(self.prefix) - len(self.CURSOR) - 1
+        if len(text) > limit:
+            text = text[:limit] + "…"
+        return f"{self.prefix}{text}{self.CURSOR}"
+    
+    async def _run(self):
+        while self._pending is not None and not self._closed:
+            delay = self._next_edit_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            
+            text, self._pending = self._pending, None
+            await self._edit(text)
+    
+    async def _edit(self, text: str):
+        display = self._render(text)
+        if display == self._shown:
+            return
+        
+        self._next_edit_at = time.monotonic() + self.interval
+        try:
+            await self.message.edit_text(display)
+            self._shown = display
+            self.edits += 1
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать: откладываем, свежий текст покажем позже
+            self._next_edit_at = time.monotonic() + e.retry_after
+            if self._pending is None:
+                self._pending = text
+        except TelegramBadRequest as e:
+            # Например, "message is not modified" - пропускаем это обновление
+            logging.debug(f"Сообщение не обновлено: {e}")
+        except Exception as e:
+            logging.warning(f"Ошибка обновления сообщения: {e}")
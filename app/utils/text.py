@@ -0,0 +1,87 @@
+"""
+Утилиты для обработки текста
+"""
+import re
+from typing import List
+
+_NON_WORD_RE = re.compile(r'[^\w\s]+')
+_SPACES_RE = re.compile(r'\s+')
+_CYRILLIC_RE = re.compile(r'[а-я]')
+
+# Окончания русских слов (от длинных к коротким)
+_REFLEXIVE_ENDINGS = ('ся', 'сь')
+_RU_ENDINGS = tuple(sorted((
+    'иями', 'ями', 'ами', 'ией', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ать', 'ять', 'еть', 'ить', 'уть', 'ешь', 'ишь', 'ете', 'ите',
+    'ия', 'ие', 'ий', 'ый', 'ой', 'ая', 'яя', 'ое', 'ее', 'ые', 'ую', 'юю',
+    'ов', 'ев', 'ей', 'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ют', 'ут', 'ит',
+    'ет', 'ат', 'ят', 'ла', 'ло', 'ли', 'ть',
+    'а', 'я', 'о', 'е', 'у', 'ю', 'ы', 'и', 'ь', 'й'
+), key=len, reverse=True))
+# Окончания по длине: проверка среза вместо перебора всех окончаний
+_RU_ENDINGS_BY_LENGTH = tuple(
+    (length, frozenset(ending for ending in _RU_ENDINGS if len(ending) == length))
+    for length in sorted({len(ending) for ending in _RU_ENDINGS}, reverse=True)
+)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Нормализация текста для сравнения и поиска
+    
+    Приводит к нижнему регистру, заменяет «ё» на «е», убирает знаки
+    препинания и лишние пробелы.
+    
+    Args:
+        text: Исходный текст
+        
+    Returns:
+        str: Нормализованный текст
+    """
+    if not text:
+        return ""
+    
+    text = text.lower().replace('ё', 'е')
+    text = _NON_WORD_RE.sub(' ', text)
+    return _SPACES_RE.sub(' ', text).strip()
+
+
+def stem_word(word: str, min_stem: int = 3) -> str:
+    """
+    Упрощенный стемминг русского слова (отсечение окончаний)
+    
+    «диагностику» и «диагностика» дают одну основу «диагностик».
+    
+    Args:
+        word: Слово в нижнем регистре
+        min_stem: Минимальная длина основы
+        
+    Returns:
+        str: Основа слова
+    """
+    if not _CYRILLIC_RE.search(word):
+        return word
+    
+    for ending in _REFLEXIVE_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= min_stem:
+            word = word[:-len(ending)]
+            break
+    
+    for length, endings in _RU_ENDINGS_BY_LENGTH:
+        if len(word) - length >= min_stem and word[-length:] in endings:
+            return word[:-length]
+    
+    return word
+
+
+def stem_text(text: str) -> List[str]:
+    """
+    Нормализация текста и стемминг каждого слова
+    
+    Args:
+        text: Исходный текст
+        
+    Returns:
+        List[str]: Список основ слов
+    """
+    return [stem_word(word) for word in normalize_text(text).split()]
@@ -0,0 +1,103 @@
+"""
+Прием обновлений Telegram через webhook (aiohttp)
+"""
+import asyncio
+import hmac
+import logging
+from typing import Any, Dict, Optional, Set
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    HTTP-сервер для webhook режима.
+
+    Обновление подтверждается сразу (200), а обрабатывается в фоне. Одновременно
+    обрабатывается не больше max_concurrency обновлений; если очередь ожидающих
+    переполнена, сервер отвечает 503 и Telegram повторит доставку позже.
+    """
+
+    def __init__(self, bot: Bot, dp: Dispatcher, path: str = "/webhook",
+                 host: str = "0.0.0.0", port: int = 8080,
+                 secret_token: Optional[str] = None, max_concurrency: int = 16,
+                 max_pending: Optional[int] = None, **workflow_data: Any):
+        self.bot = bot
+        self.dp = dp
+        self.path = path
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token
+        self.max_pending = max_pending or max_concurrency * 10
+        self.workflow_data = workflow_data
+
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._tasks: Set[asyncio.Task] = set()
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_app(self) -> web.Application:
+        """Создание aiohttp приложения"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        return app
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Прием одного обновления"""
+        if self.secret_token:
+            received = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                logging.warning(f"Webhook: неверный секретный токен от {request.remote}")
+                return web.Response(status=401)
+
+        try:
+            update: Dict[str, Any] = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="Некорректный JSON")
+
+        if not self.submit(update):
+            logging.warning("Webhook: очередь обновлений переполнена")
+            return web.Response(status=503)
+        return web.Response()
+
+    def submit(self, update: Dict[str, Any]) -> bool:
+        """Постановка обновления в обработку; False - очередь переполнена"""
+        if len(self._tasks) >= self.max_pending:
+            return False
+
+        task = asyncio.create_task(self._process_update(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _process_update(self, update: Dict[str, Any]):
+        async with self._semaphore:
+            try:
+                await self.dp.feed_raw_update(self.bot, update, **self.workflow_data)
+            except Exception as e:
+                logging.error(f"Ошибка обработки обновления {update.get('update_id')}: {e}")
+
+    async def start(self):
+        """Запуск HTTP-сервера"""
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logging.info(f"Webhook сервер запущен на {self.host}:{self.port}{self.path}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Остановка сервера с ожиданием обработки принятых обновлений"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logging.warning(f"Webhook: прервана обработка {len(pending)} обновлений")
+
+        logging.info("Webhook сервер остановлен")
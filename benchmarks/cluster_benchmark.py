@@ -0,0 +1,183 @@
+"""
+Бенчмарк многопроцессного режима: пропускная способность от числа воркеров
+
+Процесс приема (ClusterIngress) раскладывает синтетические обновления
+пачками по 100 (как getUpdates) по воркерам, воркеры обрабатывают их
+реальными роутерами бота; запросы к Telegram перехватывает фейковая сессия
+из нагрузочного теста. Время - от первой пачки до дообработки всех очередей.
+
+Заодно проверяется порядок: в каждом воркере middleware сверяет, что
+update_id в чате только растут. Нарушения пишутся в файлы
+order-violations-<воркер>.txt, при их наличии код возврата 1.
+
+Ускорение ограничено числом ядер: на одном ядре несколько воркеров только
+делят процессор.
+
+Запуск:
+    python -m benchmarks.cluster_benchmark [--workers 1,2,4] [--users 500] [--updates-per-user 20]
+"""
+import argparse
+import asyncio
+import glob
+import itertools
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+from app.cluster import ClusterIngress
+from app.database.connection import get_db_connection
+from app.main import RepairBot
+from benchmarks.loadtest import BOT_TOKEN, FIRST_USER_ID, RecordingSession
+
+BATCH_SIZE = 100
+BOT_ID = int(BOT_TOKEN.split(":")[0])
+
+# Шаги пользователя: тексты кнопок меню и callback-данные
+STEPS = (
+    ("text", "📋 Описание услуг"),
+    ("data", "view_service_{n}"),
+    ("data", "back_to_services_catalog"),
+    ("text", "👥 Мастера"),
+    ("data", "master_{m}"),
+    ("data", "back_to_masters_catalog"),
+    ("text", "⭐ Отзывы"),
+    ("data", "popular_services"),
+)
+
+
+def install_session(app: RepairBot):
+    """Настройка воркера: фейковая сессия и проверка порядка обновлений в чате"""
+    app.bot.session = RecordingSession()
+    last_update_ids: Dict[int, int] = {}
+
+    async def check_order(handler, event, data: Dict[str, Any]):
+        chat = data.get("event_chat")
+        if chat is not None:
+            previous = last_update_ids.get(chat.id, 0)
+            if event.update_id <= previous:
+                with open(f"order-violations-{app.worker_index}.txt", "a", encoding="utf-8") as f:
+                    f.write(f"{chat.id}: {event.update_id} после {previous}\n")
+            last_update_ids[chat.id] = event.update_id
+        return await handler(event, data)
+
+    app.dp.update.outer_middleware(check_order)
+
+
+def make_updates(users: int, per_user: int) -> List[Dict[str, Any]]:
+    """Обновления пользователей вперемешку, как они приходят из getUpdates"""
+    update_ids = itertools.count(1)
+    updates = []
+    for step in range(per_user):
+        kind, value = STEPS[step % len(STEPS)]
+        for i in range(users):
+            user_id = FIRST_USER_ID + i
+            user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "ru"}
+            chat = {"id": user_id, "type": "private"}
+            update_id = next(update_ids)
+            value_text = value.format(n=1 + (i + step) % 15, m=1 + i % 5)
+            if kind == "text":
+                updates.append({
+                    "update_id": update_id,
+                    "message": {"message_id": update_id, "date": int(time.time()),
+                                "chat": chat, "from": user, "text": value_text},
+                })
+            else:
+                updates.append({
+                    "update_id": update_id,
+                    "callback_query": {
+                        "id": str(update_id), "from": user, "chat_instance": str(user_id), "data": value_text,
+                        "message": {"message_id": 1, "date": int(time.time()), "chat": chat,
+                                    "from": {"id": BOT_ID, "is_bot": True, "first_name": "LoadTest"},
+                                    "text": "..."},
+                    },
+                })
+    return updates
+
+
+async def register_users(db_path: str, users: int):
+    async with get_db_connection(db_path) as db:
+        await db.executemany(
+            "INSERT OR IGNORE INTO users (user_id, name, phone, address) VALUES (?, ?, ?, ?)",
+            [(FIRST_USER_ID + i, f"Пользователь {i}", "+79000000000", f"ул. Кластерная, {i}")
+             for i in range(users)]
+        )
+        await db.commit()
+
+
+async def run_cluster(workers: int, updates: List[Dict[str, Any]], users: int) -> Dict[str, Any]:
+    with open("config.txt", "w", encoding="utf-8") as f:
+        f.write(
+            f"BOT_TOKEN={BOT_TOKEN}\n"
+            f"GEMINI_API_KEY=loadtest-stub-key-0123456789abcdef\n"
+            f"DB_PATH=cluster.db\n"
+            f"LOG_LEVEL=WARNING\n"
+            f"METRICS_PORT=0\n"
+            f"BACKUP_INTERVAL_HOURS=0\n"
+            f"DB_SEED_DATA=true\n"
+            f"CLUSTER_WORKERS={workers}\n"
+        )
+
+    app = RepairBot("config.txt")
+    app.bot.session = RecordingSession()
+    ingress = ClusterIngress(app, worker_setup=install_session)
+    await ingress.start()
+    try:
+        await register_users(app.config.db_path, users)
+
+        start = time.perf_counter()
+        for i in range(0, len(updates), BATCH_SIZE):
+            await ingress.dispatch(updates[i:i + BATCH_SIZE])
+        processed = await ingress.drain(timeout=600)
+        elapsed = time.perf_counter() - start
+    finally:
+        await ingress.stop()
+
+    return {"workers": workers, "elapsed": elapsed, "processed": processed}
+
+
+async def main(args) -> int:
+    worker_counts = [int(value) for value in args.workers.split(",")]
+    updates = make_updates(args.users, args.updates_per_user)
+    print(f"Обновлений: {len(updates)} от {args.users} пользователей, ядер: {os.cpu_count()}\n")
+
+    cwd = os.getcwd()
+    results = []
+    failed = False
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Бот пишет bot.log и БД в текущий каталог
+            os.chdir(tmp_dir)
+            try:
+                result = await run_cluster(workers, updates, args.users)
+                violations = glob.glob("order-violations-*.txt")
+            finally:
+                os.chdir(cwd)
+
+        total = sum(result["processed"].values())
+        if total != len(updates) or violations:
+            failed = True
+            print(f"❌ {workers} воркер(ов): обработано {total} из {len(updates)}, "
+                  f"нарушений порядка в {len(violations)} воркерах")
+        results.append(result)
+
+    base = len(updates) / results[0]["elapsed"]
+    print(f"{'Воркеров':>8} {'Время, с':>10} {'Обн./с':>10} {'Ускорение':>10}   По воркерам")
+    for result in results:
+        rate = len(updates) / result["elapsed"]
+        spread = ", ".join(str(result["processed"].get(i, 0)) for i in range(result["workers"]))
+        print(f"{result['workers']:>8} {result['elapsed']:>10.2f} {rate:>10.0f} {rate / base:>9.2f}x   {spread}")
+
+    if failed:
+        return 1
+    print("\n✅ Все обновления обработаны, порядок в чатах сохранен")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пропускная способность многопроцессного режима")
+    parser.add_argument("--workers", default="1,2,4", help="числа воркеров через запятую")
+    parser.add_argument("--users", type=int, default=500, help="количество пользователей (чатов)")
+    parser.add_argument("--updates-per-user", type=int, default=20, help="обновлений на пользователя")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,60 @@
+"""
+Бенчмарк: соединение на каждый запрос против пула соединений
+
+Запуск:
+    python -m benchmarks.db_pool_benchmark [количество итераций]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from app.database.connection import DatabaseManager
+from app.database.queries import DatabaseQueries
+
+TEST_USER_ID = 123456789
+
+
+async def measure(name: str, coro_factory, iterations: int) -> float:
+    """Замер среднего времени вызова в миллисекундах"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await coro_factory()
+    elapsed = (time.perf_counter() - start) * 1000 / iterations
+    print(f"  {name:<20} {elapsed:8.3f} мс/вызов")
+    return elapsed
+
+
+async def run_suite(db_queries: DatabaseQueries, iterations: int) -> dict:
+    return {
+        # get_user отвечает из кэша пользователей - замеряем чтение из БД в обход кэша
+        '_load_user': await measure('_load_user', lambda: db_queries._load_user(TEST_USER_ID), iterations),
+        'get_services': await measure('get_services', lambda: db_queries.get_services(0, 5), iterations),
+        'get_user_orders': await measure('get_user_orders', lambda: db_queries.get_user_orders(TEST_USER_ID), iterations),
+    }
+
+
+async def main(iterations: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        db_manager = DatabaseManager(db_path)
+        await db_manager.init_database()
+        await db_manager.populate_test_data()
+        db_queries = DatabaseQueries(db_path)
+
+        print(f"Соединение на каждый вызов ({iterations} итераций):")
+        per_call = await run_suite(db_queries, iterations)
+
+        await db_manager.open_pool()
+        print(f"Пул соединений ({iterations} итераций):")
+        pooled = await run_suite(db_queries, iterations)
+        await db_manager.close_pool()
+
+        print("Ускорение:")
+        for name in per_call:
+            print(f"  {name:<20} x{per_call[name] / pooled[name]:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,79 @@
+"""
+Бенчмарк хранилищ FSM: MemoryStorage против SQLiteStorage
+
+Сценарий повторяет toggle_service_selection: get_data -> update_data
+на каждое нажатие кнопки у множества пользователей.
+
+Запуск:
+    python -m benchmarks.fsm_storage_benchmark [пользователей] [нажатий на пользователя]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from app.database.connection import DatabaseManager
+from app.database.fsm_storage import SQLiteStorage
+
+BOT_ID = 42
+
+
+async def simulate(storage, users: int, clicks: int, flush_each: bool = False) -> float:
+    """Выбор услуг пользователями; возвращает мкс на операцию"""
+    start = time.perf_counter()
+    for click in range(clicks):
+        for user_id in range(users):
+            key = StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+            data = await storage.get_data(key)
+            selected = set(data.get('selected_services', []))
+            selected ^= {click % 7 + 1}
+            await storage.update_data(key, {'selected_services': list(selected), 'page': click % 3})
+            await storage.set_state(key, "OrderStates:selecting_services")
+            if flush_each:
+                await storage.flush()
+    elapsed = time.perf_counter() - start
+    return elapsed * 1_000_000 / (users * clicks)
+
+
+async def main(users: int, clicks: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        db_manager = DatabaseManager(db_path)
+        await db_manager.init_database()
+        await db_manager.open_pool()
+
+        print(f"{users} пользователей x {clicks} нажатий\n")
+
+        memory_us = await simulate(MemoryStorage(), users, clicks)
+        print(f"  {'MemoryStorage':<32} {memory_us:8.1f} мкс/нажатие")
+
+        storage = SQLiteStorage(db_path, flush_interval=1.0)
+        await storage.open()
+        sqlite_us = await simulate(storage, users, clicks)
+        await storage.close()
+        print(f"  {'SQLiteStorage (кэш записи)':<32} {sqlite_us:8.1f} мкс/нажатие, {storage.get_stats()}")
+
+        naive = SQLiteStorage(db_path)
+        await naive.open()
+        naive_us = await simulate(naive, users, clicks, flush_each=True)
+        await naive.close()
+        print(f"  {'SQLiteStorage (запись на каждое)':<32} {naive_us:8.1f} мкс/нажатие, {naive.get_stats()}")
+
+        # Перезапуск: состояние должно восстановиться с диска
+        restored = SQLiteStorage(db_path)
+        await restored.open()
+        state = await restored.get_state(StorageKey(bot_id=BOT_ID, chat_id=0, user_id=0))
+        await restored.close()
+        print(f"\nСостояние после перезапуска: {state}")
+
+        await db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    clicks = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(users, clicks))
@@ -0,0 +1,90 @@
+"""
+Бенчмарк клавиатур: построение с нуля против кэшированных экземпляров и кнопок
+
+Статические клавиатуры сравниваются с исходной функцией (__wrapped__ у lru_cache),
+клавиатура услуг - с прежней реализацией, которая создавала все кнопки заново.
+
+Запуск:
+    python -m benchmarks.keyboard_benchmark [вызовов на замер]
+"""
+import sys
+import time
+from datetime import date
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from app.keyboards.main_menu import get_main_menu_keyboard
+from app.keyboards.order_keyboards import (
+    _build_dates_keyboard, get_dates_keyboard, get_services_keyboard, get_time_slots_keyboard
+)
+from app.keyboards.profile_keyboards import get_rating_keyboard, get_support_keyboard, get_faq_keyboard
+from app.utils.constants import BUTTON_TEXTS, CALLBACK_DATA
+
+SERVICES = [
+    {'id': i, 'name': f"Услуга №{i}", 'price': 500 + i * 100}
+    for i in range(1, 9)
+]
+
+
+def legacy_services_keyboard(services, page, total_pages, selected_services, action_prefix="order_service"):
+    """Прежняя реализация: все кнопки создаются на каждое нажатие"""
+    keyboard = []
+    for service in services:
+        checkmark = "✅ " if service['id'] in selected_services else ""
+        keyboard.append([InlineKeyboardButton(
+            text=f"{checkmark}{service['name']} - {service['price']}₽",
+            callback_data=f"{action_prefix}_{service['id']}"
+        )])
+
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton(text=BUTTON_TEXTS['PREV'], callback_data=f"{action_prefix}_page_{page-1}"))
+    if page < total_pages - 1:
+        nav_buttons.append(InlineKeyboardButton(text=BUTTON_TEXTS['NEXT'], callback_data=f"{action_prefix}_page_{page+1}"))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+
+    if selected_services:
+        keyboard.append([InlineKeyboardButton(text=BUTTON_TEXTS['CONFIRM_ORDER'], callback_data=CALLBACK_DATA['CONFIRM_ORDER'])])
+    keyboard.append([InlineKeyboardButton(text=BUTTON_TEXTS['BACK_TO_MAIN'], callback_data=CALLBACK_DATA['MAIN_MENU'])])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def measure(factory, count: int) -> float:
+    """Микросекунд на вызов"""
+    start = time.perf_counter()
+    for i in range(count):
+        factory(i)
+    return (time.perf_counter() - start) * 1_000_000 / count
+
+
+def main(count: int):
+    cases = [
+        ("get_main_menu_keyboard", lambda i: get_main_menu_keyboard.__wrapped__(is_admin=i % 2 == 0),
+         lambda i: get_main_menu_keyboard(is_admin=i % 2 == 0)),
+        ("get_time_slots_keyboard", lambda i: get_time_slots_keyboard.__wrapped__(), lambda i: get_time_slots_keyboard()),
+        ("get_dates_keyboard", lambda i: _build_dates_keyboard.__wrapped__(date.today()), lambda i: get_dates_keyboard()),
+        ("get_rating_keyboard", lambda i: get_rating_keyboard.__wrapped__(), lambda i: get_rating_keyboard()),
+        ("get_support_keyboard", lambda i: get_support_keyboard.__wrapped__(), lambda i: get_support_keyboard()),
+        ("get_faq_keyboard", lambda i: get_faq_keyboard.__wrapped__(), lambda i: get_faq_keyboard()),
+        # Переключение услуг: выбор меняется на каждом вызове
+        ("get_services_keyboard",
+         lambda i: legacy_services_keyboard(SERVICES, 1, 3, {s['id'] for s in SERVICES if (s['id'] + i) % 3 == 0}),
+         lambda i: get_services_keyboard(SERVICES, 1, 3, {s['id'] for s in SERVICES if (s['id'] + i) % 3 == 0})),
+    ]
+
+    print(f"{count} вызовов на замер\n")
+    print(f"{'Клавиатура':<26} {'с нуля, мкс':>12} {'кэш, мкс':>10} {'ускорение':>10}")
+    for name, build, cached in cases:
+        before = measure(build, count)
+        after = measure(cached, count)
+        print(f"{name:<26} {before:>12.1f} {after:>10.2f} {before / after:>9.0f}x")
+
+    # Кэшированная клавиатура услуг должна совпадать с прежней
+    for i in range(6):
+        selected = {s['id'] for s in SERVICES if (s['id'] + i) % 3 == 0}
+        assert get_services_keyboard(SERVICES, 1, 3, selected) == legacy_services_keyboard(SERVICES, 1, 3, selected)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,109 @@
+"""
+Бенчмарк резервного анализа проблемы: перебор ключевых слов против автомата Ахо-Корасик
+
+Таблица категорий расширяется синтетическими ключевыми словами, затем оба
+способа оценивают одни и те же описания проблем. Отдельно показано, какие
+словоформы находит каждый из них на реальной таблице AI_PROBLEM_PATTERNS.
+
+Запуск:
+    python -m benchmarks.keyword_matcher_benchmark [категорий] [ключевых слов на категорию]
+"""
+import random
+import sys
+import time
+
+from app.utils.constants import AI_PROBLEM_PATTERNS
+from app.utils.keyword_matcher import KeywordMatcher
+
+ITERATIONS = 200
+
+PROBLEMS = [
+    "Компьютер стал очень медленно работать, вентиляторы шумят, постоянно тормозят программы",
+    "При включении появляется синий экран, после этого система перезагружается",
+    "В играх низкий fps и лаги, раньше все работало плавно",
+    "Всплывают рекламные окна, браузер сам открывает сайты, похоже на вирусы",
+    "Ноутбук не включается, индикатор питания не горит",
+    "Пропадает интернет по wifi, роутер перезагружал, нет связи",
+]
+
+# Словоформы, которые не совпадают с ключевыми словами буквально
+INFLECTED = [
+    "Компьютер тормозят",
+    "Нашел вирусы и трояны",
+    "Проблемы с сетью",
+    "Постоянные ошибки Windows",
+    "Подключения к интернету нет",
+]
+
+SYLLABLES = ["ка", "ро", "ми", "за", "ле", "ту", "ны", "ве", "со", "пи", "гра", "стр", "диск", "плат", "ват"]
+
+
+def synthetic_patterns(categories: int, keywords: int) -> dict:
+    """Реальная таблица плюс синтетические категории с ключевыми словами и фразами"""
+    rng = random.Random(42)
+    patterns = dict(AI_PROBLEM_PATTERNS)
+    for index in range(categories):
+        words = set()
+        while len(words) < keywords:
+            word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+            if rng.random() < 0.2:
+                word = f"не {word}"
+            words.add(word)
+        patterns[f"synthetic_{index}"] = {'keywords': sorted(words), 'services': [1], 'description': ""}
+    return patterns
+
+
+def legacy_rank(patterns: dict, problem_text: str):
+    """Прежний алгоритм: поиск подстроки для каждого ключевого слова каждой категории"""
+    problem_lower = problem_text.lower()
+    category_scores = {}
+    for category, data in patterns.items():
+        score = sum(1 for keyword in data['keywords'] if keyword in problem_lower)
+        if score > 0:
+            category_scores[category] = score
+    return sorted(category_scores.items(), key=lambda item: -item[1])
+
+
+def measure(func, iterations: int) -> float:
+    """Микросекунд на описание проблемы"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for problem in PROBLEMS:
+            func(problem)
+    return (time.perf_counter() - start) * 1_000_000 / (iterations * len(PROBLEMS))
+
+
+def main(categories: int, keywords: int):
+    patterns = synthetic_patterns(categories, keywords)
+    total_keywords = sum(len(data['keywords']) for data in patterns.values())
+
+    start = time.perf_counter()
+    matcher = KeywordMatcher.from_patterns(patterns)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    print(f"Категорий: {len(patterns)}, ключевых слов: {total_keywords}, "
+          f"сборка автомата: {build_ms:.1f} мс\n")
+
+    legacy_us = measure(lambda text: legacy_rank(patterns, text), ITERATIONS)
+    matcher_us = measure(matcher.rank, ITERATIONS)
+    print(f"{'Способ':<24} {'мкс на описание':>16}")
+    print(f"{'перебор подстрок':<24} {legacy_us:>16.1f}")
+    print(f"{'Ахо-Корасик':<24} {matcher_us:>16.1f}")
+    print(f"Ускорение: {legacy_us / matcher_us:.1f}x\n")
+
+    # Словоформы на реальной таблице
+    real_matcher = KeywordMatcher.from_patterns(AI_PROBLEM_PATTERNS)
+    print(f"{'Описание':<32} {'перебор':<22} {'Ахо-Корасик'}")
+    for text in INFLECTED:
+        legacy = legacy_rank(AI_PROBLEM_PATTERNS, text)
+        ranked = real_matcher.rank(text)
+        legacy_text = ", ".join(category for category, _ in legacy) or "-"
+        ranked_text = ", ".join(f"{category} ({score:g})" for category, score in ranked) or "-"
+        print(f"{text:<32} {legacy_text:<22} {ranked_text}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 200,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    )
@@ -0,0 +1,398 @@
+"""
+Нагрузочный тест диспетчера на синтетических обновлениях
+
+Виртуальные пользователи проходят реальные сценарии меню: регистрация,
+заказ (выбор услуг -> время -> дата -> адрес -> подтверждение), отзыв
+на выполненный заказ и консультация ИИ с заглушкой модели. Обновления
+подаются в Dispatcher.feed_update, а исходящие запросы к Telegram
+перехватывает фейковая сессия бота.
+
+Запуск:
+    python -m benchmarks.loadtest --users 200 --concurrency 50 [--ai-latency 0.2] [--fsm memory]
+                                  [--explain] [--strict-queries]
+
+С --strict-queries превышение бюджета запросов к БД (@query_budget,
+DB_QUERY_BUDGET) считается ошибкой и завершает тест с кодом 1.
+
+После прогона проверяются результаты сценариев (заказы, отзывы, рекомендации
+ИИ в состоянии диалога); если их меньше ожидаемого, код возврата 1.
+"""
+import argparse
+import asyncio
+import contextvars
+import itertools
+import os
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Union, get_args, get_origin
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.methods import GetMe, TelegramMethod
+from aiogram.types import Message, Update, User
+
+from app.database.connection import get_db_connection
+from app.database.profiler import profiler
+from app.main import RepairBot
+from app.utils.metrics import metrics
+from app.utils.constants import TIME_SLOTS
+
+BOT_TOKEN = "123456789:LOADTEST_TOKEN_0123456789abcdefghijklmn"
+FIRST_USER_ID = 10_000_000
+
+AI_PROBLEMS = [
+    "Компьютер сильно шумит и перегревается при работе в играх",
+    "Ноутбук не включается после обновления Windows",
+    "Очень медленно работает система и постоянно всплывает реклама",
+    "Пропал интернет после смены роутера, сеть не находится",
+    "Случайно удалил важные файлы с жесткого диска",
+]
+
+# Обработчик, который обслужил текущее обновление (заполняется middleware)
+_current_step: contextvars.ContextVar[Optional[Dict[str, str]]] = contextvars.ContextVar(
+    "loadtest_step", default=None
+)
+
+
+class RecordingSession(BaseSession):
+    """Сессия бота, которая отвечает на запросы локально и считает их"""
+    
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1_000_000)
+    
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        
+        if isinstance(method, GetMe):
+            return User(id=bot.id, is_bot=True, first_name="LoadTest", username="loadtest_bot")
+        
+        if self._returns_message(method.__returning__):
+            chat_id = getattr(method, "chat_id", None) or 0
+            return Message.model_validate({
+                "message_id": getattr(method, "message_id", None) or next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": bot.id, "is_bot": True, "first_name": "LoadTest"},
+                "text": getattr(method, "text", None),
+            }, context={"bot": bot})
+        
+        return True
+    
+    @staticmethod
+    def _returns_message(returning: Any) -> bool:
+        if returning is Message:
+            return True
+        return get_origin(returning) is Union and Message in get_args(returning)
+    
+    async def stream_content(self, url: str, headers: Optional[Dict[str, Any]] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True):
+        yield b""
+    
+    async def close(self) -> None:
+        pass
+
+
+class StubModel:
+    """Заглушка Gemini с фиксированной задержкой (в потоковом режиме - по строкам)"""
+    
+    LINES = (
+        "Похоже на проблему с охлаждением и программным обеспечением.\n",
+        "1. Диагностика компьютера [ID: 1]\n",
+        "2. Чистка от пыли [ID: 2]\n",
+        "3. Удаление вирусов [ID: 9]",
+    )
+    
+    def __init__(self, latency: float):
+        self.latency = latency
+    
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        if stream:
+            return self._stream()
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text="".join(self.LINES))
+    
+    async def _stream(self):
+        for line in self.LINES:
+            await asyncio.sleep(self.latency / len(self.LINES))
+            yield SimpleNamespace(text=line)
+
+
+class VirtualUser:
+    """Пользователь Telegram, отправляющий обновления в диспетчер"""
+    
+    _update_ids = itertools.count(1)
+    _message_ids = itertools.count(1)
+    
+    def __init__(self, harness: "LoadTest", user_id: int):
+        self.harness = harness
+        self.user_id = user_id
+        self.last_bot_message_id = 1
+    
+    @property
+    def _user(self) -> Dict[str, Any]:
+        return {"id": self.user_id, "is_bot": False, "first_name": f"User{self.user_id}", "language_code": "ru"}
+    
+    @property
+    def _chat(self) -> Dict[str, Any]:
+        return {"id": self.user_id, "type": "private"}
+    
+    async def send(self, text: str):
+        await self.harness.feed({
+            "update_id": next(self._update_ids),
+            "message": {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": self._chat,
+                "from": self._user,
+                "text": text,
+            },
+        })
+    
+    async def press(self, data: str):
+        await self.harness.feed({
+            "update_id": next(self._update_ids),
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": self._user,
+                "chat_instance": str(self.user_id),
+                "data": data,
+                "message": {
+                    "message_id": self.last_bot_message_id,
+                    "date": int(time.time()),
+                    "chat": self._chat,
+                    "from": {"id": self.harness.bot.id, "is_bot": True, "first_name": "LoadTest"},
+                    "text": "...",
+                },
+            },
+        })
+    
+    # === СЦЕНАРИИ ===
+    
+    async def register(self):
+        await self.send("/start")
+        await self.send("Иван Нагрузкин")
+        await self.send(f"+79{self.user_id % 10 ** 9:09d}")
+        await self.send(f"ул. Нагрузочная, д. {self.user_id % 1000}, кв. 1")
+    
+    async def checkout(self):
+        """Время -> дата -> адрес из профиля -> подтверждение"""
+        # Заказы распределены по дням и слотам, чтобы мастеров хватало на всех
+        slot = self.user_id % len(TIME_SLOTS)
+        day = (datetime.now() + timedelta(days=1 + self.user_id // len(TIME_SLOTS) % 7)).strftime('%Y-%m-%d')
+        await self.press(f"time_{TIME_SLOTS[slot]}")
+        await self.press(f"date_{day}")
+        await self.press("address_profile")
+        await self.press("final_confirm")
+    
+    async def make_order(self):
+        await self.send("🛠️ Сделать заказ")
+        for service_id in (1, 3, 4, 3):  # с повторным нажатием - снятие выбора
+            await self.press(f"order_service_{service_id}")
+        await self.press("order_service_page_1")
+        await self.press("confirm_order")
+        await self.checkout()
+    
+    async def review_last_order(self):
+        # Мастер выполнил заказ - меняем статус напрямую, как это делает админ
+        db_queries = self.harness.repair_bot.db_queries
+        orders = await db_queries.get_user_orders(self.user_id, 1)
+        if not orders:
+            return
+        await db_queries.update_order_status(orders[0]['id'], 'completed')
+        
+        await self.send("⭐ Отзывы")
+        await self.press("create_review")
+        await self.press(f"review_order_{orders[0]['id']}")
+        await self.press("rating_5")
+        await self.send("Мастер приехал вовремя, все быстро починил")
+    
+    async def ai_consultation(self):
+        await self.send("🤖 Консультация ИИ")
+        await self.send(AI_PROBLEMS[self.user_id % len(AI_PROBLEMS)])
+        key = StorageKey(bot_id=self.harness.bot.id, chat_id=self.user_id, user_id=self.user_id)
+        if (await self.harness.repair_bot.storage.get_data(key)).get('recommended_services'):
+            self.harness.ai_recommendations += 1
+        await self.press("add_ai_services")
+        await self.checkout()
+    
+    async def run(self):
+        await self.register()
+        await self.make_order()
+        await self.review_last_order()
+        await self.ai_consultation()
+
+
+class LoadTest:
+    """Стенд: RepairBot с фейковой сессией и сбор метрик"""
+    
+    def __init__(self, repair_bot: RepairBot):
+        self.repair_bot = repair_bot
+        self.bot = repair_bot.bot
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = 0
+        self.ai_recommendations = 0
+    
+    def install_tracking(self):
+        """Внутренний middleware запоминает имя обработчика обновления"""
+        async def track_handler(handler, event, data: Dict[str, Any]):
+            step = _current_step.get()
+            if step is not None:
+                step['handler'] = data['handler'].callback.__name__
+            return await handler(event, data)
+        
+        self.repair_bot.dp.message.middleware(track_handler)
+        self.repair_bot.dp.callback_query.middleware(track_handler)
+    
+    async def feed(self, raw_update: Dict[str, Any]):
+        update = Update.model_validate(raw_update, context={"bot": self.bot})
+        step = {'handler': 'unhandled'}
+        token = _current_step.set(step)
+        start = time.perf_counter()
+        try:
+            await self.repair_bot.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors += 1
+        finally:
+            self.latencies[step['handler']].append(time.perf_counter() - start)
+            _current_step.reset(token)
+    
+    async def run(self, users: int, concurrency: int) -> float:
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        async def run_user(user_id: int):
+            async with semaphore:
+                await VirtualUser(self, user_id).run()
+        
+        start = time.perf_counter()
+        await asyncio.gather(*(run_user(FIRST_USER_ID + i) for i in range(users)))
+        return time.perf_counter() - start
+    
+    async def check_outcomes(self, users: int) -> List[str]:
+        """
+        Проверка результатов сценариев: обработчики сами перехватывают свои
+        исключения, поэтому сломанный сценарий не виден в счетчике ошибок
+        """
+        user_range = (FIRST_USER_ID, FIRST_USER_ID + users - 1)
+        async with get_db_connection(self.repair_bot.config.db_path) as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM orders WHERE user_id BETWEEN ? AND ?", user_range)
+            orders = (await cursor.fetchone())[0]
+            cursor = await db.execute("SELECT COUNT(*) FROM reviews WHERE user_id BETWEEN ? AND ?", user_range)
+            reviews = (await cursor.fetchone())[0]
+        
+        # Заказ из меню и заказ по рекомендации ИИ, отзыв на первый заказ
+        expected = (("заказов", orders, users * 2), ("отзывов", reviews, users),
+                    ("рекомендаций ИИ", self.ai_recommendations, users))
+        return [f"{name}: {actual} вместо {wanted}" for name, actual, wanted in expected if actual != wanted]
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def print_report(harness: LoadTest, elapsed: float, args, problems: List[str]):
+    total_updates = sum(len(values) for values in harness.latencies.values())
+    print(f"\nПользователей: {args.users}, одновременно: {args.concurrency}, FSM: {args.fsm}, "
+          f"задержка ИИ: {args.ai_latency * 1000:.0f} мс")
+    print(f"Обновлений: {total_updates} за {elapsed:.2f} с -> {total_updates / elapsed:.0f} обновлений/с, "
+          f"ошибок: {harness.errors}\n")
+    
+    print(f"{'Обработчик':<36} {'кол-во':>7} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} "
+          f"{'запросов к БД':>14}")
+    for name, values in sorted(harness.latencies.items(), key=lambda item: -len(item[1])):
+        values = sorted(values)
+        queries = profiler.handler_stats.get(name)
+        queries_text = f"{queries['queries'] / queries['updates']:.1f} (max {queries['max_queries']})" if queries else "-"
+        print(f"{name:<36} {len(values):>7} {percentile(values, 50) * 1000:>9.2f} "
+              f"{percentile(values, 95) * 1000:>9.2f} {percentile(values, 99) * 1000:>9.2f} {queries_text:>14}")
+    
+    session: RecordingSession = harness.bot.session
+    print("\nИсходящие запросы к Telegram:")
+    for method, count in session.calls.most_common():
+        print(f"  {method:<28} {count}")
+    
+    summary = metrics.summary()
+    if summary['ai_streams']:
+        print(f"\nИИ: первый фрагмент ответа p50 {summary['ai_first_token_p50'] * 1000:.0f} мс, "
+              f"p95 {summary['ai_first_token_p95'] * 1000:.0f} мс; полный ответ "
+              f"p50 {summary['ai_p50'] * 1000:.0f} мс, p95 {summary['ai_p95'] * 1000:.0f} мс")
+    
+    full_scans = profiler.full_scan_statements()
+    if full_scans:
+        print("\nЗапросы с полным просмотром таблиц:")
+        for sql, tables in full_scans.items():
+            print(f"  [{', '.join(tables)}] {' '.join(sql.split())[:120]}")
+    
+    if profiler.violations:
+        print(f"\nПревышения бюджета запросов: {len(profiler.violations)}")
+        for violation in sorted(set(profiler.violations)):
+            print(f"  {violation}")
+    
+    if problems:
+        print("\n❌ Сценарии выполнены не полностью:")
+        for problem in problems:
+            print(f"  {problem}")
+    else:
+        print("\n✅ Все заказы, отзывы и рекомендации ИИ созданы")
+
+
+async def main(args):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Бот пишет bot.log и БД в текущий каталог
+        os.chdir(tmp_dir)
+        try:
+            with open("config.txt", "w", encoding="utf-8") as f:
+                f.write(
+                    f"BOT_TOKEN={BOT_TOKEN}\n"
+                    f"GEMINI_API_KEY=loadtest-stub-key-0123456789abcdef\n"
+                    f"DB_PATH=loadtest.db\n"
+                    f"LOG_LEVEL=WARNING\n"
+                    f"FSM_STORAGE={args.fsm}\n"
+                    f"AI_MAX_CONCURRENCY={args.concurrency}\n"
+                    f"METRICS_PORT=0\n"
+                    f"BACKUP_INTERVAL_HOURS=0\n"
+                    f"DB_SEED_DATA=true\n"
+                    f"DB_EXPLAIN_QUERIES={args.explain}\n"
+                    f"DB_QUERY_BUDGET_STRICT={args.strict_queries}\n"
+                )
+            
+            repair_bot = RepairBot("config.txt")
+            repair_bot.bot.session = RecordingSession()
+            repair_bot.ai_service.model = StubModel(args.ai_latency)
+            repair_bot.ai_service.is_available = True
+            
+            await repair_bot.on_startup()
+            harness = LoadTest(repair_bot)
+            harness.install_tracking()
+            try:
+                elapsed = await harness.run(args.users, args.concurrency)
+                problems = await harness.check_outcomes(args.users)
+            finally:
+                await repair_bot.on_shutdown()
+            
+            print_report(harness, elapsed, args, problems)
+        finally:
+            os.chdir(cwd)
+    
+    if problems:
+        return 1
+    return 1 if args.strict_queries and profiler.violations else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест диспетчера RepairBot")
+    parser.add_argument("--users", type=int, default=200, help="количество виртуальных пользователей")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременно активных пользователей")
+    parser.add_argument("--ai-latency", type=float, default=0.2, help="задержка заглушки ИИ, сек")
+    parser.add_argument("--fsm", choices=("sqlite", "memory"), default="sqlite", help="хранилище FSM")
+    parser.add_argument("--explain", action="store_true", help="собирать планы запросов (EXPLAIN QUERY PLAN)")
+    parser.add_argument("--strict-queries", action="store_true", help="превышение бюджета запросов - ошибка")
+    sys.exit(asyncio.run(main(parser.parse_args())))
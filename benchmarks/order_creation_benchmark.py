@@ -0,0 +1,75 @@
+"""
+Бенчмарк создания заказов: проверка и вставка по одной услуге против пакетной
+
+Запуск:
+    python -m benchmarks.order_creation_benchmark [заказов на замер]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from app.database.connection import DatabaseManager, get_db_connection
+from app.database.queries import DatabaseQueries
+
+USER_ID = 1
+
+
+async def legacy_create_order(db_path: str, service_ids):
+    """Прежняя реализация: SELECT и INSERT на каждую услугу"""
+    async with get_db_connection(db_path) as db:
+        async with db.execute("BEGIN TRANSACTION"):
+            cursor = await db.execute("""
+                INSERT INTO orders (user_id, master_id, address, order_date, order_time, total_cost)
+                VALUES (?, 1, 'ул. Тестовая', '2025-01-01', '10:00', 1000)
+            """, (USER_ID,))
+            order_id = cursor.lastrowid
+            for service_id in service_ids:
+                service_check = await db.execute("SELECT id FROM services WHERE id = ?", (service_id,))
+                if not await service_check.fetchone():
+                    raise ValueError(f"Услуга с ID {service_id} не существует")
+                await db.execute(
+                    "INSERT INTO order_services (order_id, service_id) VALUES (?, ?)",
+                    (order_id, service_id)
+                )
+            await db.commit()
+            return order_id
+
+
+async def measure(factory, count: int) -> float:
+    """Заказов в секунду"""
+    start = time.perf_counter()
+    for _ in range(count):
+        await factory()
+    return count / (time.perf_counter() - start)
+
+
+async def main(count: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        db_manager = DatabaseManager(db_path)
+        await db_manager.init_database()
+        await db_manager.populate_test_data()
+        await db_manager.open_pool()
+        db_queries = DatabaseQueries(db_path)
+        await db_queries.create_user(USER_ID, "Бенчмарк", "+79000000000", "ул. Тестовая")
+
+        print(f"{count} заказов на замер\n")
+        print(f"{'Услуг':>6} {'по одной, зак/с':>16} {'пакетно, зак/с':>16} {'ускорение':>10}")
+
+        for services_count in range(1, 11):
+            service_ids = list(range(1, services_count + 1))
+
+            legacy = await measure(lambda: legacy_create_order(db_path, service_ids), count)
+            batched = await measure(lambda: db_queries.create_order(
+                USER_ID, 1, "ул. Тестовая", "2025-01-01", "10:00", None, service_ids
+            ), count)
+
+            print(f"{services_count:>6} {legacy:>16.0f} {batched:>16.0f} {batched / legacy:>9.1f}x")
+
+        await db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300))
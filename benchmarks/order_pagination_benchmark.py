@@ -0,0 +1,101 @@
+"""
+Бенчмарк пагинации заказов: LIMIT/OFFSET против курсора по (created_at, id)
+
+Запуск:
+    python -m benchmarks.order_pagination_benchmark [количество заказов]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from app.database.connection import DatabaseManager, get_db_connection
+from app.database.queries import DatabaseQueries
+from app.utils.constants import LIMITS
+
+USER_ID = 1
+PAGE_SIZE = LIMITS['MAX_ORDERS_PER_PAGE']
+ITERATIONS = 50
+
+# Прежний запрос: GROUP_CONCAT по всем заказам пользователя, затем OFFSET
+OFFSET_QUERY = """
+    SELECT
+        o.id, o.order_date, o.order_time, o.total_cost, o.status,
+        m.name as master_name,
+        COALESCE(GROUP_CONCAT(s.name, ', '), 'Услуги не указаны') as services
+    FROM orders o
+    JOIN masters m ON o.master_id = m.id
+    LEFT JOIN order_services os ON o.id = os.order_id
+    LEFT JOIN services s ON os.service_id = s.id
+    WHERE o.user_id = ?
+    GROUP BY o.id, o.order_date, o.order_time, o.total_cost, o.status, m.name
+    ORDER BY o.created_at DESC
+    LIMIT ? OFFSET ?
+"""
+
+
+async def fill_orders(db_path: str, count: int):
+    async with get_db_connection(db_path) as db:
+        await db.execute(
+            "INSERT INTO users (user_id, name, phone, address) VALUES (?, 'Бенчмарк', '+79000000000', 'ул. Тестовая')",
+            (USER_ID,)
+        )
+        await db.executemany(
+            "INSERT INTO orders (user_id, master_id, address, order_date, order_time, total_cost, created_at) "
+            "VALUES (?, 1, 'ул. Тестовая', '2025-01-01', '10:00', 1000, datetime('2020-01-01', ? || ' minutes'))",
+            [(USER_ID, i) for i in range(count)]
+        )
+        await db.execute(
+            "INSERT INTO order_services (order_id, service_id) SELECT id, 1 + id % 10 FROM orders"
+        )
+        await db.commit()
+
+
+async def main(count: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        db_manager = DatabaseManager(db_path)
+        await db_manager.init_database()
+        await db_manager.populate_test_data()
+        await db_manager.open_pool()
+        await fill_orders(db_path, count)
+        db_queries = DatabaseQueries(db_path)
+
+        # Курсоры на нужные глубины: ID последнего заказа предыдущей страницы
+        depths = [p for p in (0, 10, 100, 1000, count // PAGE_SIZE - 1) if p * PAGE_SIZE < count]
+        async with get_db_connection(db_path) as db:
+            cursor = await db.execute(
+                "SELECT id FROM orders WHERE user_id = ? ORDER BY created_at DESC, id DESC", (USER_ID,)
+            )
+            ordered_ids = [row[0] for row in await cursor.fetchall()]
+
+        print(f"Заказов у пользователя: {count}, {ITERATIONS} повторов\n")
+        print(f"{'Страница':>10} {'OFFSET, мс':>12} {'курсор, мс':>12}")
+
+        for page in depths:
+            async with get_db_connection(db_path) as db:
+                start = time.perf_counter()
+                for _ in range(ITERATIONS):
+                    cursor = await db.execute(OFFSET_QUERY, (USER_ID, PAGE_SIZE + 1, page * PAGE_SIZE))
+                    await cursor.fetchall()
+                offset_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+
+            after_id = ordered_ids[page * PAGE_SIZE - 1] if page else None
+            start = time.perf_counter()
+            for _ in range(ITERATIONS):
+                await db_queries.get_user_orders(USER_ID, PAGE_SIZE + 1, after_id=after_id)
+            keyset_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+
+            print(f"{page + 1:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+        start = time.perf_counter()
+        for _ in range(ITERATIONS):
+            await db_queries.count_user_orders(USER_ID)
+        print(f"\ncount_user_orders: {(time.perf_counter() - start) * 1000 / ITERATIONS:.2f} мс")
+
+        await db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -0,0 +1,85 @@
+"""
+Бенчмарк поиска услуг: перебор в Python против FTS5 индекса
+
+Запуск:
+    python -m benchmarks.service_search_benchmark [количество услуг]
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.database.connection import DatabaseManager, get_db_connection
+from app.database.queries import DatabaseQueries
+
+QUERIES = ["диагностику", "замена диска", "видеокарты", "установка windows", "чистка", "роутер"]
+ITERATIONS = 50
+
+NOUNS = ["Диагностика", "Замена", "Ремонт", "Настройка", "Установка", "Чистка", "Восстановление", "Прошивка"]
+OBJECTS = ["компьютера", "жесткого диска", "видеокарты", "блока питания", "материнской платы",
+           "Windows", "роутера", "ноутбука", "монитора", "клавиатуры", "оперативной памяти"]
+
+
+def generate_services(count: int):
+    rng = random.Random(42)
+    for i in range(count):
+        name = f"{rng.choice(NOUNS)} {rng.choice(OBJECTS)} #{i}"
+        description = f"{rng.choice(NOUNS)} и профилактика: {rng.choice(OBJECTS)}, {rng.choice(OBJECTS)}"
+        yield (name, rng.randint(300, 5000), rng.randint(15, 240), description, None)
+
+
+def python_search(services, query: str):
+    """Прежний алгоритм обработчика: подстрока в названии или описании"""
+    query_lower = query.lower()
+    return [s for s in services
+            if query_lower in s['name'].lower() or query_lower in s['description'].lower()]
+
+
+async def main(count: int):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        db_manager = DatabaseManager(db_path)
+        await db_manager.init_database()
+        await db_manager.open_pool()
+
+        async with get_db_connection(db_path) as db:
+            await db.executemany(
+                "INSERT INTO services (name, price, duration_minutes, description, image_url) VALUES (?, ?, ?, ?, ?)",
+                list(generate_services(count))
+            )
+            await db.commit()
+
+        db_queries = DatabaseQueries(db_path)
+        print(f"Каталог: {count} услуг, {ITERATIONS} повторов на запрос\n")
+        print(f"{'Запрос':<20} {'Python, мс':>11} {'найдено':>8} {'FTS5, мс':>10} {'найдено':>8}")
+
+        for query in QUERIES:
+            start = time.perf_counter()
+            for _ in range(ITERATIONS):
+                # Прежний обработчик сначала загружал все услуги
+                services = []
+                page = 0
+                while True:
+                    chunk = await db_queries.get_services(page, 1000)
+                    if not chunk:
+                        break
+                    services.extend(chunk)
+                    page += 1
+                found_python = python_search(services, query)
+            python_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+
+            start = time.perf_counter()
+            for _ in range(ITERATIONS):
+                found_fts = await db_queries.search_services(query, limit=10)
+            fts_ms = (time.perf_counter() - start) * 1000 / ITERATIONS
+            fts_total = found_fts[0]['total_found'] if found_fts else 0
+
+            print(f"{query:<20} {python_ms:>11.2f} {len(found_python):>8} {fts_ms:>10.2f} {fts_total:>8}")
+
+        await db_manager.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000))
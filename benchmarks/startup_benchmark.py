@@ -0,0 +1,107 @@
+"""
+Бенчмарк запуска на большой БД: миграции по версии схемы и проверка здоровья
+
+Измеряет:
+- холодный запуск - все миграции на пустой БД;
+- прежний запуск - все шаги миграции на заполненной БД (user_version = 0);
+- полную проверку здоровья (quick_check и COUNT(*) по таблицам);
+- теплый запуск - схема актуальна, быстрая проверка здоровья.
+
+Теплый запуск должен укладываться в --max-warm-ms, иначе код возврата 1.
+
+Запуск:
+    python -m benchmarks.startup_benchmark [--orders 1000000] [--max-warm-ms 50]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from app.database.connection import DatabaseManager, get_db_connection
+
+WARM_RUNS = 20
+
+
+async def fill(db_path: str, orders: int):
+    """Пользователи, заказы и услуги заказов, сгенерированные в SQL"""
+    users = max(1, orders // 10)
+    async with get_db_connection(db_path) as db:
+        await db.execute(f'''
+            WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {users})
+            INSERT INTO users (user_id, name, phone, address, created_at)
+            SELECT 1000000 + n, 'Пользователь ' || n, '+79000000000', 'ул. Тестовая, ' || n,
+                   datetime('2020-01-01', (n % 1500) || ' days')
+            FROM seq
+        ''')
+        await db.execute(f'''
+            WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {orders})
+            INSERT INTO orders (user_id, master_id, address, order_date, order_time, total_cost,
+                                duration_minutes, status, created_at)
+            SELECT 1000000 + n % {users}, 1 + n % 5, 'ул. Тестовая', date('2020-01-01', (n % 1500) || ' days'),
+                   '10:00', 1000, 60, 'completed', datetime('2020-01-01', (n % 1500) || ' days')
+            FROM seq
+        ''')
+        await db.execute(
+            "INSERT INTO order_services (order_id, service_id, price) SELECT id, 1 + id % 15, 1000 FROM orders"
+        )
+        await db.commit()
+
+
+async def timed(coro) -> float:
+    start = time.perf_counter()
+    await coro
+    return (time.perf_counter() - start) * 1000
+
+
+async def warm_start(db_manager: DatabaseManager):
+    """То, что делает бот при запуске с актуальной схемой"""
+    await db_manager.init_database()
+    if not await db_manager.check_db_health():
+        raise RuntimeError("Проверка здоровья БД не пройдена")
+
+
+async def main(args) -> int:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        db_manager = DatabaseManager(db_path)
+
+        cold_ms = await timed(db_manager.init_database())
+        await db_manager.populate_test_data()
+
+        print(f"Заполнение БД: {args.orders} заказов...")
+        fill_ms = await timed(fill(db_path, args.orders))
+        size_mb = os.path.getsize(db_path) / 1024 / 1024
+        print(f"Заполнено за {fill_ms / 1000:.1f} с, размер БД {size_mb:.0f} МБ\n")
+
+        # Прежний запуск: каждый раз все шаги миграции
+        async with get_db_connection(db_path) as db:
+            await db.execute("PRAGMA user_version = 0")
+            await db.commit()
+        legacy_ms = await timed(db_manager.init_database())
+        deep_ms = await timed(db_manager.check_db_health(deep=True))
+
+        warm = [await timed(warm_start(db_manager)) for _ in range(WARM_RUNS)]
+        warm_ms = statistics.median(warm)
+
+        print(f"{'Этап':<48} {'мс':>10}")
+        print(f"{'Холодный запуск (все миграции, пустая БД)':<48} {cold_ms:>10.1f}")
+        print(f"{'Все шаги миграции на заполненной БД':<48} {legacy_ms:>10.1f}")
+        print(f"{'Полная проверка здоровья (deep)':<48} {deep_ms:>10.1f}")
+        print(f"{'Теплый запуск, медиана из ' + str(WARM_RUNS):<48} {warm_ms:>10.1f}")
+        print(f"{'Теплый запуск, максимум':<48} {max(warm):>10.1f}")
+
+        if warm_ms > args.max_warm_ms:
+            print(f"\n❌ Теплый запуск {warm_ms:.1f} мс > {args.max_warm_ms} мс")
+            return 1
+        print(f"\n✅ Теплый запуск укладывается в {args.max_warm_ms} мс")
+        return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время запуска на большой БД")
+    parser.add_argument("--orders", type=int, default=1000000, help="Количество заказов")
+    parser.add_argument("--max-warm-ms", type=float, default=50.0, help="Порог теплого запуска, мс")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,48 @@
+"""
+Тесты кэша ответов ИИ: запись из БД живет в памяти не дольше, чем в БД
+"""
+import time
+
+import pytest
+
+from app.database.connection import DatabaseManager, get_db_connection
+from app.services.ai_cache import AIResponseCache
+
+PROBLEM = "Компьютер сильно шумит и перегревается при работе в играх"
+CATALOG_HASH = "catalog-v1"
+RESULT = {'success': True, 'ai_response': "Нужна чистка [ID: 2]", 'recommended_services': [2], 'error': None}
+
+
+@pytest.fixture
+async def cache(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    await DatabaseManager(db_path).init_database()
+    return AIResponseCache(db_path, ttl=100)
+
+
+async def age_entries(db_path: str, seconds: float):
+    async with get_db_connection(db_path) as db:
+        await db.execute("UPDATE ai_response_cache SET created_at = ?", (time.time() - seconds,))
+        await db.commit()
+
+
+async def test_db_hit_keeps_remaining_lifetime(cache):
+    await cache.set(PROBLEM, CATALOG_HASH, RESULT)
+    await age_entries(cache.db_path, 90)
+    cache.memory.clear()
+
+    result = await cache.get(PROBLEM, CATALOG_HASH)
+    assert result['cached'] and result['recommended_services'] == [2]
+
+    key = cache.make_key(PROBLEM, CATALOG_HASH)
+    expires_at, _ = cache.memory._data[key]
+    assert 0 < expires_at - time.monotonic() <= 10.5
+
+
+async def test_expired_db_entry_is_a_miss(cache):
+    await cache.set(PROBLEM, CATALOG_HASH, RESULT)
+    await age_entries(cache.db_path, 101)
+    cache.memory.clear()
+
+    assert await cache.get(PROBLEM, CATALOG_HASH) is None
+    assert cache.misses == 1
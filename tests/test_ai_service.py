@@ -0,0 +1,196 @@
+"""
+Тесты неблокирующих вызовов ИИ: параллельные консультации, дедлайн,
+ограничение числа запросов и отмена
+"""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.handlers.ai_consultation import wait_while_in_state
+from app.services.ai_service import AIConsultationService
+
+PROBLEM = "Компьютер сильно шумит и перегревается при работе в играх"
+SERVICES = [
+    {'id': 1, 'name': 'Диагностика', 'price': 500, 'duration_minutes': 30, 'description': 'Поиск неисправности'},
+    {'id': 2, 'name': 'Чистка от пыли', 'price': 1000, 'duration_minutes': 60, 'description': 'Чистка и термопаста'},
+]
+
+
+class SlowModel:
+    """Заглушка Gemini: асинхронный ответ с задержкой и учет одновременных запросов"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        return SimpleNamespace(text="Нужна чистка системы охлаждения [ID: 2]")
+
+
+class BlockingModel:
+    """Заглушка синхронного клиента: generate_content блокирует поток"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return SimpleNamespace(text="Рекомендуется диагностика [ID: 1]")
+
+
+def make_service(model, request_timeout: float = 5.0, max_concurrency: int = 4) -> AIConsultationService:
+    service = AIConsultationService("test-key", request_timeout=request_timeout,
+                                    max_concurrency=max_concurrency, stream_responses=False)
+    service.model = model
+    service.is_available = True
+    return service
+
+
+async def max_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Наибольшая задержка тиков event loop, пока не установлен stop"""
+    lag = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(lag, time.perf_counter() - started - interval)
+    return lag
+
+
+async def run_with_lag_probe(coro):
+    """Результат coro и наибольшая задержка event loop за время выполнения"""
+    stop = asyncio.Event()
+    probe = asyncio.create_task(max_loop_lag(stop))
+    try:
+        result = await coro
+    finally:
+        stop.set()
+    return result, await probe
+
+
+@pytest.mark.parametrize("model", [SlowModel(0.3), BlockingModel(0.3)], ids=["async", "sync"])
+async def test_concurrent_consultations_keep_loop_responsive(model):
+    service = make_service(model, max_concurrency=8)
+
+    started = time.perf_counter()
+    results, lag = await run_with_lag_probe(asyncio.gather(
+        *(service.process_consultation(f"{PROBLEM} #{i}", SERVICES) for i in range(8))
+    ))
+    elapsed = time.perf_counter() - started
+
+    assert all(result['success'] for result in results)
+    assert all(not result.get('fallback') for result in results)
+    # Запросы выполнялись параллельно, а loop не замирал на время ответа модели
+    assert elapsed < 8 * 0.3 / 2
+    assert lag < 0.1
+
+
+async def test_deadline_falls_back_to_keywords():
+    service = make_service(SlowModel(2.0), request_timeout=0.1)
+
+    ai_result = await service.get_ai_recommendation(PROBLEM, SERVICES)
+    assert not ai_result['success']
+    assert 'время' in ai_result['error']
+
+    started = time.perf_counter()
+    result = await service.process_consultation(PROBLEM, SERVICES)
+    assert time.perf_counter() - started < 1.0
+    assert result['success'] and result['fallback']
+    assert result['recommended_services']
+
+
+async def test_concurrency_cap():
+    model = SlowModel(0.05)
+    service = make_service(model, max_concurrency=2)
+
+    await asyncio.gather(*(service.process_consultation(f"{PROBLEM} #{i}", SERVICES) for i in range(6)))
+
+    assert model.calls == 6
+    assert model.max_in_flight == 2
+
+
+async def test_concurrency_cap_holds_for_timed_out_threads():
+    """Поток синхронного клиента после дедлайна занимает слот до своего завершения"""
+    model = BlockingModel(0.5)
+    service = make_service(model, request_timeout=0.1, max_concurrency=2)
+
+    for _ in range(3):
+        results = await asyncio.gather(
+            *(service.process_consultation(f"{PROBLEM} #{i}", SERVICES) for i in range(4))
+        )
+        assert all(result['fallback'] for result in results)
+
+    assert model.max_in_flight == 2
+    # Слоты освобождаются, когда потоки завершаются
+    await asyncio.sleep(0.6)
+    assert model.in_flight == 0
+    assert service._semaphore._value == 2
+
+
+async def test_cancel_consultation():
+    model = SlowModel(5.0)
+    service = make_service(model)
+
+    task = service.start_consultation(1, PROBLEM, SERVICES)
+    await asyncio.sleep(0.05)
+    assert service.cancel_consultation(1)
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert model.in_flight == 0
+    assert not service.cancel_consultation(1)
+
+
+async def test_new_consultation_cancels_previous():
+    service = make_service(SlowModel(5.0))
+
+    first = service.start_consultation(1, PROBLEM, SERVICES)
+    await asyncio.sleep(0.05)
+    second = service.start_consultation(1, PROBLEM, SERVICES)
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+    assert not second.done()
+    assert service.cancel_consultation(1)
+    with pytest.raises(asyncio.CancelledError):
+        await second
+
+
+async def test_leaving_state_cancels_consultation():
+    service = make_service(SlowModel(5.0))
+    expected = SimpleNamespace(state="AIConsultationStates:waiting_for_problem")
+    current = {'state': expected.state}
+
+    async def get_state():
+        return current['state']
+
+    task = service.start_consultation(1, PROBLEM, SERVICES)
+    waiter = asyncio.create_task(
+        wait_while_in_state(task, SimpleNamespace(get_state=get_state), expected, poll_interval=0.02)
+    )
+    await asyncio.sleep(0.05)
+    current['state'] = None  # пользователь вышел в главное меню
+
+    assert await asyncio.wait_for(waiter, 1.0) is None
+    with pytest.raises(asyncio.CancelledError):
+        await task
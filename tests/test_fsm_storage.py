@@ -0,0 +1,59 @@
+"""
+Тесты хранилища FSM: ошибка чтения не должна затирать сессию на диске
+"""
+from contextlib import asynccontextmanager
+
+import aiosqlite
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+from app.database import fsm_storage
+from app.database.connection import DatabaseManager
+from app.database.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+
+@asynccontextmanager
+async def locked_db(db_path: str = ""):
+    raise aiosqlite.OperationalError("database is locked")
+    yield
+
+
+async def open_storage(db_path: str) -> SQLiteStorage:
+    await DatabaseManager(str(db_path)).init_database()
+    storage = SQLiteStorage(str(db_path), flush_interval=3600)
+    await storage.open()
+    return storage
+
+
+async def test_missing_session_is_empty(tmp_path):
+    storage = await open_storage(tmp_path / "fsm.db")
+    try:
+        assert await storage.get_state(KEY) is None
+        assert await storage.get_data(KEY) == {}
+        assert storage.disk_reads == 1
+    finally:
+        await storage.close()
+
+
+async def test_read_error_does_not_overwrite_session(tmp_path, monkeypatch):
+    db_path = tmp_path / "fsm.db"
+    storage = await open_storage(db_path)
+    await storage.set_state(KEY, "OrderStates:selecting_date")
+    await storage.update_data(KEY, {'selected_services': [1, 3]})
+    await storage.close()
+
+    # Новый процесс: записи нет в памяти, а чтение с диска временно падает
+    storage = await open_storage(db_path)
+    monkeypatch.setattr(fsm_storage, "get_db_connection", locked_db)
+    with pytest.raises(RuntimeError):
+        await storage.set_state(KEY, None)
+    assert await storage.flush()
+
+    monkeypatch.undo()
+    try:
+        assert await storage.get_state(KEY) == "OrderStates:selecting_date"
+        assert await storage.get_data(KEY) == {'selected_services': [1, 3]}
+    finally:
+        await storage.close()
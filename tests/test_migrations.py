@@ -0,0 +1,162 @@
+"""
+Тесты миграций по PRAGMA user_version: теплый запуск и повтор создания FTS5
+"""
+from contextlib import asynccontextmanager
+from typing import List
+
+import aiosqlite
+import pytest
+
+from app.database import connection, fsm_storage
+from app.database.connection import DatabaseManager, get_db_connection
+from app.database.fsm_storage import SQLiteStorage
+from app.database.queries import DatabaseQueries
+
+# BEGIN IMMEDIATE - транзакция шага миграции
+DDL_PREFIXES = ("CREATE", "ALTER", "DROP", "BEGIN IMMEDIATE", "SAVEPOINT", "PRAGMA USER_VERSION =")
+# Запросы, берущие блокировку записи
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE", "REPLACE", "BEGIN")
+
+
+@pytest.fixture
+async def db_manager(tmp_path):
+    manager = DatabaseManager(str(tmp_path / "bot.db"))
+    await manager.init_database()
+    return manager
+
+
+@pytest.fixture
+def traced_statements(monkeypatch) -> List[str]:
+    """SQL всех соединений DatabaseManager и SQLiteStorage, открытых после подключения фикстуры"""
+    statements: List[str] = []
+    original = connection.get_db_connection
+
+    @asynccontextmanager
+    async def traced(db_path: str = "repair_bot.db"):
+        async with original(db_path) as db:
+            await db.set_trace_callback(lambda sql: statements.append(" ".join(sql.split())))
+            yield db
+
+    monkeypatch.setattr(connection, "get_db_connection", traced)
+    monkeypatch.setattr(fsm_storage, "get_db_connection", traced)
+    return statements
+
+
+async def user_version(db_path: str) -> int:
+    async with get_db_connection(db_path) as db:
+        cursor = await db.execute("PRAGMA user_version")
+        return (await cursor.fetchone())[0]
+
+
+async def test_fresh_database_reaches_current_version(db_manager):
+    assert await user_version(db_manager.db_path) == db_manager.schema_version
+    assert await db_manager.check_db_health(deep=True)
+
+
+async def test_warm_start_runs_no_ddl(db_manager, traced_statements):
+    await db_manager.init_database()
+    init_statements = len(traced_statements)
+    storage = SQLiteStorage(db_manager.db_path, flush_interval=3600)
+    await storage.open()
+    await storage.close()
+
+    assert init_statements, "трассировка SQL не сработала"
+    assert len(traced_statements) > init_statements, "трассировка SQLiteStorage не сработала"
+    ddl = [sql for sql in traced_statements if sql.upper().startswith(DDL_PREFIXES)]
+    assert ddl == []
+    writes = [sql for sql in traced_statements[:init_statements] if sql.upper().startswith(WRITE_PREFIXES)]
+    assert writes == []
+    assert init_statements <= 5, traced_statements
+
+
+async def test_stale_activity_is_pruned_on_start(db_manager):
+    async with get_db_connection(db_manager.db_path) as db:
+        await db.executemany(
+            "INSERT INTO stats_daily_users (day, user_id) VALUES (DATE('now', ?), 1)",
+            [("-40 days",), ("-1 days",)]
+        )
+        await db.commit()
+
+    await db_manager.init_database()
+
+    async with get_db_connection(db_manager.db_path) as db:
+        cursor = await db.execute("SELECT day >= DATE('now', '-30 days') FROM stats_daily_users")
+        assert [row[0] for row in await cursor.fetchall()] == [1]
+
+
+async def test_missing_fts_index_is_retried(db_manager):
+    db_path = db_manager.db_path
+    await db_manager.populate_test_data()
+
+    # БД, мигрированная без FTS5: версия актуальна, индекса нет
+    async with get_db_connection(db_path) as db:
+        for trigger in ("insert", "delete", "update"):
+            await db.execute(f"DROP TRIGGER trg_services_{trigger}_fts")
+        await db.execute("DROP TABLE services_fts")
+        await db.commit()
+
+    await db_manager.init_database()
+
+    async with get_db_connection(db_path) as db:
+        cursor = await db.execute("SELECT COUNT(*) FROM services_fts")
+        assert (await cursor.fetchone())[0] > 0
+    assert await user_version(db_path) == db_manager.schema_version
+    assert await DatabaseQueries(db_path).search_services("диагностика")
+
+
+async def test_failed_fts_step_keeps_migration_going(tmp_path, monkeypatch):
+    """Ошибка DDL индекса откатывает только его, версия схемы продвигается"""
+    original = DatabaseManager._create_services_fts
+
+    async def broken_fts(self, db: aiosqlite.Connection) -> bool:
+        await db.execute("SAVEPOINT services_fts")
+        await db.execute("CREATE TABLE services_fts_partial (x)")
+        await db.execute("ROLLBACK TO services_fts")
+        await db.execute("RELEASE services_fts")
+        return False
+
+    monkeypatch.setattr(DatabaseManager, "_create_services_fts", broken_fts)
+    manager = DatabaseManager(str(tmp_path / "bot.db"))
+    await manager.init_database()
+    assert await user_version(manager.db_path) == manager.schema_version
+
+    # Следующий запуск с рабочим FTS5 создает индекс
+    monkeypatch.setattr(DatabaseManager, "_create_services_fts", original)
+    await manager.init_database()
+    async with get_db_connection(manager.db_path) as db:
+        cursor = await db.execute(
+            "SELECT name FROM sqlite_master WHERE name IN ('services_fts', 'services_fts_partial')"
+        )
+        assert [row[0] for row in await cursor.fetchall()] == ['services_fts']
+
+
+async def test_raw_text_fts_index_is_rebuilt(db_manager):
+    """Индекс по исходному тексту с «ё» пересоздается по нормализованному"""
+    db_path = db_manager.db_path
+    steps = [description for description, _ in db_manager._migrations()]
+    async with get_db_connection(db_path) as db:
+        for trigger in ("insert", "delete", "update"):
+            await db.execute(f"DROP TRIGGER trg_services_{trigger}_fts")
+        await db.execute("DROP TABLE services_fts")
+        await db.execute('''
+            CREATE VIRTUAL TABLE services_fts USING fts5(
+                name, description, content='services', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+        await db.execute(
+            "INSERT INTO services (name, price, duration_minutes, description) "
+            "VALUES ('Замена щёток вентилятора', 900, 40, '')"
+        )
+        await db.execute("INSERT INTO services_fts (services_fts) VALUES ('rebuild')")
+        # Версия до шага пересоздания индекса
+        await db.execute(f"PRAGMA user_version = {steps.index('Поиск услуг без учета «ё»')}")
+        await db.commit()
+
+    queries = DatabaseQueries(db_path)
+    assert await queries.search_services("щеток") == []
+
+    await db_manager.init_database()
+
+    assert await user_version(db_path) == db_manager.schema_version
+    results = await queries.search_services("щеток")
+    assert [service['name'] for service in results] == ['Замена щёток вентилятора']
@@ -0,0 +1,77 @@
+"""
+Тесты поиска услуг: FTS5 и запасной поиск без FTS5 без учета регистра и «ё»
+"""
+import pytest
+
+from app.database.connection import DatabaseManager, get_db_connection
+from app.database.queries import DatabaseQueries
+
+# «Удаление» встречается только с заглавной буквы (в названии услуги)
+QUERIES = ("удаление", "УДАЛЕНИЕ ВИРУСОВ", "Удаление вирусов")
+
+
+@pytest.fixture
+async def db_queries(tmp_path):
+    db_path = str(tmp_path / "bot.db")
+    manager = DatabaseManager(db_path)
+    await manager.init_database()
+    await manager.populate_test_data()
+    return DatabaseQueries(db_path)
+
+
+async def drop_fts(db_path: str):
+    """Как в сборке SQLite без FTS5: индекса нет, MATCH падает"""
+    async with get_db_connection(db_path) as db:
+        for trigger in ("insert", "delete", "update"):
+            await db.execute(f"DROP TRIGGER trg_services_{trigger}_fts")
+        await db.execute("DROP TABLE services_fts")
+        await db.commit()
+
+
+@pytest.mark.parametrize("fts", [True, False], ids=["fts5", "fallback"])
+@pytest.mark.parametrize("query", QUERIES)
+async def test_search_ignores_case(db_queries, fts, query):
+    if not fts:
+        await drop_fts(db_queries.db_path)
+
+    results = await db_queries.search_services(query)
+
+    assert [service['name'] for service in results] == ['Удаление вирусов']
+    assert results[0]['total_found'] == 1
+
+
+async def test_fallback_ignores_yo(db_queries):
+    async with get_db_connection(db_queries.db_path) as db:
+        await db.execute(
+            "INSERT INTO services (name, price, duration_minutes, description) "
+            "VALUES ('Замена щёток вентилятора', 900, 40, 'Щётки и подшипники')"
+        )
+        await db.commit()
+    await drop_fts(db_queries.db_path)
+
+    results = await db_queries.search_services("щетки")
+    assert [service['name'] for service in results] == ['Замена щёток вентилятора']
+
+
+async def test_fallback_limit_and_total(db_queries):
+    await drop_fts(db_queries.db_path)
+    everything = await db_queries.search_services("ремонт", limit=100)
+
+    limited = await db_queries.search_services("ремонт", limit=1)
+    assert len(limited) == 1
+    assert limited[0]['total_found'] == len(everything)
+
+
+@pytest.mark.parametrize("query", ("щёток", "щеток", "ЩЁТОК", "щетки"))
+async def test_fts_ignores_yo(db_queries, caplog, query):
+    async with get_db_connection(db_queries.db_path) as db:
+        await db.execute(
+            "INSERT INTO services (name, price, duration_minutes, description) "
+            "VALUES ('Замена щёток вентилятора', 900, 40, 'Щётки и подшипники')"
+        )
+        await db.commit()
+
+    results = await db_queries.search_services(query)
+
+    assert [service['name'] for service in results] == ['Замена щёток вентилятора']
+    assert "FTS5 недоступен" not in caplog.text